@@ -0,0 +1,16 @@
+from enum import Enum
+
+
+class RenderBackend(Enum):
+    """Simple enum class choosing how the Ascii Generator Classes draw the text onto the final image
+
+    Attributes
+    ----------
+    ATLAS
+        rasterizes every gradient character once and builds the image out of the cached glyphs (fast)
+    DRAW
+        draws the text character by character with PIL (original behaviour, slow on big images)
+    """
+
+    ATLAS = 0
+    DRAW = 1
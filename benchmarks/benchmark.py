@@ -0,0 +1,336 @@
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import cv2 as cv
+import numpy as np
+from PIL import Image
+from moviepy import ImageSequenceClip, VideoFileClip
+from helper import Helper
+from Effect import Effect
+from RenderBackend import RenderBackend
+from generators.AsciiRenderer import AsciiRenderer
+from generators.CMDAsciiGenerator import CMDAsciiGenerator
+from generators.FrameSource import SyntheticSource
+from generators.ImageAsciiGenerator import ImageAsciiGenerator
+from generators.MarkupRenderer import MarkupRenderer
+from generators.TiledImageConverter import TiledImageConverter
+
+
+class BenchmarkSuite:
+    """Class timing the conversion hot paths on generated inputs.
+
+    Every input is generated from a fixed seed, so runs on different machines or commits convert the same pixels.
+    Each case is run once to warm up (fonts, atlases and lookup tables), then timed several times and finally run
+    once more under tracemalloc to find its peak memory. Cases producing a file (the document cases and the PNG they are
+    compared with) also report its size. Results are written as JSON and can be compared with an
+    earlier run to find regressions. Before the tiled cases are timed, their output is checked to be the same as the
+    conversion of the whole image, the run stops with an error when it is not.
+
+    Attributes
+    ----------
+    resolutions: list[tuple]
+        (width, height) of the generated images and videos
+    repeat: int
+        amount of timed runs of every case
+    font_path: str
+        monospace font used by the image, video and cam cases
+    video_frames: int
+        amount of frames of the generated videos
+    name_filter: str
+        only cases whose name contains this text are run, None runs all of them
+
+    Methods
+    -------
+    run()
+        runs all the cases and returns the results
+    generate_image(width: int, height: int, seed=0)
+        returns deterministic BGR test image
+    compare(results: dict, baseline: dict, threshold=0.1)
+        returns the cases that got slower than the baseline
+    """
+
+    # styles the documents are benchmarked with, from one color to a color for every cell
+    document_styles = {"plain": {}, "contrast": {"use_contrast": True},
+                       "original_color": {"effect": Effect.ORIGINAL_COLOR}}
+    # styles the strip by strip conversion is checked and benchmarked with
+    tiled_styles = {"plain": {}, "rainbow_radial": {"effect": Effect.RAINBOW_RADIAL},
+                    "original_color": {"effect": Effect.ORIGINAL_COLOR}, "match_shapes": {"match_shapes": True}}
+
+    def __init__(self, resolutions=((320, 240), (1280, 720), (1920, 1080)), repeat=5, font_path="lucon.ttf",
+                 video_frames=30, name_filter=None):
+        """BenchmarkSuite constructor
+
+        :param resolutions: (width, height) of the generated images and videos
+        :param repeat: amount of timed runs of every case
+        :param font_path: monospace font used by the image, video and cam cases
+        :param video_frames: amount of frames of the generated videos
+        :param name_filter: only runs the cases whose name contains this text
+        """
+        self.resolutions = [tuple(resolution) for resolution in resolutions]
+        self.repeat = repeat
+        self.font_path = font_path
+        self.video_frames = video_frames
+        self.name_filter = name_filter
+
+    def run(self) -> dict:
+        """Runs all the cases for every resolution
+
+        :return: dict: information about the machine and a list with the timings and peak memory of every case
+        """
+        results = []
+        for width, height in self.resolutions:
+            image = self.generate_image(width, height)
+            hsv = cv.cvtColor(image, cv.COLOR_BGR2HSV)
+            for name, case in self.__get_image_cases(image, hsv):
+                results.append(self.__measure(name, (width, height), case))
+            with tempfile.TemporaryDirectory() as directory:
+                frames = self.__decode_video(self.__write_video(directory, width, height))
+                for name, case in self.__get_frame_cases(frames, width, height):
+                    results.append(self.__measure(name, (width, height), case, frames=len(frames)))
+                for name, case in self.__get_tiled_cases(directory, width, height):
+                    results.append(self.__measure(name, (width, height), case))
+        return {"machine": self.__get_machine_info(), "results": [result for result in results if result is not None]}
+
+    @staticmethod
+    def generate_image(width: int, height: int, seed=0) -> np.array:
+        """Returns an image with smooth gradients, shapes and noise, always the same for the same arguments
+
+        :param width: width of the image
+        :param height: height of the image
+        :param seed: seed of the noise and the placement of the shapes
+        :return: np.array: BGR image
+        """
+        rng = np.random.default_rng(seed)
+        rows, cols = np.mgrid[0:height, 0:width]
+        image = np.stack([cols * 255 / max(1, width - 1), rows * 255 / max(1, height - 1),
+                          128 + 127 * np.sin((rows + cols) / 40)], axis=-1)
+        image += rng.normal(0, 12, size=image.shape)
+        image = np.clip(image, 0, 255).astype(np.uint8)
+        for _ in range(12):
+            center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+            radius = int(rng.integers(max(2, height // 40), max(3, height // 6)))
+            color = tuple(int(value) for value in rng.integers(0, 256, size=3))
+            cv.circle(image, center, radius, color, thickness=-1)
+        return image
+
+    @staticmethod
+    def compare(results: dict, baseline: dict, threshold=0.1) -> list:
+        """Compares the mean times of two runs
+
+        :param results: results of the new run
+        :param baseline: results of the run to compare with
+        :param threshold: relative slowdown above which a case counts as a regression
+        :return: list[tuple]: (name, resolution, baseline ms, new ms, ratio) of every case slower than the threshold
+        """
+        old = {(result["name"], tuple(result["resolution"])): result for result in baseline["results"]}
+        regressions = []
+        for result in results["results"]:
+            previous = old.get((result["name"], tuple(result["resolution"])))
+            if previous is None or previous["mean_ms"] <= 0:
+                continue
+            ratio = result["mean_ms"] / previous["mean_ms"]
+            if ratio > 1 + threshold:
+                regressions.append((result["name"], tuple(result["resolution"]), previous["mean_ms"],
+                                    result["mean_ms"], ratio))
+        return regressions
+
+    def __get_image_cases(self, image: np.array, hsv: np.array):
+        # yields (name, function) of the single image cases
+        yield "cmd", lambda: CMDAsciiGenerator(image).convert()
+        # getting the cells of an 8 pixel font out of the loaded image, before and after scaling down comes first
+        grid_size = (image.shape[1] // 8, image.shape[0] // 8)
+        yield "preprocess_hsv_full", lambda: cv.resize(cv.cvtColor(image, cv.COLOR_BGR2HSV), grid_size)
+        yield "preprocess_area_value", lambda: Helper.downscale_image(image, grid_size, color=False)
+        yield "preprocess_area_hsv", lambda: Helper.downscale_image(image, grid_size)
+        yield "image_plain", lambda: self.__convert_image(hsv)
+        yield "image_contrast", lambda: self.__convert_image(hsv, use_contrast=True)
+        yield "image_plain_draw", lambda: self.__convert_image(hsv, backend=RenderBackend.DRAW)
+        yield "image_match_shapes", lambda: self.__convert_image(hsv, match_shapes=True)
+        for effect in Effect:
+            if effect == Effect.VIDEO_RAINBOW_GRADUAL:
+                continue
+            yield f'image_{effect.name.lower()}', lambda effect=effect: self.__convert_image(hsv, effect=effect)
+        # the same text saved as PNG, HTML and SVG, sizes and times of the documents are compared with the PNG
+        for style, settings in self.document_styles.items():
+            yield f'png_{style}', lambda settings=settings: self.__save_png(hsv, **settings)
+            yield f'html_{style}', lambda settings=settings: self.__save_document(hsv, "html", **settings)
+            yield f'svg_{style}', lambda settings=settings: self.__save_document(hsv, "svg", **settings)
+
+    def __get_frame_cases(self, frames: list, width: int, height: int):
+        # yields (name, function) of the cases converting many frames, the timings are divided by the frame count
+        def render_video(**settings):
+            renderer = AsciiRenderer(font_path=self.font_path, **settings)
+            for frame in frames:
+                renderer.render(frame)
+
+        def render_gradual():
+            renderer = AsciiRenderer(font_path=self.font_path, background_color=(0, 0, 0))
+            for i, frame in enumerate(frames):
+                # same color change over time as VideoAsciiGenerator uses for the gradual effect
+                fg_color = tuple(Helper.get_hue_lookup()[(2 * i) % 181].tolist())
+                renderer.render(frame, foreground_color=fg_color)
+
+        def run_cam():
+            # same work CamToAscii does for every shown image, without waiting for the camera
+            source = SyntheticSource(width, height, fps=None, frames=len(frames))
+            renderer = AsciiRenderer(font_path=self.font_path)
+            frame = source.read()
+            while frame is not None:
+                cv.cvtColor(renderer.render(frame), cv.COLOR_BGR2RGB)
+                frame = source.read()
+
+        yield "video_frame", lambda: render_video()
+        yield "video_frame_incremental", lambda: render_video(incremental=True)
+        yield "video_frame_rainbow_radial", lambda: render_video(effect=Effect.RAINBOW_RADIAL)
+        yield "video_frame_original_color", lambda: render_video(effect=Effect.ORIGINAL_COLOR)
+        yield "video_frame_rainbow_gradual", render_gradual
+        yield "cam_frame", run_cam
+
+    def __get_tiled_cases(self, directory: str, width: int, height: int):
+        # yields (name, function) of the strip by strip conversion of image files. The size is not a multiple of the
+        # font, so the cells cut off at the edges are checked as well
+        image = self.generate_image(width + 5, height + 3, seed=2)
+        paths = [os.path.join(directory, "benchmark.png"), os.path.join(directory, "benchmark.jpg")]
+        for path in paths:
+            cv.imwrite(path, image)
+        output_path = os.path.join(directory, "benchmark_tiled.png")
+        for style, settings in self.tiled_styles.items():
+            if not self.__is_selected(f'tiled_{style}'):
+                continue
+            for path in paths:
+                self.__check_tiled(path, output_path, **settings)
+            yield f'tiled_{style}', lambda settings=settings: self.__convert_tiled(paths[0], output_path, **settings)
+
+    def __check_tiled(self, path: str, output_path: str, **settings):
+        whole = np.asarray(ImageAsciiGenerator.from_file(path, font_path=self.font_path, **settings).convert())
+        # strips of a few rows, so the check crosses many of their edges
+        tiled = self.__convert_tiled(path, output_path, strip_rows=3, **settings)
+        tiled = np.asarray(Image.open(io.BytesIO(tiled)))
+        if tiled.shape != whole.shape or not np.array_equal(tiled, whole):
+            raise RuntimeError(f'The tiled conversion of {os.path.basename(path)} with {settings} differs from the '
+                               f'conversion of the whole image')
+
+    def __convert_tiled(self, path: str, output_path: str, **settings) -> bytes:
+        TiledImageConverter(path, font_path=self.font_path, show_progress=False, **settings).convert(output_path)
+        with open(output_path, "rb") as file:
+            return file.read()
+
+    def __convert_image(self, hsv: np.array, **settings):
+        return ImageAsciiGenerator(hsv, font_path=self.font_path, **settings).convert()
+
+    def __save_png(self, hsv: np.array, **settings) -> bytes:
+        file = io.BytesIO()
+        self.__convert_image(hsv, **settings).save(file, format="PNG")
+        return file.getvalue()
+
+    def __save_document(self, hsv: np.array, document_format: str, **settings) -> bytes:
+        generator = ImageAsciiGenerator(hsv, font_path=self.font_path, **settings)
+        index_grid, colors, background_color = generator.get_text_cells(hsv)
+        renderer = MarkupRenderer(generator.ascii_gradient, font_size=generator.text_size)
+        if document_format == "html":
+            return renderer.render_html(index_grid, colors, background_color).encode("utf-8")
+        return renderer.render_svg(index_grid, colors, background_color).encode("utf-8")
+
+    def __measure(self, name: str, resolution: tuple, case, frames=1):
+        if not self.__is_selected(name):
+            return None
+        print(f'{name} {resolution[0]}x{resolution[1]}', end=" ", flush=True)
+        output = case()
+        times = []
+        for _ in range(self.repeat):
+            start_time = time.perf_counter()
+            case()
+            times.append((time.perf_counter() - start_time) * 1000 / frames)
+
+        # tracemalloc slows the code down, so the memory is measured in a separate run
+        tracemalloc.start()
+        try:
+            case()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        result = {"name": name, "resolution": list(resolution), "frames": frames, "repeat": self.repeat,
+                  "mean_ms": statistics.mean(times), "median_ms": statistics.median(times), "min_ms": min(times),
+                  "max_ms": max(times), "peak_memory_mb": peak / 2 ** 20}
+        if isinstance(output, bytes):
+            result["output_bytes"] = len(output)
+            print(f'{statistics.mean(times):.2f} ms, {len(output)} bytes')
+        else:
+            print(f'{statistics.mean(times):.2f} ms')
+        return result
+
+    def __is_selected(self, name: str) -> bool:
+        return self.name_filter is None or self.name_filter in name
+
+    def __write_video(self, directory: str, width: int, height: int) -> str:
+        # short video with moving content, encoded the same way the app saves videos
+        base = self.generate_image(width, height, seed=1)
+        frames = [cv.cvtColor(np.roll(base, 4 * i, axis=1), cv.COLOR_BGR2RGB) for i in range(self.video_frames)]
+        path = os.path.join(directory, "benchmark.mp4")
+        ImageSequenceClip(frames, fps=30).write_videofile(path, logger=None)
+        return path
+
+    def __decode_video(self, path: str) -> list:
+        # frames are decoded before timing, so the cases only measure the conversion
+        video = VideoFileClip(path)
+        try:
+            return [cv.cvtColor(frame, cv.COLOR_BGR2HSV) for frame in video.iter_frames()][:self.video_frames]
+        finally:
+            video.close()
+
+    @staticmethod
+    def __get_machine_info() -> dict:
+        try:
+            commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {"date": datetime.now(timezone.utc).isoformat(timespec="seconds"), "commit": commit,
+                "python": platform.python_version(), "numpy": np.__version__, "opencv": cv.__version__,
+                "platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count()}
+
+
+def parse_resolution(text: str) -> tuple:
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the conversion hot paths on generated images and videos")
+    parser.add_argument("--resolutions", nargs="+", type=parse_resolution, default=["320x240", "1280x720", "1920x1080"],
+                        help="WIDTHxHEIGHT of the generated inputs | 320x240 1280x720 1920x1080")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs of every case | 5")
+    parser.add_argument("--frames", type=int, default=30, help="frames of the generated videos | 30")
+    parser.add_argument("--font", default="lucon.ttf", help="monospace font | lucon.ttf")
+    parser.add_argument("--filter", help="only runs the cases with this text in the name")
+    parser.add_argument("--output", default="benchmark_results.json", help="file to write the results into")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown counted as a regression | 0.1")
+    args = parser.parse_args()
+    resolutions = [parse_resolution(r) if isinstance(r, str) else r for r in args.resolutions]
+
+    suite = BenchmarkSuite(resolutions=resolutions, repeat=args.repeat, font_path=args.font,
+                           video_frames=args.frames, name_filter=args.filter)
+    results = suite.run()
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = BenchmarkSuite.compare(results, baseline, args.threshold)
+        for name, resolution, old_ms, new_ms, ratio in regressions:
+            print(f'REGRESSION {name} {resolution[0]}x{resolution[1]}: {old_ms:.2f} ms -> {new_ms:.2f} ms '
+                  f'({ratio:.2f}x)')
+        if regressions:
+            exit(1)
+        print("No regressions")
@@ -0,0 +1,112 @@
+import numpy as np
+
+
+class AnsiFrameEncoder:
+    """Class turning grids of characters and colors into ANSI escape sequences for a terminal.
+
+    Only the cells that changed since the previous frame are written. The encoder remembers where the cursor is and
+    which color is set, so cursor moves are only written when the next changed cell is not right after the previous
+    one, and colors only when they differ from the one already set. Short runs of unchanged cells in the same color are
+    written again instead of jumping over them when that is shorter than the cursor move.
+
+    Attributes
+    ----------
+    gradient: str
+        characters the indexes of the grids point to
+    color_step: int
+        colors are rounded down to multiples of this, so noise in the source does not make every cell change
+    foreground_color: tuple[3]
+        RGB color of all the text when the frames come without colors, None keeps the color of the terminal
+
+    Methods
+    -------
+    encode(index_grid: np.array, colors=None)
+        returns the escape sequences turning the previous frame into this one
+    reset()
+        forgets the previous frame, the next one is written whole
+    """
+
+    def __init__(self, gradient: str, color_step=1, foreground_color=None):
+        """AnsiFrameEncoder constructor
+
+        :param gradient: characters the indexes of the grids point to
+        :param color_step: colors are rounded down to multiples of this (1 keeps them exact)
+        :param foreground_color: RGB color of all the text when encode gets no colors
+        """
+        self.gradient = gradient
+        self.color_step = color_step
+        self.foreground_color = foreground_color
+        self.__chars = list(gradient)
+        self.__char_bytes = [len(char.encode("utf-8")) for char in gradient]
+        self.reset()
+
+    def reset(self):
+        """Forgets the previous frame, cursor position and color. The next frame clears the screen"""
+        self.__previous_index = None
+        self.__previous_colors = None
+        self.__cursor = None
+        self.__pen = None
+
+    def encode(self, index_grid: np.array, colors=None) -> str:
+        """Returns the text to write to the terminal to show this frame
+
+        :param index_grid: 2D array with the index of the gradient character of every cell
+        :param colors: uint8 array of shape (rows, cols, 3) with the RGB color of every cell, None writes no colors
+        :return: str: escape sequences and characters, empty when nothing changed
+        """
+        if colors is not None:
+            colors = np.asarray(colors, dtype=np.uint8)
+            if self.color_step > 1:
+                colors = colors // self.color_step * self.color_step
+
+        parts = []
+        if (self.__previous_index is None or np.shape(self.__previous_index) != np.shape(index_grid) or
+                (colors is None) != (self.__previous_colors is None)):
+            # first frame or the size changed, clear the screen and write everything
+            parts.append("\x1b[0m\x1b[2J")
+            self.__cursor = None
+            self.__pen = None
+            if colors is None and self.foreground_color is not None:
+                self.__set_pen(parts, list(self.foreground_color))
+            changed = np.ones(np.shape(index_grid), dtype=bool)
+        else:
+            changed = index_grid != self.__previous_index
+            if colors is not None:
+                changed |= np.any(colors != self.__previous_colors, axis=-1)
+        self.__previous_index = index_grid.copy()
+        self.__previous_colors = colors.copy() if colors is not None else None
+
+        # python ints are much faster to work with one by one than numpy scalars
+        index_rows = index_grid.tolist()
+        color_rows = colors.tolist() if colors is not None else None
+        for row in np.nonzero(changed.any(axis=1))[0].tolist():
+            chars = index_rows[row]
+            row_colors = color_rows[row] if color_rows is not None else None
+            for col in np.nonzero(changed[row])[0].tolist():
+                self.__move_to(parts, row, col, chars, row_colors)
+                if row_colors is not None:
+                    self.__set_pen(parts, row_colors[col])
+                parts.append(self.__chars[chars[col]])
+                self.__cursor = (row, col + 1)
+        return "".join(parts)
+
+    def __move_to(self, parts: list, row: int, col: int, chars: list, row_colors):
+        if self.__cursor == (row, col):
+            return
+        move = f'\x1b[{row + 1};{col + 1}H'
+        if self.__cursor is not None and self.__cursor[0] == row and self.__cursor[1] < col:
+            # unchanged cells in between can be written again if they have the current color and take fewer bytes
+            start = self.__cursor[1]
+            gap_bytes = sum(self.__char_bytes[chars[i]] for i in range(start, col))
+            same_color = row_colors is None or all(row_colors[i] == self.__pen for i in range(start, col))
+            if same_color and gap_bytes < len(move):
+                parts.extend(self.__chars[chars[i]] for i in range(start, col))
+                self.__cursor = (row, col)
+                return
+        parts.append(move)
+        self.__cursor = (row, col)
+
+    def __set_pen(self, parts: list, color: list):
+        if color != self.__pen:
+            parts.append(f'\x1b[38;2;{color[0]};{color[1]};{color[2]}m')
+            self.__pen = color
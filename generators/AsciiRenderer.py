@@ -0,0 +1,95 @@
+import numpy as np
+from generators.ImageAsciiGenerator import ImageAsciiGenerator
+from generators.FrameCache import FrameCache
+from RenderBackend import RenderBackend
+
+
+class AsciiRenderer:
+    """Class for converting a stream of frames (video, webcam) into text images.
+
+    Everything that stays the same between frames is prepared only once: the font is loaded in the constructor, the
+    glyph atlas, lookup tables and effect arrays are created with the first frame and the output buffer is reused for
+    as long as the frames keep the same size.
+
+    Attributes
+    ----------
+    font_size: int
+        size of the text to be used in the conversion
+    gradient: str
+        text representing brightness gradient that pixels are mapped to
+    fg_color: tuple[3]
+        represents the RGB color to be used for text in the conversion
+    generator: ImageAsciiGenerator
+        generator doing the conversion, kept alive between frames
+    last_stats: dict
+        amount of changed and total cells of the last frame in incremental mode, None otherwise
+    frame_cache: FrameCache
+        recently rendered frames reused for repeated grids, None when caching is turned off
+    instrumentation: Instrumentation
+        collects the time spent in every stage of the conversion
+
+    Methods
+    -------
+    render(frame: np.array, foreground_color=None)
+        converts one frame into the text image
+    render_cells(index_grid: np.array, cells=None, foreground_color=None)
+        draws already converted cells into the text image
+    """
+
+    def __init__(self, font_size=8, gradient=' .-;+=xX$█', use_contrast=False, background_color=(66, 5, 5),
+                 foreground_color=(164, 255, 45), effect=None, backend=RenderBackend.ATLAS, font_path="lucon.ttf",
+                 incremental=False, cache_size=0, instrumentation=None, match_shapes=False, cell_pixels=None):
+        """AsciiRenderer constructor
+
+        :param font_size: size of the text to be used in the conversion
+        :param gradient: text representation of brightness gradient that pixels are mapped to in the conversion
+        :param use_contrast: decides whether to use method with higher contrast in the conversion
+        :param background_color: represents the RGB color to be used as background in the conversion
+        :param foreground_color: represents the RGB color to be used as text color in the conversion
+        :param effect: represents the effect to be used on the frames
+        :param backend: decides how the text is drawn onto the frames
+        :param font_path: path or name of the monospace font to use
+        :param incremental: only redraws the cells that changed since the previous frame
+        :param cache_size: amount of rendered frames kept for reuse when a grid repeats, 0 turns the cache off
+        :param instrumentation: Instrumentation recording the time of every stage, nothing is recorded when None
+        :param match_shapes: picks the characters by the shape of the cells instead of only their brightness
+        :param cell_pixels: size of one cell in pixels of the frames, the font size when None (frames at full size)
+        """
+        self.font_size = font_size
+        self.gradient = gradient
+        self.fg_color = foreground_color
+        self.frame_cache = FrameCache(cache_size) if cache_size > 0 else None
+        self.instrumentation = instrumentation
+        self.generator = ImageAsciiGenerator(image=None, font_size=font_size, ascii_gradient=gradient,
+                                             use_contrast=use_contrast, background_color=background_color,
+                                             foreground_color=foreground_color, effect=effect, backend=backend,
+                                             font_path=font_path, incremental=incremental,
+                                             frame_cache=self.frame_cache, instrumentation=instrumentation,
+                                             match_shapes=match_shapes, cell_pixels=cell_pixels)
+        self.last_stats = None
+
+    def render(self, frame: np.array, foreground_color=None) -> np.array:
+        """Converts one frame into the text image
+
+        :param frame: frame to be converted (in HSV, or 2D brightness only)
+        :param foreground_color: text color for this frame only, uses the configured one when None
+        :return: np.array: RGB image. The array is reused by the next call, copy it if it has to be kept. Read only
+            arrays come from the frame cache and can be kept as they are
+        """
+        self.generator.fg_color = self.fg_color if foreground_color is None else foreground_color
+        result = self.generator.render(frame)
+        self.last_stats = self.generator.render_stats
+        return result
+
+    def render_cells(self, index_grid: np.array, cells=None, foreground_color=None) -> np.array:
+        """Draws cells converted earlier (see ImageAsciiGenerator.get_cells) into the text image
+
+        :param index_grid: 2D array with index of the gradient character for each cell
+        :param cells: HSV color of every cell, needed by the original color effect only
+        :param foreground_color: text color for this frame only, uses the configured one when None
+        :return: np.array: RGB image, reused by the next call the same way as by render
+        """
+        self.generator.fg_color = self.fg_color if foreground_color is None else foreground_color
+        result = self.generator.render_cells(index_grid, cells)
+        self.last_stats = self.generator.render_stats
+        return result
@@ -0,0 +1,92 @@
+import json
+import time
+import numpy as np
+from generators.AnsiFrameEncoder import AnsiFrameEncoder
+
+
+class AsciicastWriter:
+    """Class writing grids of characters and colors into an asciicast v2 recording, which asciinema and other players
+    replay in a terminal.
+
+    A recording is a JSON header line followed by a line for every frame, holding the second the frame is shown at and
+    the terminal output drawing it. The output comes from AnsiFrameEncoder, so a frame only holds the cells that changed
+    since the previous one. Every frame is written to the file right away, nothing is kept in memory.
+
+    Attributes
+    ----------
+    path: str
+        path of the recording
+    width: int
+        amount of text columns
+    height: int
+        amount of text rows
+    frames_written: int
+        amount of frames written so far, frames without any change are not counted
+    bytes_written: int
+        bytes of the recording written so far
+
+    Methods
+    -------
+    write_frame(seconds: float, index_grid: np.array, colors=None)
+        adds a frame shown at the given second
+    close()
+        ends the recording and closes the file
+    """
+
+    version = 2
+
+    def __init__(self, path: str, width: int, height: int, gradient: str, title=None, color_step=1,
+                 foreground_color=None):
+        """AsciicastWriter constructor. Creates the file and writes the header
+
+        :param path: path of the recording to write
+        :param width: amount of text columns
+        :param height: amount of text rows
+        :param gradient: characters the indexes of the grids point to
+        :param title: title of the recording shown by the players, None leaves it out
+        :param color_step: colors are rounded down to multiples of this (1 keeps them exact)
+        :param foreground_color: RGB color of all the text when the frames come without colors
+        """
+        self.path = path
+        self.width = width
+        self.height = height
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.__encoder = AnsiFrameEncoder(gradient, color_step=color_step, foreground_color=foreground_color)
+        self.__last_time = 0
+        self.__file = open(path, "w", encoding="utf-8", newline="\n")
+        header = {"version": self.version, "width": width, "height": height, "timestamp": int(time.time()),
+                  "env": {"TERM": "xterm-256color"}}
+        if title is not None:
+            header["title"] = title
+        self.__write_line(header)
+
+    def write_frame(self, seconds: float, index_grid: np.array, colors=None):
+        """Adds a frame to the recording
+
+        :param seconds: time from the start of the recording the frame is shown at
+        :param index_grid: 2D array with the index of the gradient character of every cell
+        :param colors: uint8 array of shape (rows, cols, 3) with the RGB color of every cell, None writes no colors
+        """
+        data = self.__encoder.encode(index_grid, colors)
+        if self.frames_written == 0:
+            data = "\x1b[?25l" + data  # hides the cursor
+        elif not data:
+            return
+        self.__last_time = seconds
+        self.__write_line([round(seconds, 6), "o", data])
+        self.frames_written += 1
+
+    def close(self):
+        """Resets the color, puts the cursor under the picture and closes the file"""
+        if self.__file.closed:
+            return
+        self.__write_line([round(self.__last_time, 6), "o", f'\x1b[0m\x1b[{self.height + 1};1H\x1b[?25h'])
+        self.__file.close()
+
+    def __write_line(self, value):
+        line = json.dumps(value, ensure_ascii=False) + "\n"
+        self.__file.write(line)
+        # flushed every frame, so a recording of a live feed is complete up to the last frame when the program dies
+        self.__file.flush()
+        self.bytes_written += len(line.encode("utf-8"))
@@ -0,0 +1,70 @@
+import os
+import subprocess
+from moviepy.config import FFMPEG_BINARY
+
+
+class AudioMuxer:
+    """Class putting the audio of the source video into a converted video without re-encoding it.
+
+    The converted frames are written into a video without sound first. The audio stream of the source is then copied
+    into it bit for bit, cut to the converted part of the source, while the video stream is copied as well. Only when
+    the container of the output cannot hold the audio codec of the source (ffmpeg refuses the copy) is the audio
+    transcoded.
+
+    Attributes
+    ----------
+    source: str
+        path to the video the audio is taken from
+    start: float
+        second of the source the audio starts at
+    end: float
+        second of the source the audio ends at, None takes it until the end
+
+    Methods
+    -------
+    mux(video_path: str, output_path: str)
+        writes the video with the audio of the source into output_path
+    """
+
+    # codec used when the audio cannot be copied into the output container
+    fallback_codec = "aac"
+    fallback_bitrate = "192k"
+
+    def __init__(self, source: str, start=None, end=None):
+        """AudioMuxer constructor
+
+        :param source: path to the video the audio is taken from
+        :param start: second of the source the audio starts at, None starts at the beginning
+        :param end: second of the source the audio ends at, None takes it until the end
+        """
+        self.source = source
+        self.start = start or 0
+        self.end = end
+
+    def mux(self, video_path: str, output_path: str) -> str:
+        """Copies the video stream of video_path and the audio stream of the source into output_path
+
+        :param video_path: converted video, its audio (if any) is left out
+        :param output_path: path of the video to write, must differ from video_path
+        :return: str: "copy" when the audio was copied, "transcode" when it had to be encoded again
+        """
+        try:
+            self.__run(video_path, output_path, ["-c:a", "copy"])
+            return "copy"
+        except RuntimeError:
+            # the container does not support the codec of the source, so the audio is encoded again
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            self.__run(video_path, output_path, ["-c:a", self.fallback_codec, "-b:a", self.fallback_bitrate])
+            return "transcode"
+
+    def __run(self, video_path: str, output_path: str, audio_arguments: list):
+        command = [FFMPEG_BINARY, "-y", "-loglevel", "error", "-i", video_path, "-ss", str(self.start)]
+        if self.end is not None:
+            command += ["-t", str(max(0, self.end - self.start))]
+        # the ? makes the audio optional, sources without sound give a video without sound
+        command += ["-i", self.source, "-map", "0:v:0", "-map", "1:a:0?", "-c:v", "copy"] + audio_arguments
+        command.append(output_path)
+        process = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True)
+        if process.returncode != 0:
+            raise RuntimeError(f'ffmpeg could not write {output_path}: {process.stderr.decode(errors="replace")}')
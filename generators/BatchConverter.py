@@ -0,0 +1,167 @@
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from helper import Helper
+from instrumentation import Instrumentation
+from generators.CMDAsciiGenerator import CMDAsciiGenerator
+from generators.ImageAsciiGenerator import ImageAsciiGenerator
+from generators.MarkupRenderer import MarkupRenderer
+from generators.TiledImageConverter import TiledImageConverter
+
+
+class BatchConverter:
+    """Class for converting many images at once without any prompts or file dialogs.
+
+    Images are converted with ImageAsciiGenerator (saved as PNG, or as HTML or SVG text by MarkupRenderer),
+    TiledImageConverter (saved as PNG strip by strip, for images too big for the memory) or CMDAsciiGenerator (saved as
+    UTF-8 text), spread over a pool of worker processes. A file that fails to convert is
+    reported and does not stop the others.
+
+    Attributes
+    ----------
+    files: list[str]
+        paths of the images to convert
+    output_dir: str
+        directory the converted files are written into
+    kind: str
+        "image" for ImageAsciiGenerator, "tiled" for TiledImageConverter, "html" or "svg" for MarkupRenderer or "cmd"
+        for CMDAsciiGenerator
+    settings: dict
+        keyword arguments for the generator
+    workers: int
+        amount of worker processes, 1 converts the images in the main process
+    instrumentation: Instrumentation
+        records the time of every image and the stages of the generators, also the ones run by the workers
+
+    Methods
+    -------
+    find_files(pattern: str)
+        returns the images in a directory or matching a glob pattern
+    convert()
+        converts all the files and returns a summary
+    """
+
+    image_extensions = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+    output_extensions = {"image": ".png", "tiled": ".png", "html": ".html", "svg": ".svg", "cmd": ".txt"}
+
+    def __init__(self, files: list, output_dir: str, kind="image", settings=None, workers=1, instrumentation=None):
+        """BatchConverter constructor
+
+        :param files: paths of the images to convert
+        :param output_dir: directory to write the converted files into, created when missing
+        :param kind: "image" for ImageAsciiGenerator, "tiled" for TiledImageConverter, "html" or "svg" for
+            MarkupRenderer or "cmd" for CMDAsciiGenerator
+        :param settings: keyword arguments for the generator (everything except the image)
+        :param workers: amount of worker processes
+        :param instrumentation: Instrumentation recording the time of every image as a frame, nothing is recorded
+            when None
+        """
+        if kind not in self.output_extensions:
+            raise ValueError(f'Unknown batch kind "{kind}", use one of {list(self.output_extensions)}')
+        self.files = list(files)
+        self.output_dir = output_dir
+        self.kind = kind
+        self.settings = settings if settings is not None else {}
+        self.workers = max(1, workers)
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
+
+    @staticmethod
+    def find_files(pattern: str) -> list:
+        """Returns the images to convert
+
+        :param pattern: directory (all images directly inside it) or glob pattern (** goes into subdirectories)
+        :return: list[str]: sorted paths of the images
+        """
+        if os.path.isdir(pattern):
+            paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            paths = glob.glob(pattern, recursive=True)
+        return sorted(path for path in paths
+                      if os.path.isfile(path) and path.lower().endswith(BatchConverter.image_extensions))
+
+    def convert(self) -> dict:
+        """Converts all the files
+
+        :return: dict: amount of converted images, list of (path, error) for the failed ones, bytes written, seconds
+            taken and images per second
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        jobs = list(zip(self.files, self.__get_output_paths()))
+        converted = 0
+        bytes_written = 0
+        failed = []
+        start_time = time.time()
+        self.instrumentation.start()
+        for i, (path, size, error, stages) in enumerate(self.__run(jobs)):
+            if error is None:
+                converted += 1
+                bytes_written += size
+            else:
+                failed.append((path, error))
+            for name, durations in stages.items():
+                self.instrumentation.stages.setdefault(name, []).extend(durations)
+            self.instrumentation.frame_done()
+            Helper.print_progress_bar(iteration=i + 1, total=len(jobs), prefix="Converting images",
+                                      instrumentation=self.instrumentation)
+        self.instrumentation.stop()
+        seconds = time.time() - start_time
+        return {
+            "converted": converted,
+            "failed": failed,
+            "bytes_written": bytes_written,
+            "seconds": seconds,
+            "images_per_second": converted / seconds if seconds > 0 else 0,
+        }
+
+    def __run(self, jobs: list):
+        # yields (input path, bytes written, error message or None, stage timings) for every job
+        instrument = self.instrumentation.enabled
+        if self.workers == 1 or len(jobs) <= 1:
+            for path, output_path in jobs:
+                yield _convert_file(path, output_path, self.kind, self.settings, instrument)
+            return
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            # chunks keep the pickling overhead low for many small images
+            chunk_size = max(1, len(jobs) // (4 * self.workers))
+            yield from executor.map(_convert_file, [path for path, _ in jobs], [output for _, output in jobs],
+                                    [self.kind] * len(jobs), [self.settings] * len(jobs), [instrument] * len(jobs),
+                                    chunksize=chunk_size)
+
+    def __get_output_paths(self) -> list:
+        # output files are named after the input files, images with the same name get a number added
+        extension = self.output_extensions[self.kind]
+        used = set()
+        paths = []
+        for path in self.files:
+            name = os.path.splitext(os.path.basename(path))[0]
+            candidate = name
+            number = 1
+            while candidate in used:
+                candidate = f'{name}_{number}'
+                number += 1
+            used.add(candidate)
+            paths.append(os.path.join(self.output_dir, candidate + extension))
+        return paths
+
+
+def _convert_file(path: str, output_path: str, kind: str, settings: dict, instrument=False) -> tuple:
+    # the stages are recorded here and sent back, as workers cannot add to the instrumentation of the main process
+    instrumentation = Instrumentation(enabled=instrument)
+    settings = dict(settings, instrumentation=instrumentation)
+    try:
+        if kind == "cmd":
+            text = CMDAsciiGenerator(Helper.load_image(path, hsv=False), **settings).convert()
+            with open(output_path, "w", encoding="utf-8") as file:
+                file.write(text)
+        elif kind in ("html", "svg"):
+            generator = ImageAsciiGenerator.from_file(path, **settings)
+            renderer = MarkupRenderer(generator.ascii_gradient, font_size=generator.text_size)
+            renderer.save(output_path, *generator.get_text_cells(generator.image))
+        elif kind == "tiled":
+            TiledImageConverter(path, show_progress=False, **settings).convert(output_path)
+        else:
+            ImageAsciiGenerator.from_file(path, **settings).convert().save(output_path)
+        return path, os.path.getsize(output_path), None, instrumentation.stages
+    except Exception as e:
+        return path, 0, f'{type(e).__name__}: {str(e).strip()}', instrumentation.stages
@@ -1,8 +1,7 @@
 import numpy as np
-import cv2 as cv
 import math
 from helper import Helper
-from io import StringIO
+from instrumentation import Instrumentation
 
 
 class CMDAsciiGenerator:
@@ -14,11 +13,13 @@ class CMDAsciiGenerator:
     width_height_ratio: int
         width to height ratio of characters in terminal window
     image: np.array
-        original image to be converted
+        original image to be converted (BGR)
     terminal_width: int
         maximum width the image should be in order to fit into the terminal window
     ascii_gradient: str
         a text representing brightness gradient which the pixels are mapped to
+    instrumentation: Instrumentation
+        collects the time spent in every stage of the conversion
 
     Methods
     -------
@@ -29,23 +30,23 @@ class CMDAsciiGenerator:
     width_height_ratio = 3
     result = None
 
-    def __init__(self, image: np.array, terminal_width=220, ascii_gradient=" .-;+=xX$█", invert_gradient=False):
+    def __init__(self, image: np.array, terminal_width=220, ascii_gradient=" .-;+=xX$█", invert_gradient=False,
+                 instrumentation=None):
         """CMDAsciiGenerator constructor
 
-        :param image: image to be converted
+        :param image: image to be converted (BGR)
         :param terminal_width: maximum wanted width of the image in terminal
         :param ascii_gradient: brightness gradient given as a string which the pixels are mapped to
         :param invert_gradient: reverses the gradient
+        :param instrumentation: Instrumentation recording the time of every stage, nothing is recorded when None
         """
 
         self.image = image
         self.ascii_gradient = ascii_gradient[::-1] if invert_gradient else ascii_gradient
         self.terminal_width = int(terminal_width // self.width_height_ratio)
-        self.divider = 255 / (len(self.ascii_gradient) - 1)
-
-    def __get_gradient_index(self, brightness: float) -> int:
-        # limits range to x values to match the amount of characters in the gradient and returns one based on brightness
-        return int(brightness // self.divider)
+        # floors the brightness to get the character, ImageAsciiGenerator rounds it instead
+        self.gradient_lookup = Helper.get_gradient_lookup(len(self.ascii_gradient), rounding=False)
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
 
     def convert(self) -> str:
         """Main function. Converts given image into text based on the brightness values. Returns String.
@@ -53,8 +54,10 @@ class CMDAsciiGenerator:
         :returns: str: image in text form
         """
 
-        resized = self.__adjust_image()
-        self.result = self.__pixels_to_txt(resized)
+        with self.instrumentation.stage("adjust_image"):
+            resized = self.__adjust_image()
+        with self.instrumentation.stage("pixels_to_txt"):
+            self.result = self.__pixels_to_txt(resized)
         return self.result
 
     def show_result(self):
@@ -62,30 +65,21 @@ class CMDAsciiGenerator:
         print(f'\n\x1b[94m{self.result}\x1b[0m')
 
     def __adjust_image(self) -> list[list]:
-        # converts into HSV to use Value later for getting the correct character from gradient
-        img = cv.cvtColor(self.image, cv.COLOR_BGR2HSV)
-        img_dimensions = np.shape(img)
+        img_dimensions = np.shape(self.image)
 
         # scales down the image to fit into the terminal and also to lower the amount of comparisons to be done
         scale_ratio = img_dimensions[1] / self.terminal_width
         new_width = math.floor(img_dimensions[1] // scale_ratio)
         new_height = math.floor(img_dimensions[0] // scale_ratio)
 
-        resized_img = cv.resize(img, (new_width, new_height))
-        return resized_img
+        # only the brightness (Value of HSV) is used for getting the correct character from gradient, so it is the only
+        # thing computed, and only after scaling down
+        return Helper.downscale_image(self.image, (new_width, new_height), color=False)
 
     def __pixels_to_txt(self, resized_img) -> str:
-        # uses StringIO to save up on memory
-        text_image = StringIO("")
-
-        for i in range(len(resized_img)):
-            for j, k in enumerate(resized_img[i]):
-                current_char = self.ascii_gradient[self.__get_gradient_index(k[2])]
-                # times the character in line by the ratio to combat the different width to height ratio of the text
-                text_image.write(current_char * self.width_height_ratio)
-            text_image.write("\n")
-
-        return text_image.getvalue()
+        index_grid = self.gradient_lookup[resized_img]
+        # times the character in line by the ratio to combat the different width to height ratio of the text
+        return Helper.index_grid_to_text(index_grid, self.ascii_gradient, repeat=self.width_height_ratio)
 
 
 if __name__ == "__main__":
@@ -99,6 +93,6 @@ if __name__ == "__main__":
     else:
         filename = test_file_path
     width = int(input("Terminal width:"))
-    original_img = Helper.load_image(filename)
+    original_img = Helper.load_image(filename, hsv=False)
     ascii_gen = CMDAsciiGenerator(original_img, width, ascii_gradient=gradient)
     print("\x1b[94m", ascii_gen.convert(), "\x1b[0m")
@@ -0,0 +1,198 @@
+import threading
+import time
+import numpy as np
+from generators.AsciiRenderer import AsciiRenderer
+from generators.FrameSource import FrameSource
+
+
+class LatestFrameSlot:
+    """Hand-off between two pipeline stages keeping only the newest frame.
+
+    When the consumer is slower than the producer, a frame that was not taken yet is replaced by the new one, so the
+    consumer always works on the most recent frame instead of falling further and further behind.
+
+    Attributes
+    ----------
+    dropped: int
+        amount of frames replaced before being taken
+
+    Methods
+    -------
+    put(item)
+        stores the item, replacing the one not taken yet
+    get(timeout=None)
+        takes the newest item, waiting for one to come
+    close()
+        wakes up the consumer, get returns None once the slot is empty
+    """
+
+    def __init__(self):
+        """LatestFrameSlot constructor"""
+        self.dropped = 0
+        self.__condition = threading.Condition()
+        self.__item = None
+        self.__closed = False
+
+    @property
+    def closed(self) -> bool:
+        return self.__closed
+
+    def put(self, item):
+        """Stores the item, replacing the one not taken yet
+
+        :param item: anything but None
+        """
+        with self.__condition:
+            if self.__item is not None:
+                self.dropped += 1
+            self.__item = item
+            self.__condition.notify()
+
+    def get(self, timeout=None):
+        """Takes the newest item
+
+        :param timeout: maximum amount of seconds to wait, None waits until an item comes or the slot is closed
+        :return: the item, None when the slot is closed and empty or the timeout ran out
+        """
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__item is not None or self.__closed, timeout)
+            item = self.__item
+            self.__item = None
+            return item
+
+    def close(self):
+        """Marks the end of the frames, the consumer gets None once it took the last item"""
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+
+
+class CamPipeline:
+    """Class running capture, conversion and display of a live feed at the same time.
+
+    Frames are captured and converted on their own threads and shown on the calling thread (OpenCV windows have to be
+    used from one thread). Stages are connected with LatestFrameSlots, so a slow stage makes the pipeline drop stale
+    frames instead of building up delay.
+
+    Attributes
+    ----------
+    source: FrameSource
+        where the frames come from
+    renderer: AsciiRenderer
+        converts the frames into text images
+    display: callable
+        called with every converted frame and the original frame on the calling thread, returning False stops the
+        pipeline. None only counts the frames
+    max_frames: int
+        amount of shown frames after which the pipeline stops, None runs until the source ends or display stops it
+
+    Methods
+    -------
+    run()
+        runs the pipeline and returns its statistics
+    """
+
+    # how long the display stage waits for a frame before checking whether the other stages ended
+    poll_interval = 0.05
+    # how long stopping waits for every stage thread, a camera that stopped answering can block a read for good. The
+    # threads are daemons, so one still stuck in the source is left behind and does not keep the app running
+    join_timeout = 2
+
+    def __init__(self, source: FrameSource, renderer: AsciiRenderer, display=None, max_frames=None):
+        """CamPipeline constructor
+
+        :param source: where the frames come from
+        :param renderer: converts the frames into text images
+        :param display: called with every converted RGB frame and its original, returning False stops the pipeline
+        :param max_frames: amount of shown frames after which the pipeline stops
+        """
+        self.source = source
+        self.renderer = renderer
+        self.display = display
+        self.max_frames = max_frames
+        self.__stop = threading.Event()
+        self.__error = None
+
+    def run(self) -> dict:
+        """Runs the pipeline until the source ends, display returns False or max_frames frames were shown
+
+        :return: dict: amount of captured, converted, shown and dropped frames, achieved FPS, the latency from
+            capture to display in milliseconds (mean, 95th percentile and maximum) and the changed and total cells
+            in incremental mode
+        """
+        self.__stop.clear()
+        self.__error = None
+        captured = LatestFrameSlot()
+        converted = LatestFrameSlot()
+        counts = {"captured": 0, "converted": 0, "changed_cells": 0, "total_cells": 0}
+        threads = [threading.Thread(target=self.__capture, args=(captured, counts), daemon=True),
+                   threading.Thread(target=self.__convert, args=(captured, converted, counts), daemon=True)]
+        latencies = []
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while self.max_frames is None or len(latencies) < self.max_frames:
+                item = converted.get(timeout=self.poll_interval)
+                if item is None:
+                    if converted.closed:
+                        break
+                    continue
+                capture_time, result, frame = item
+                if self.display is not None and self.display(result, frame) is False:
+                    break
+                latencies.append(time.perf_counter() - capture_time)
+        finally:
+            self.__stop.set()
+            captured.close()
+            for thread in threads:
+                thread.join(timeout=self.join_timeout)
+        elapsed = time.perf_counter() - start_time
+        if self.__error is not None:
+            raise self.__error
+
+        latencies = np.array(latencies) * 1000
+        return {
+            "captured": counts["captured"],
+            "converted": counts["converted"],
+            "shown": len(latencies),
+            "dropped": captured.dropped + converted.dropped,
+            "fps": len(latencies) / elapsed if elapsed > 0 else 0,
+            "latency_mean": float(latencies.mean()) if len(latencies) else 0,
+            "latency_p95": float(np.percentile(latencies, 95)) if len(latencies) else 0,
+            "latency_max": float(latencies.max()) if len(latencies) else 0,
+            "changed_cells": counts["changed_cells"],
+            "total_cells": counts["total_cells"],
+        }
+
+    def __capture(self, captured: LatestFrameSlot, counts: dict):
+        try:
+            while not self.__stop.is_set():
+                frame = self.source.read()
+                if frame is None:
+                    break
+                counts["captured"] += 1
+                captured.put((time.perf_counter(), frame))
+        except Exception as e:
+            self.__error = e
+        finally:
+            captured.close()
+
+    def __convert(self, captured: LatestFrameSlot, converted: LatestFrameSlot, counts: dict):
+        try:
+            while not self.__stop.is_set():
+                item = captured.get()
+                if item is None:
+                    break
+                capture_time, frame = item
+                # renderer reuses its output array, so the frame shown on the other thread has to be a copy
+                result = self.renderer.render(frame).copy()
+                counts["converted"] += 1
+                if self.renderer.last_stats is not None:
+                    counts["changed_cells"] += self.renderer.last_stats["changed_cells"]
+                    counts["total_cells"] += self.renderer.last_stats["total_cells"]
+                converted.put((capture_time, result, frame))
+        except Exception as e:
+            self.__error = e
+        finally:
+            converted.close()
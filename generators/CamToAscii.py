@@ -1,7 +1,9 @@
 import cv2 as cv
-import numpy as np
 import time
-from generators.ImageAsciiGenerator import ImageAsciiGenerator
+from generators.AsciiRenderer import AsciiRenderer
+from generators.CamPipeline import CamPipeline
+from generators.FrameSource import CameraSource
+from RenderBackend import RenderBackend
 
 
 class CamToAscii:
@@ -17,6 +19,14 @@ class CamToAscii:
         represents the RGB color to be used for background in the conversion
     font_size: int
         size of the text to be used in the conversion
+    backend: RenderBackend
+        decides how the text is drawn onto the images
+    incremental: bool
+        only redraws the parts of the image that changed since the previous image
+    pipelined: bool
+        captures, converts and shows the images on separate threads, dropping images the conversion can't keep up with
+    source: FrameSource
+        where the images come from, the default camera when None
 
     Methods
     -------
@@ -24,7 +34,8 @@ class CamToAscii:
         Converts the webcam feed into text
     """
     def __init__(self, gradient="   .-;+=xX$█", background_color=(66, 5, 5), foreground_color=(164, 255, 45),
-                 font_size=8, invert_gradient=False, show_webcam=False):
+                 font_size=8, invert_gradient=False, show_webcam=False, backend=RenderBackend.ATLAS,
+                 incremental=False, pipelined=False, source=None):
         """Constructor of the CamToAscii class
 
         :param gradient: text representing the brightness gradient that pixels are mapped to
@@ -33,36 +44,79 @@ class CamToAscii:
         :param font_size: size of the text to be used in the conversion
         :param invert_gradient: reverses the gradient text
         :param show_webcam: chooses whether to show the original webcam as well
+        :param backend: decides how the text is drawn onto the images
+        :param incremental: redraws only the cells that changed since the previous image
+        :param pipelined: runs capture, conversion and display at the same time instead of one after another
+        :param source: FrameSource to take the images from instead of the default camera
         """
         self.gradient = gradient[::-1] if invert_gradient else gradient
         self.fg_color = foreground_color
         self.bg_color = background_color
         self.font_size = font_size
         self.show_webcam = show_webcam
+        self.backend = backend
+        self.incremental = incremental
+        self.pipelined = pipelined
+        self.source = source
 
     def convert(self):
         """Main method of the class
 
         Converts the webcam feed into text images, which are then shown. Press Q to stop the stream.
         """
-        # Open the default camera
-        cap = cv.VideoCapture(0)
-        if not cap.isOpened():
-            Exception("Cannot open camera")
+        source = self.source if self.source is not None else CameraSource(0)
+        # created once, so the font and lookup tables are not prepared again for every image
+        renderer = AsciiRenderer(gradient=self.gradient, foreground_color=self.fg_color,
+                                 background_color=self.bg_color, font_size=self.font_size, backend=self.backend,
+                                 incremental=self.incremental)
+        try:
+            if self.pipelined:
+                self.__convert_pipelined(source, renderer)
+            else:
+                self.__convert_sequential(source, renderer)
+        finally:
+            source.close()
+            cv.destroyAllWindows()
+
+    def __convert_pipelined(self, source, renderer: AsciiRenderer):
+        stats = CamPipeline(source, renderer, display=self.__show).run()
+        print("-----PIPELINE STATISTICS-----")
+        print(f'Frames captured: {stats["captured"]}, converted: {stats["converted"]}, shown: {stats["shown"]}, '
+              f'dropped: {stats["dropped"]}')
+        print(f'FPS: {stats["fps"]:.1f}')
+        print(f'Latency (ms): mean {stats["latency_mean"]:.1f}, 95th percentile {stats["latency_p95"]:.1f}, '
+              f'max {stats["latency_max"]:.1f}')
+        if stats["total_cells"] > 0:
+            print(f'Redrawn cells: {stats["changed_cells"]}/{stats["total_cells"]} '
+                  f'({100 * stats["changed_cells"] / stats["total_cells"]:.1f}%)')
+        print("-----------------------------")
+
+    def __show(self, result, frame) -> bool:
+        # display stage of the pipeline, returns False when the user wants to stop
+        cv.imshow('Result', cv.cvtColor(result, cv.COLOR_BGR2RGB))
+        if self.show_webcam:
+            cv.imshow('Webcam', frame)
+        # Press 'q' to exit the loop
+        if cv.waitKey(1) == ord('q'):
+            print("Exiting...")
+            return False
+        return True
+
+    def __convert_sequential(self, source, renderer: AsciiRenderer):
+        changed_cells = total_cells = 0
         curr_time = time.time()
         while True:
-            ret, frame = cap.read()
+            frame = source.read()
             diff = time.time() - curr_time
 
-            if not ret:
-                Exception("Couldn't load the camera stream")
+            if frame is None:
+                break
 
             if diff > 0.3:
-                iag = ImageAsciiGenerator(image=frame, ascii_gradient=self.gradient,
-                                          foreground_color=self.fg_color,
-                                          background_color=self.bg_color, font_size=self.font_size)
-                result = iag.convert()
-                result = np.array(result)
+                result = renderer.render(frame)
+                if renderer.last_stats is not None:
+                    changed_cells += renderer.last_stats["changed_cells"]
+                    total_cells += renderer.last_stats["total_cells"]
                 result = cv.cvtColor(result, cv.COLOR_BGR2RGB)
                 cv.imshow('Result', result)
 
@@ -74,8 +128,8 @@ class CamToAscii:
                 print("Exiting...")
                 break
 
-        cap.release()
-        cv.destroyAllWindows()
+        if total_cells > 0:
+            print(f'Redrawn cells: {changed_cells}/{total_cells} ({100 * changed_cells / total_cells:.1f}%)')
 
 
 if __name__ == "__main__":
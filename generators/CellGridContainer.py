@@ -0,0 +1,202 @@
+import json
+import mmap
+import struct
+import zlib
+import numpy as np
+
+
+class CellGridWriter:
+    """Class writing the converted cells of a video (character indexes and colors) into a cell file.
+
+    A cell file keeps everything the text frames are drawn from, so the video can be drawn again with another font
+    size, colors or effect without decoding and converting the source (see CellGridRenderer). Every frame holds the
+    index grid and optionally the HSV color of every cell as uint8 arrays. Every keyframe_interval-th frame is stored
+    whole; the frames in between store the XOR with the previous frame. Unchanged cells become zeros, which zlib
+    squeezes to almost nothing. A table with the position of every frame is written at the end of the file, so
+    CellGridReader can jump to any frame.
+
+    File layout: header (header_format), JSON metadata, compressed frames, frame table (table_dtype).
+
+    Attributes
+    ----------
+    path: str
+        path of the cell file
+    fps: float
+        frames per second of the video
+    keyframe_interval: int
+        every how many frames a whole frame is stored
+    metadata: dict
+        anything JSON serializable to store along with the frames (gradient, source video, ...)
+    frames_written: int
+        amount of frames written so far
+
+    Methods
+    -------
+    write(index_grid: np.array, colors=None)
+        adds a frame to the file
+    close()
+        writes the frame table and finishes the file
+    """
+
+    magic = b"ASCG"
+    version = 1
+    # magic, version, flags, rows, cols, frame count, keyframe interval, fps, metadata length, table offset
+    header_format = "<4sHHHHIIdIQ"
+    # position of every frame in the file, key is 1 for frames stored whole
+    table_dtype = np.dtype([("offset", "<u8"), ("size", "<u4"), ("key", "u1")])
+    flag_colors = 1
+    compression_level = 6
+
+    def __init__(self, path: str, fps: float, keyframe_interval=30, metadata=None):
+        """CellGridWriter constructor. Creates the file, the size of the grids is taken from the first frame
+
+        :param path: path of the cell file to write
+        :param fps: frames per second of the video
+        :param keyframe_interval: every how many frames a whole frame is stored, lower is faster to seek but bigger
+        :param metadata: dict stored as JSON in the file, CellGridRenderer reads "gradient" and "source" from it
+        """
+        self.path = path
+        self.fps = fps
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.metadata = metadata if metadata is not None else {}
+        self.frames_written = 0
+        self.__file = open(path, "wb")
+        self.__metadata_bytes = json.dumps(self.metadata).encode("utf-8")
+        self.__file.write(b"\0" * struct.calcsize(self.header_format) + self.__metadata_bytes)
+        self.__shape = None
+        self.__colors = None
+        self.__previous = None
+        self.__table = []
+
+    def write(self, index_grid: np.array, colors=None):
+        """Adds a frame to the file. All the frames need the same grid shape and either all or none have colors
+
+        :param index_grid: 2D array with index of the gradient character for each cell (0-255)
+        :param colors: uint8 array of shape (rows, cols, 3) with the HSV color of every cell, or None
+        """
+        if self.__shape is None:
+            self.__shape = np.shape(index_grid)
+            self.__colors = colors is not None
+        if np.shape(index_grid) != self.__shape or (colors is not None) != self.__colors:
+            raise ValueError("All frames of a cell file need the same grid shape and either all or none have colors")
+        if np.max(index_grid, initial=0) > 255:
+            raise ValueError("Cell files store the indexes as bytes, the gradient can have at most 256 characters")
+
+        frame = np.asarray(index_grid, dtype=np.uint8).ravel()
+        if colors is not None:
+            frame = np.concatenate([frame, np.asarray(colors, dtype=np.uint8).ravel()])
+        key = self.__previous is None or self.frames_written % self.keyframe_interval == 0
+        payload = zlib.compress((frame if key else frame ^ self.__previous).tobytes(), self.compression_level)
+        self.__table.append((self.__file.tell(), len(payload), key))
+        self.__file.write(payload)
+        self.__previous = frame
+        self.frames_written += 1
+
+    def close(self):
+        """Writes the frame table and the header, the file is complete after this"""
+        if self.__file.closed:
+            return
+        table_offset = self.__file.tell()
+        self.__file.write(np.array(self.__table, dtype=self.table_dtype).tobytes())
+        rows, cols = self.__shape if self.__shape is not None else (0, 0)
+        flags = self.flag_colors if self.__colors else 0
+        self.__file.seek(0)
+        self.__file.write(struct.pack(self.header_format, self.magic, self.version, flags, rows, cols,
+                                      self.frames_written, self.keyframe_interval, self.fps,
+                                      len(self.__metadata_bytes), table_offset))
+        self.__file.close()
+
+
+class CellGridReader:
+    """Class reading frames of a cell file written by CellGridWriter.
+
+    The file is memory mapped, so opening it reads only the header and frame table, and a frame is read by decompressing
+    its own bytes and the deltas since the closest keyframe before it. Reading the frames in order applies a single
+    delta per frame.
+
+    Attributes
+    ----------
+    path: str
+        path of the cell file
+    fps: float
+        frames per second of the video
+    frame_count: int
+        amount of frames in the file
+    grid_shape: tuple[2]
+        (rows, cols) of the grids
+    has_colors: bool
+        whether the frames hold the color of every cell
+    metadata: dict
+        metadata given to the writer
+
+    Methods
+    -------
+    read(frame_number: int)
+        returns the index grid and colors of the frame
+    close()
+        closes the file
+    """
+
+    def __init__(self, path: str):
+        """CellGridReader constructor. Maps the file into memory and reads its header and frame table
+
+        :param path: path of the cell file
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        header_size = struct.calcsize(CellGridWriter.header_format)
+        if len(self.__map) < header_size:
+            raise ValueError(f'{path} is not a cell file')
+        (magic, version, flags, rows, cols, frame_count, keyframe_interval, fps, metadata_length,
+         table_offset) = struct.unpack_from(CellGridWriter.header_format, self.__map)
+        if magic != CellGridWriter.magic or table_offset == 0:
+            raise ValueError(f'{path} is not a cell file or it was not closed')
+        if version != CellGridWriter.version:
+            raise ValueError(f'{path} has unsupported version {version}')
+        self.fps = fps
+        self.frame_count = frame_count
+        self.grid_shape = (rows, cols)
+        self.has_colors = bool(flags & CellGridWriter.flag_colors)
+        self.metadata = json.loads(self.__map[header_size:header_size + metadata_length].decode("utf-8"))
+        # the table is used straight from the mapped file, nothing is copied
+        self.__table = np.frombuffer(self.__map, dtype=CellGridWriter.table_dtype, count=frame_count,
+                                     offset=table_offset)
+        self.__keyframes = np.nonzero(self.__table["key"])[0]
+        self.__current = None
+        self.__current_number = None
+
+    def __len__(self):
+        return self.frame_count
+
+    def read(self, frame_number: int) -> tuple:
+        """Returns the grids of the frame
+
+        :param frame_number: number of the frame, starting at 0
+        :return: tuple: (index grid, colors) as uint8 arrays, colors are None when the file has none
+        """
+        if not 0 <= frame_number < self.frame_count:
+            raise IndexError(f'Frame {frame_number} is out of range, the file has {self.frame_count} frames')
+        start = self.__keyframes[np.searchsorted(self.__keyframes, frame_number, side="right") - 1]
+        if self.__current_number is not None and start <= self.__current_number <= frame_number:
+            # no keyframe between the current frame and this one, so only the deltas after the current one are needed
+            start = self.__current_number + 1
+        for number in range(start, frame_number + 1):
+            offset, size, key = self.__table[number]
+            frame = np.frombuffer(zlib.decompress(self.__map[offset:offset + size]), dtype=np.uint8)
+            if key:
+                self.__current = frame.copy()
+            else:
+                # a new array, so the grids given back by the previous call stay as they were
+                self.__current = self.__current ^ frame
+        self.__current_number = frame_number
+
+        rows, cols = self.grid_shape
+        index_grid = self.__current[:rows * cols].reshape(rows, cols)
+        colors = self.__current[rows * cols:].reshape(rows, cols, 3) if self.has_colors else None
+        return index_grid, colors
+
+    def close(self):
+        """Closes the mapped file"""
+        self.__table = None
+        self.__map.close()
@@ -0,0 +1,150 @@
+import os
+import tempfile
+import time
+from helper import Helper
+from Effect import Effect
+from generators.AsciiRenderer import AsciiRenderer
+from generators.AudioMuxer import AudioMuxer
+from generators.CellGridContainer import CellGridReader
+from generators.StreamingVideoWriter import StreamingVideoWriter
+from instrumentation import Instrumentation
+
+
+class CellGridRenderer:
+    """Class drawing a video out of a cell file written by VideoAsciiGenerator.save_cells.
+
+    The source video is not decoded and its frames are not converted again, only the text is drawn, so trying out
+    other colors, effects or font sizes on the same clip costs the drawing and encoding alone. The audio is copied from
+    the source video without encoding it again, when the source is still where it was when the cell file was written.
+
+    Attributes
+    ----------
+    path: str
+        path to the cell file
+    font_size: int
+        size of the text drawn, every cell of the file becomes this big
+    gradient: str
+        characters the indexes of the cell file are drawn with, the gradient stored in the file when None
+    use_contrast: bool
+        decides whether to use method with higher contrast
+    bg_color: tuple[3]
+        RGB color of the background
+    fg_color: tuple[3]
+        RGB color of the text
+    effect: Effect
+        effect to be used on the video
+    incremental: bool
+        only redraws the parts of a frame that changed since the previous frame
+    cache_size: int
+        amount of rendered frames kept to be reused when the same text frame repeats, 0 turns the cache off
+    instrumentation: Instrumentation
+        collects the time spent in every stage, printed at the end when enabled
+
+    Methods
+    -------
+    convert(filename: str)
+        draws all the frames of the cell file into a video
+    """
+
+    # maximum amount of drawn frames waiting for the encoder
+    stream_queue_size = 8
+
+    def __init__(self, path: str, font_size=8, gradient=None, use_contrast=False, background_color=(66, 5, 5),
+                 foreground_color=(164, 255, 45), effect=None, invert_gradient=False, incremental=False, cache_size=0,
+                 instrumentation=None):
+        """CellGridRenderer constructor
+
+        :param path: path to the cell file
+        :param font_size: size of the text drawn
+        :param gradient: characters to draw the cells with, needs as many characters as the gradient of the file.
+            Uses the gradient stored in the file when None
+        :param use_contrast: decides whether to use method with higher contrast
+        :param background_color: RGB color of the background
+        :param foreground_color: RGB color of the text
+        :param effect: effect to be used on the video
+        :param invert_gradient: reverses the gradient
+        :param incremental: redraws only the cells of a frame that changed since the previous frame
+        :param cache_size: amount of rendered frames kept for reuse, 0 turns the cache off
+        :param instrumentation: Instrumentation recording the time of every stage, nothing is recorded when None
+        """
+        self.path = path
+        self.font_size = font_size
+        self.gradient = gradient
+        self.invert_gradient = invert_gradient
+        self.use_contrast = use_contrast
+        self.bg_color = background_color
+        self.fg_color = foreground_color
+        self.effect = effect
+        self.incremental = incremental
+        self.cache_size = cache_size
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
+
+    def convert(self, filename: str):
+        """Draws all the frames of the cell file and saves them as a video
+
+        :param filename: path of the video to write
+        """
+        reader = CellGridReader(self.path)
+        try:
+            gradient = self.__get_gradient(reader)
+            if self.effect == Effect.ORIGINAL_COLOR and not reader.has_colors:
+                raise ValueError(f'{self.path} has no colors, the original color effect cannot be used')
+            gradual = self.effect == Effect.VIDEO_RAINBOW_GRADUAL
+            renderer = AsciiRenderer(font_size=self.font_size, gradient=gradient, use_contrast=self.use_contrast,
+                                     background_color=(0, 0, 0) if gradual else self.bg_color,
+                                     foreground_color=self.fg_color, effect=None if gradual else self.effect,
+                                     incremental=self.incremental, cache_size=self.cache_size,
+                                     instrumentation=self.instrumentation)
+            # frames are saved without sound first, the audio is copied in from the source at the end
+            handle, silent_file = tempfile.mkstemp(suffix=os.path.splitext(filename)[1],
+                                                   dir=os.path.dirname(os.path.abspath(filename)))
+            os.close(handle)
+            writer = StreamingVideoWriter(silent_file, reader.fps, queue_size=self.stream_queue_size,
+                                          instrumentation=self.instrumentation)
+            start_time = time.time()
+            self.instrumentation.start()
+            try:
+                for i in range(len(reader)):
+                    with self.instrumentation.stage("read_cells"):
+                        index_grid, cells = reader.read(i)
+                    # same color change over time as VideoAsciiGenerator uses for the gradual effect
+                    fg_color = tuple(Helper.get_hue_lookup()[(2 * i) % 181].tolist()) if gradual else None
+                    frame = renderer.render_cells(index_grid, cells, foreground_color=fg_color)
+                    with self.instrumentation.stage("queue_wait"):
+                        writer.write_frame(frame)
+                    self.instrumentation.frame_done()
+                    Helper.print_progress_bar(iteration=i + 1, total=len(reader), prefix="Drawing frames",
+                                              instrumentation=self.instrumentation)
+                writer.close()
+                with self.instrumentation.stage("audio"):
+                    self.__add_audio(reader.metadata, silent_file, filename)
+            finally:
+                writer.close()
+                if os.path.exists(silent_file):
+                    os.remove(silent_file)
+        finally:
+            reader.close()
+        self.instrumentation.stop()
+        print(f'\n-----FRAMES DRAWN AND SAVED IN {time.time() - start_time} SECONDS-----')
+        if self.instrumentation.enabled:
+            self.instrumentation.print_summary()
+
+    def __get_gradient(self, reader: CellGridReader) -> str:
+        gradient = self.gradient if self.gradient is not None else reader.metadata.get("gradient")
+        if gradient is None:
+            raise ValueError(f'{self.path} has no gradient stored, it has to be given')
+        stored = reader.metadata.get("gradient")
+        if stored is not None and len(gradient) != len(stored):
+            raise ValueError(f'The gradient needs {len(stored)} characters, the same amount as the one in the file')
+        return gradient[::-1] if self.invert_gradient else gradient
+
+    @staticmethod
+    def __add_audio(metadata: dict, silent_file: str, filename: str):
+        # copies the audio of the part of the source the cells were made from, without sound when the source is gone
+        source = metadata.get("source")
+        if source is None or not os.path.exists(source):
+            print("Source video not found, the video will have no sound")
+            os.replace(silent_file, filename)
+            return
+        if AudioMuxer(source, metadata.get("start"), metadata.get("end")).mux(silent_file, filename) == "transcode":
+            print("The audio codec of the source does not fit into the video, the audio was encoded again")
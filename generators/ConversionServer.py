@@ -0,0 +1,438 @@
+import io
+import json
+import os
+import queue
+import signal
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import cv2 as cv
+from PIL import Image
+from helper import Helper
+from Effect import Effect
+from generators.CMDAsciiGenerator import CMDAsciiGenerator
+from generators.ImageAsciiGenerator import ImageAsciiGenerator
+from generators.MarkupRenderer import MarkupRenderer
+
+
+class ConversionServer:
+    """Class running a local HTTP service that converts uploaded images, so the conversions skip the start of a process.
+
+    Starting main.py imports OpenCV, PIL and moviepy, loads the font and builds the glyph atlas and lookup tables, which
+    takes far longer than converting a small image. The service does all of that once. Its worker processes keep a
+    generator for every recent combination of settings, with its font, glyph atlas, effect arrays and drawing buffers,
+    and convert one request after another with them.
+
+    Requests arriving at the same time are batched: they wait in a queue until a worker is free, and a free worker gets
+    all of them (up to batch_size) in a single task, which saves a round trip to the worker for every image. A request
+    that finds a worker free is sent off right away, unless batch_wait gives it time to collect the requests after it.
+
+    Endpoints
+    ---------
+    POST /convert?kind=image&font_size=8&...
+        converts the image in the body (any format OpenCV reads). The query takes the same settings as the batch mode
+        (see setting_arguments), settings left out come from the defaults of the service. Answers with the PNG, HTML,
+        SVG or text, with the time of every stage in the Server-Timing header
+    GET /health
+        answers with JSON about the service: uptime, workers, queued requests, requests served and batching
+
+    Attributes
+    ----------
+    host: str
+        address the service listens on, only this machine can reach the default one
+    port: int
+        port the service listens on, 0 picks a free one (see address)
+    workers: int
+        amount of worker processes converting the images
+    defaults: dict
+        settings used where a request leaves them out, with the names of the query
+    batch_size: int
+        most requests converted by a worker in one task
+    batch_wait: float
+        seconds an idle service waits for more requests before sending a batch to a worker
+    address: tuple
+        (host, port) the service listens on, set by start
+    stats: dict
+        amount of requests, failed requests and batches so far
+
+    Methods
+    -------
+    start()
+        starts the workers and listens for requests in a background thread
+    serve_forever()
+        starts the workers and listens for requests until interrupted
+    stop()
+        stops listening and shuts the workers down
+    get_settings(query: dict)
+        returns the kind of output and the generator settings of a request
+    submit(data: bytes, kind: str, settings: dict)
+        queues a conversion and returns a Future of its result
+    get_health()
+        returns the state of the service
+    """
+
+    # content type of every kind of output
+    kinds = {"image": "image/png", "html": "text/html; charset=utf-8", "svg": "image/svg+xml",
+             "cmd": "text/plain; charset=utf-8"}
+    # settings of the query (the same names as the batch settings), mapped to the generator arguments they set
+    setting_arguments = {"font_size": "font_size", "gradient": "ascii_gradient", "use_contrast": "use_contrast",
+                         "background_color": "background_color", "foreground_color": "foreground_color",
+                         "invert_gradient": "invert_gradient", "effect": "effect", "match_shapes": "match_shapes",
+                         "terminal_width": "terminal_width"}
+    # generator arguments CMDAsciiGenerator takes, ImageAsciiGenerator takes all the others
+    cmd_arguments = ("ascii_gradient", "invert_gradient", "terminal_width")
+    # generators every worker keeps, for the most recently used settings
+    generator_cache_size = 8
+    # requests in one batch stop growing past this many bytes of images
+    batch_bytes = 4 * 2 ** 20
+    max_body_bytes = 64 * 2 ** 20
+    request_timeout = 300
+
+    def __init__(self, host="127.0.0.1", port=8000, workers=1, defaults=None, batch_size=8, batch_wait=0.0):
+        """ConversionServer constructor, nothing is started before start or serve_forever
+
+        :param host: address to listen on
+        :param port: port to listen on, 0 picks a free one
+        :param workers: amount of worker processes converting the images
+        :param defaults: settings for the requests that leave them out, with the names of the query (kind and the
+            keys of setting_arguments)
+        :param batch_size: most requests converted by a worker in one task
+        :param batch_wait: seconds an idle service waits for more requests before sending a batch to a worker
+        """
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.defaults = dict(defaults) if defaults is not None else {}
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.address = None
+        self.stats = {"requests": 0, "failed": 0, "batches": 0, "batched_requests": 0}
+        # checks the defaults once, so a wrong default fails at the start instead of in every request
+        self.get_settings({})
+        self.__httpd = None
+        self.__executor = None
+        self.__queue = queue.Queue()
+        self.__free_workers = threading.Semaphore(self.workers)
+        self.__stats_lock = threading.Lock()
+        self.__start_time = None
+
+    def start(self):
+        """Starts the workers, warms them up and listens for requests in a background thread"""
+        self.__open()
+        threading.Thread(target=self.__httpd.serve_forever, name="ConversionServer", daemon=True).start()
+
+    def serve_forever(self):
+        """Starts the workers, warms them up and handles requests until interrupted (Ctrl+C)"""
+        self.__open()
+        try:
+            self.__httpd.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Stops listening and shuts the workers down once they finish the batches they are converting"""
+        if self.__httpd is None:
+            return
+        httpd, self.__httpd = self.__httpd, None
+        # waits for serve_forever to return, right away when it has returned already
+        httpd.shutdown()
+        httpd.server_close()
+        self.__queue.put(None)
+        self.__executor.shutdown(wait=True)
+
+    def get_settings(self, query: dict) -> tuple:
+        """Reads the settings of a request, the ones it leaves out are taken from the defaults
+
+        :param query: settings with the names of setting_arguments and kind, values are text (or lists of text, as
+            parse_qs gives them) or already of the right type
+        :return: tuple: kind of output and keyword arguments for the generator of that kind
+        """
+        values = dict(self.defaults)
+        values.update({key: value[-1] if isinstance(value, list) else value for key, value in query.items()})
+        unknown = set(values) - set(self.setting_arguments) - {"kind"}
+        if unknown:
+            raise ValueError(f'Unknown settings: {sorted(unknown)}')
+        kind = values.pop("kind", "image")
+        if kind not in self.kinds:
+            raise ValueError(f'Unknown kind "{kind}", use one of {list(self.kinds)}')
+        arguments = {self.setting_arguments[key]: self.__parse(key, value) for key, value in values.items()}
+        if kind == "cmd":
+            return kind, {key: value for key, value in arguments.items() if key in self.cmd_arguments}
+        return kind, {key: value for key, value in arguments.items() if key != "terminal_width"}
+
+    def submit(self, data: bytes, kind: str, settings: dict) -> Future:
+        """Queues the conversion of an image for the workers
+
+        :param data: content of the image file
+        :param kind: kind of output, one of kinds
+        :param settings: keyword arguments for the generator, as returned by get_settings
+        :return: Future: gives a dict with the converted "body", its "content_type", the seconds of every stage in
+            "timings", the "batch_size" it was converted in, whether the generator was "cached" and the "error" (None
+            when the conversion succeeded)
+        """
+        future = Future()
+        self.__queue.put((future, data, kind, settings))
+        return future
+
+    def get_health(self) -> dict:
+        """Returns the state of the service
+
+        :return: dict: status, uptime in seconds, workers, queued requests, requests and failed requests so far,
+            batches and the average amount of requests in a batch
+        """
+        with self.__stats_lock:
+            stats = dict(self.stats)
+        return {"status": "ok", "uptime_seconds": round(time.time() - self.__start_time, 3) if self.__start_time else 0,
+                "workers": self.workers, "queued": self.__queue.qsize(), "requests": stats["requests"],
+                "failed": stats["failed"], "batches": stats["batches"],
+                "average_batch_size": round(stats["batched_requests"] / stats["batches"], 2) if stats["batches"] else 0}
+
+    def __open(self):
+        if self.__httpd is not None:
+            raise RuntimeError("The service is running already")
+        _, settings = self.get_settings({"kind": "image"})
+        self.__executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_up, initargs=(settings,))
+        # every worker starts (and warms up) before the first request comes in
+        for future in [self.__executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        self.__httpd = ThreadingHTTPServer((self.host, self.port), _RequestHandler)
+        self.__httpd.daemon_threads = True
+        self.__httpd.service = self
+        self.address = self.__httpd.server_address[:2]
+        self.__start_time = time.time()
+        threading.Thread(target=self.__dispatch, name="ConversionServerBatches", daemon=True).start()
+
+    def __dispatch(self):
+        # sends the queued requests to the workers in batches, a batch is only put together once a worker is free
+        while True:
+            self.__free_workers.acquire()
+            first = self.__queue.get()
+            if first is None:
+                return
+            batch = [first]
+            batch_bytes = len(first[1])
+            deadline = time.perf_counter() + self.batch_wait
+            while len(batch) < self.batch_size and batch_bytes < self.batch_bytes:
+                try:
+                    job = self.__queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if job is None:
+                    # stopping, the batch still gets converted
+                    self.__queue.put(None)
+                    break
+                batch.append(job)
+                batch_bytes += len(job[1])
+            try:
+                future = self.__executor.submit(_convert_batch, [job[1:] for job in batch])
+            except RuntimeError as e:
+                # the pool is shut down
+                self.__finish_batch(batch, None, e)
+                continue
+            future.add_done_callback(lambda done, jobs=batch: self.__finish_batch(jobs, done))
+
+    def __finish_batch(self, batch: list, done, error=None):
+        # hands the results of a batch to the requests waiting for them
+        self.__free_workers.release()
+        if error is None:
+            error = done.exception()
+        results = done.result() if error is None else [None] * len(batch)
+        with self.__stats_lock:
+            self.stats["batches"] += 1
+            self.stats["batched_requests"] += len(batch)
+            self.stats["requests"] += len(batch)
+            self.stats["failed"] += sum(1 for result in results if result is None or result[4] is not None)
+        for (future, *_), result in zip(batch, results):
+            if result is None:
+                future.set_exception(error)
+                continue
+            body, content_type, timings, cached, message = result
+            future.set_result({"body": body, "content_type": content_type, "timings": timings,
+                               "batch_size": len(batch), "cached": cached, "error": message})
+
+    def __parse(self, key: str, value):
+        # turns a setting of the query into the value the generators take
+        if key in ("font_size", "terminal_width"):
+            number = int(value)
+            if number < 1:
+                raise ValueError(f'{key} has to be at least 1')
+            return number
+        if key in ("use_contrast", "invert_gradient", "match_shapes"):
+            return self.__parse_bool(key, value)
+        if key in ("background_color", "foreground_color"):
+            if isinstance(value, str):
+                value = value.strip().strip("()[]").split(",")
+            color = tuple(int(part) for part in value)
+            if len(color) != 3 or any(part < 0 or part > 255 for part in color):
+                raise ValueError(f'{key} has to be three numbers 0-255')
+            return color
+        if key == "effect":
+            if value is None or str(value).strip().lower() in ("", "none"):
+                return None
+            return Effect(int(value))
+        if not value:
+            raise ValueError(f'{key} cannot be empty')
+        return str(value)
+
+    @staticmethod
+    def __parse_bool(key: str, value) -> bool:
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() in ("1", "true", "yes", "y"):
+            return True
+        if str(value).lower() in ("0", "false", "no", "n"):
+            return False
+        raise ValueError(f'{key} has to be true or false')
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    # keeps the connection open between requests, which saves a TCP handshake for every image
+    protocol_version = "HTTP/1.1"
+    # the body is sent right after the headers, otherwise it waits for the client to acknowledge them (40 ms on Linux)
+    disable_nagle_algorithm = True
+    server_version = "imageToAscii"
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/health":
+            self.__send_json(200, self.server.service.get_health())
+        else:
+            self.__send_json(404, {"error": f'Unknown path {urlsplit(self.path).path}'})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        service = self.server.service
+        url = urlsplit(self.path)
+        if url.path != "/convert":
+            self.close_connection = True
+            self.__send_json(404, {"error": f'Unknown path {url.path}'})
+            return
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            self.close_connection = True
+            self.__send_json(411, {"error": "The image has to be sent with a Content-Length"})
+            return
+        if int(length) > service.max_body_bytes:
+            self.close_connection = True
+            self.__send_json(413, {"error": f'Images can have at most {service.max_body_bytes} bytes'})
+            return
+        data = self.rfile.read(int(length))
+        read_seconds = time.perf_counter() - start
+        try:
+            kind, settings = service.get_settings(parse_qs(url.query, keep_blank_values=True))
+        except ValueError as e:
+            self.__send_json(400, {"error": str(e)})
+            return
+        if not data:
+            self.__send_json(400, {"error": "The body holds no image"})
+            return
+
+        try:
+            result = service.submit(data, kind, settings).result(timeout=service.request_timeout)
+        except TimeoutError:
+            self.__send_json(504, {"error": "The conversion took too long"})
+            return
+        except Exception as e:
+            self.__send_json(500, {"error": f'{type(e).__name__}: {str(e).strip()}'})
+            return
+        timings = {"read": read_seconds}
+        timings.update(result["timings"])
+        total = time.perf_counter() - start
+        # time in the queue, waiting for the rest of the batch and moving the data to the worker and back
+        timings["queue"] = max(0.0, total - sum(timings.values()))
+        timings["total"] = total
+        headers = {"Server-Timing": ", ".join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in timings.items()),
+                   "X-Batch-Size": str(result["batch_size"]),
+                   "X-Generator-Cache": "hit" if result["cached"] else "miss"}
+        if result["error"] is not None:
+            self.__send_json(422, {"error": result["error"]}, headers)
+            return
+        self.__send(200, result["body"], result["content_type"], headers)
+
+    def __send_json(self, status: int, value: dict, headers=None):
+        self.__send(status, json.dumps(value).encode("utf-8"), "application/json", headers)
+
+    def __send(self, status: int, body: bytes, content_type: str, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# generators of the worker process, by their settings, the most recently used last
+_generators = OrderedDict()
+
+
+def _warm_up(settings: dict):
+    # runs once in every worker: converts a small image with the default settings, which loads the font and builds
+    # the glyph atlas, lookup tables and buffers before the first request needs them
+    # Ctrl+C reaches the workers as well, they are shut down by the service instead
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _, data = cv.imencode(".png", np.zeros((64, 64, 3), dtype=np.uint8))
+    _convert_job(data.tobytes(), "image", settings)
+
+
+def _convert_batch(jobs: list) -> list:
+    return [_convert_job(data, kind, settings) for data, kind, settings in jobs]
+
+
+def _convert_job(data: bytes, kind: str, settings: dict) -> tuple:
+    # returns (body, content type, seconds of every stage, whether the generator was cached, error message or None)
+    timings = {}
+    cached = False
+    try:
+        start = time.perf_counter()
+        if kind == "cmd":
+            image = Helper.decode_image(data, hsv=False)
+            timings["decode"] = time.perf_counter() - start
+            start = time.perf_counter()
+            text = CMDAsciiGenerator(image, **settings).convert()
+            timings["convert"] = time.perf_counter() - start
+            return text.encode("utf-8"), ConversionServer.kinds[kind], timings, cached, None
+
+        generator, cached = _get_generator(settings)
+        cells = ImageAsciiGenerator.load_cells(data, font_size=generator.text_size, cell_pixels=generator.cell_pixels,
+                                               color=settings.get("effect") == Effect.ORIGINAL_COLOR)
+        timings["decode"] = time.perf_counter() - start
+        start = time.perf_counter()
+        if kind == "image":
+            rendered = generator.render(cells)
+            timings["convert"] = time.perf_counter() - start
+            start = time.perf_counter()
+            output = io.BytesIO()
+            Image.fromarray(rendered).save(output, format="PNG")
+            body = output.getvalue()
+        else:
+            index_grid, colors, background_color = generator.get_text_cells(cells)
+            timings["convert"] = time.perf_counter() - start
+            start = time.perf_counter()
+            renderer = MarkupRenderer(generator.ascii_gradient, font_size=generator.text_size)
+            if kind == "html":
+                body = renderer.render_html(index_grid, colors, background_color).encode("utf-8")
+            else:
+                body = renderer.render_svg(index_grid, colors, background_color).encode("utf-8")
+        timings["encode"] = time.perf_counter() - start
+        return body, ConversionServer.kinds[kind], timings, cached, None
+    except Exception as e:
+        return b"", None, timings, cached, f'{type(e).__name__}: {str(e).strip()}'
+
+
+def _get_generator(settings: dict) -> tuple:
+    # returns the generator for the settings and whether it was made for an earlier request
+    key = tuple(sorted(settings.items()))
+    generator = _generators.pop(key, None)
+    cached = generator is not None
+    if generator is None:
+        # shape matching compares 4x4 parts of every cell, the feature shape of GlyphMatcher
+        cell_pixels = 4 if settings.get("match_shapes") else 1
+        generator = ImageAsciiGenerator(None, cell_pixels=cell_pixels, **settings)
+    _generators[key] = generator
+    while len(_generators) > ConversionServer.generator_cache_size:
+        _generators.popitem(last=False)
+    return generator, cached
@@ -0,0 +1,83 @@
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+
+class FrameCache:
+    """Class keeping the most recently rendered frames, found by a hash of the grids they were rendered from.
+
+    Title cards, paused scenes or black intros produce the same character and color grid for many frames in a row.
+    When a grid was already rendered, the stored frame is given back instead of drawing it again. The least recently
+    used frame is dropped when the cache is full.
+
+    Attributes
+    ----------
+    size: int
+        maximum amount of frames kept
+    hits: int
+        amount of lookups that found a stored frame
+    misses: int
+        amount of lookups that did not find a stored frame
+
+    Methods
+    -------
+    get_key(*arrays)
+        returns the hash of the given arrays
+    get(key)
+        returns the frame stored under the key or None
+    put(key, frame: np.array)
+        stores a read only copy of the frame under the key
+    """
+
+    def __init__(self, size=8):
+        """FrameCache constructor
+
+        :param size: maximum amount of frames kept
+        """
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.__frames = OrderedDict()
+
+    @staticmethod
+    def get_key(*arrays) -> bytes:
+        """Returns a hash of the content, shape and type of the given arrays
+
+        :param arrays: arrays (or values convertible to arrays) the frame was rendered from
+        :return: bytes: digest usable as the key of a frame
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            digest.update(f'{array.dtype.str}{np.shape(array)}'.encode())
+            digest.update(array.data)
+        return digest.digest()
+
+    def get(self, key: bytes):
+        """Returns the frame stored under the key and marks it as recently used. Counts the hit or miss
+
+        :param key: key made by get_key
+        :return: read only np.array or None when the frame is not stored
+        """
+        frame = self.__frames.get(key)
+        if frame is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__frames.move_to_end(key)
+        return frame
+
+    def put(self, key: bytes, frame: np.array) -> np.array:
+        """Stores a copy of the frame under the key, dropping the least recently used frame when full
+
+        :param key: key made by get_key
+        :param frame: rendered frame
+        :return: np.array: the stored read only copy
+        """
+        frame = frame.copy()
+        frame.setflags(write=False)
+        self.__frames[key] = frame
+        self.__frames.move_to_end(key)
+        while len(self.__frames) > self.size:
+            self.__frames.popitem(last=False)
+        return frame
@@ -0,0 +1,161 @@
+import time
+from abc import ABC, abstractmethod
+import cv2 as cv
+import numpy as np
+
+
+class FrameSource(ABC):
+    """Base class for everything CamToAscii can take frames from.
+
+    Sources give back BGR frames the same way cv.VideoCapture does, so a video file or generated frames can stand in
+    for the webcam in tests and benchmarks.
+
+    Methods
+    -------
+    read()
+        returns the next frame, None when there are no more frames
+    close()
+        releases the source
+    """
+
+    @abstractmethod
+    def read(self):
+        """Returns the next frame
+
+        :return: np.array: BGR frame or None when the source has no more frames
+        """
+
+    def close(self):
+        """Releases the source"""
+        pass
+
+
+class CameraSource(FrameSource):
+    """Frame source reading from a webcam.
+
+    Attributes
+    ----------
+    index: int
+        index of the camera for cv.VideoCapture
+    """
+
+    def __init__(self, index=0):
+        """CameraSource constructor. Opens the camera
+
+        :param index: index of the camera for cv.VideoCapture
+        """
+        self.index = index
+        self.__capture = cv.VideoCapture(index)
+        if not self.__capture.isOpened():
+            raise Exception("Cannot open camera")
+
+    def read(self):
+        ret, frame = self.__capture.read()
+        if not ret:
+            raise Exception("Couldn't load the camera stream")
+        return frame
+
+    def close(self):
+        self.__capture.release()
+
+
+class VideoFileSource(FrameSource):
+    """Frame source reading a video file, optionally as fast as the video plays.
+
+    Attributes
+    ----------
+    path: str
+        path to the video file
+    realtime: bool
+        waits between frames so they come at the frame rate of the video, like from a camera
+    loop: bool
+        starts from the beginning again when the video ends
+    fps: float
+        frame rate of the video, 0 when unknown
+    """
+
+    def __init__(self, path: str, realtime=True, loop=False):
+        """VideoFileSource constructor. Opens the video
+
+        :param path: path to the video file
+        :param realtime: gives the frames at the frame rate of the video instead of as fast as possible
+        :param loop: starts from the beginning again when the video ends
+        """
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.__capture = cv.VideoCapture(path)
+        if not self.__capture.isOpened():
+            raise Exception(f'Cannot open video {path}')
+        self.fps = self.__capture.get(cv.CAP_PROP_FPS)
+        self.__frame_time = 1 / self.fps if self.fps > 0 else 0
+        self.__next_time = None
+
+    def read(self):
+        ret, frame = self.__capture.read()
+        if not ret and self.loop:
+            self.__capture.set(cv.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.__capture.read()
+        if not ret:
+            return None
+        if self.realtime:
+            self.__next_time = _wait_until(self.__next_time, self.__frame_time)
+        return frame
+
+    def close(self):
+        self.__capture.release()
+
+
+class SyntheticSource(FrameSource):
+    """Frame source generating moving gradient frames, for running the webcam conversion without a camera.
+
+    Attributes
+    ----------
+    width: int
+        width of the frames
+    height: int
+        height of the frames
+    fps: float
+        rate at which the frames are given, None gives them as fast as possible
+    frames: int
+        amount of frames to give before ending, None never ends
+    """
+
+    def __init__(self, width=640, height=480, fps=30, frames=None):
+        """SyntheticSource constructor
+
+        :param width: width of the frames
+        :param height: height of the frames
+        :param fps: rate at which the frames are given, None gives them as fast as possible
+        :param frames: amount of frames to give before ending, None never ends
+        """
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frames = frames
+        self.__count = 0
+        self.__next_time = None
+        rows, cols = np.mgrid[0:height, 0:width]
+        self.__base = np.stack([cols * 255 // max(1, width - 1), rows * 255 // max(1, height - 1),
+                                (cols + rows) % 256], axis=-1).astype(np.uint8)
+
+    def read(self):
+        if self.frames is not None and self.__count >= self.frames:
+            return None
+        if self.fps:
+            self.__next_time = _wait_until(self.__next_time, 1 / self.fps)
+        # the pattern moves a few pixels every frame, so consecutive frames differ like a camera image does
+        frame = np.roll(self.__base, shift=3 * self.__count, axis=1)
+        self.__count += 1
+        return frame
+
+
+def _wait_until(next_time, frame_time: float) -> float:
+    # sleeps until next_time and returns the time the frame after should come at
+    now = time.perf_counter()
+    if next_time is None or now - next_time > frame_time:
+        # first frame, or too far behind to catch up
+        return now + frame_time
+    if next_time > now:
+        time.sleep(next_time - now)
+    return next_time + frame_time
@@ -0,0 +1,208 @@
+import math
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+
+class GlyphAtlas:
+    """Class holding every character of a gradient rasterized once, cut into cell sized alpha blocks.
+
+    A cell is the area of the final image belonging to one pixel of the resized image. Characters can be drawn
+    several times in a cell (the generators write every character twice) and glyphs are allowed to reach into the
+    neighbouring cells. The part of a glyph that falls into a neighbouring cell is stored as its own block, so the
+    whole image can be built with a handful of NumPy operations instead of one font rasterization per character.
+
+    Attributes
+    ----------
+    gradient: str
+        characters stored in the atlas, index in the string is the index used in the index grid
+    cell_width: int
+        width of one cell in pixels
+    cell_height: int
+        height of one cell in pixels
+    blocks: np.array
+        alpha masks with values 0-1 and shape (block rows, block cols, len(gradient), cell_height, cell_width)
+    block_origin: tuple[2]
+        position of the block belonging to the cell the character is drawn in
+    draw_order: list[tuple]
+        block positions ordered so that the characters overlap the same way as when drawn one by one
+
+    Methods
+    -------
+    get(font_path: str, font_size: int, gradient: str, cell_width: int, cell_height: int, char_offsets: tuple)
+        returns cached atlas for the given font, size, gradient and cell layout
+    get_work_shape(grid_shape: tuple)
+        returns the shape of the float array compose works in
+    compose(index_grid: np.array, colors, background_color: tuple, canvas_size: tuple, out=None, work=None)
+        builds the final RGB image out of the index grid and colors
+    update(index_grid: np.array, colors, background_color: tuple, changed: np.array, out: np.array, work: np.array)
+        redraws only the changed cells of an image built by compose
+    """
+
+    def __init__(self, font: ImageFont.FreeTypeFont, gradient: str, cell_width: int, cell_height: int,
+                 char_offsets=(0,)):
+        """GlyphAtlas constructor. Rasterizes all the characters of the gradient.
+
+        :param font: font used for the rasterization
+        :param gradient: characters to rasterize
+        :param cell_width: width of one cell in pixels
+        :param cell_height: height of one cell in pixels
+        :param char_offsets: x positions inside the cell where the character is drawn (can be fractional)
+        """
+        self.gradient = gradient
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+
+        # glyphs can go outside of their cell, so rasterize them with a generous padding around
+        pad = 2 * max(font.size, cell_width, cell_height)
+        tile_size = (cell_width + 2 * pad, cell_height + 2 * pad)
+        tiles = np.zeros((len(gradient), tile_size[1], tile_size[0]), dtype=np.uint8)
+        for i, char in enumerate(gradient):
+            tile = Image.new(mode="L", size=tile_size, color=0)
+            draw = ImageDraw.Draw(tile)
+            for offset in char_offsets:
+                draw.text((pad + offset, pad), char, font=font, fill=255)
+            tiles[i] = np.array(tile)
+
+        # find out how many cells the glyphs reach into in each direction
+        ink_rows = np.nonzero(tiles.any(axis=(0, 2)))[0]
+        ink_cols = np.nonzero(tiles.any(axis=(0, 1)))[0]
+        if len(ink_rows) == 0:
+            top = bottom = left = right = 0
+        else:
+            top = max(0, math.ceil((pad - ink_rows[0]) / cell_height))
+            bottom = max(0, math.ceil((ink_rows[-1] + 1 - pad - cell_height) / cell_height))
+            left = max(0, math.ceil((pad - ink_cols[0]) / cell_width))
+            right = max(0, math.ceil((ink_cols[-1] + 1 - pad - cell_width) / cell_width))
+
+        block_rows = top + 1 + bottom
+        block_cols = left + 1 + right
+        tiles = tiles[:, pad - top * cell_height:pad + (bottom + 1) * cell_height,
+                      pad - left * cell_width:pad + (right + 1) * cell_width]
+        blocks = tiles.reshape(len(gradient), block_rows, cell_height, block_cols, cell_width)
+        self.blocks = np.ascontiguousarray(blocks.transpose(1, 3, 0, 2, 4), dtype=np.float32) / 255
+        self.block_origin = (top, left)
+
+        # a cell is covered by the blocks of its neighbours. Drawing characters row by row, left to right, means
+        # the block coming from the cell furthest up and left is drawn first, so go from the bottom right block
+        self.draw_order = [(row, col) for row in range(block_rows - 1, -1, -1) for col in range(block_cols - 1, -1, -1)
+                           if self.blocks[row, col].any()]
+
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def get(font_path: str, font_size: int, gradient: str, cell_width: int, cell_height: int, char_offsets=(0,)):
+        """Returns the atlas for given arguments. Atlas is only created the first time, later calls reuse it
+
+        :param font_path: path or name of the font to load
+        :param font_size: size of the font
+        :param gradient: characters to rasterize
+        :param cell_width: width of one cell in pixels
+        :param cell_height: height of one cell in pixels
+        :param char_offsets: tuple of x positions inside the cell where the character is drawn
+        :return: GlyphAtlas
+        """
+        font = ImageFont.truetype(font_path, font_size)
+        return GlyphAtlas(font, gradient, cell_width, cell_height, char_offsets)
+
+    def get_work_shape(self, grid_shape: tuple) -> tuple:
+        """Returns the shape of the float array compose draws in. It has additional cells around the grid for the
+        parts of glyphs going outside of the image
+
+        :param grid_shape: (rows, cols) of the index grid
+        :return: tuple: shape of the array
+        """
+        block_rows, block_cols = np.shape(self.blocks)[:2]
+        return (grid_shape[0] + block_rows - 1, self.cell_height, grid_shape[1] + block_cols - 1, self.cell_width, 3)
+
+    def compose(self, index_grid: np.array, colors, background_color: tuple, canvas_size: tuple, out=None,
+                work=None) -> np.array:
+        """Builds the final image out of the rasterized glyphs
+
+        :param index_grid: 2D array with index of the gradient character for each cell
+        :param colors: RGB color of the text. Either one color for all cells or array of shape (rows, cols, 3)
+        :param background_color: RGB color of the background
+        :param canvas_size: (width, height) of the final image. Cells not fitting into it are cut off
+        :param out: optional uint8 array of shape (height, width, 3) to write the result into
+        :param work: optional float32 array of shape get_work_shape(grid shape) to draw in
+        :return: np.array: RGB image of shape (height, width, 3) with dtype uint8
+        """
+        grid_rows, grid_cols = np.shape(index_grid)
+        colors = np.asarray(colors, dtype=np.float32)
+        if colors.ndim == 3:
+            colors = colors[:, :, None, None, :]
+
+        canvas = work
+        if canvas is None:
+            canvas = np.empty(self.get_work_shape((grid_rows, grid_cols)), dtype=np.float32)
+        canvas[:] = background_color
+        cells = canvas.transpose(0, 2, 1, 3, 4)
+        for row, col in self.draw_order:
+            alpha = self.blocks[row, col][index_grid][..., None]
+            target = cells[row:row + grid_rows, col:col + grid_cols]
+            target += (colors - target) * alpha
+
+        width, height = canvas_size
+        result = out
+        if result is None:
+            result = np.empty((height, width, 3), dtype=np.uint8)
+        result[:] = background_color
+        self.__copy_rows(canvas, result, 0, np.shape(canvas)[0])
+        return result
+
+    def update(self, index_grid: np.array, colors, background_color: tuple, changed: np.array, out: np.array,
+               work: np.array) -> np.array:
+        """Redraws only the cells affected by the changed characters. The out and work arrays have to hold the result
+        of the previous compose (or update) for a grid of the same shape with the same background color
+
+        :param index_grid: 2D array with index of the gradient character for each cell
+        :param colors: RGB color of the text. Either one color for all cells or array of shape (rows, cols, 3)
+        :param background_color: RGB color of the background
+        :param changed: 2D bool array marking the cells whose character or color changed
+        :param out: uint8 array with the previous result, the changed cells are redrawn in it
+        :param work: float32 array the previous result was drawn in
+        :return: np.array: out with the changed cells redrawn
+        """
+        grid_rows, grid_cols = np.shape(index_grid)
+        cells = work.transpose(0, 2, 1, 3, 4)
+        # a cell of the canvas has to be redrawn when any of the characters reaching into it changed
+        affected = np.zeros(np.shape(cells)[:2], dtype=bool)
+        for row, col in self.draw_order:
+            affected[row:row + grid_rows, col:col + grid_cols] |= changed
+        cell_rows, cell_cols = np.nonzero(affected)
+        if len(cell_rows) == 0:
+            return out
+
+        # the cells are drawn again from the background, with the same steps compose does for the whole canvas
+        colors = np.asarray(colors, dtype=np.float32)
+        values = np.empty((len(cell_rows), self.cell_height, self.cell_width, 3), dtype=np.float32)
+        values[:] = background_color
+        for row, col in self.draw_order:
+            source_rows = cell_rows - row
+            source_cols = cell_cols - col
+            inside = np.nonzero((source_rows >= 0) & (source_rows < grid_rows) &
+                                (source_cols >= 0) & (source_cols < grid_cols))[0]
+            source_rows = source_rows[inside]
+            source_cols = source_cols[inside]
+            alpha = self.blocks[row, col][index_grid[source_rows, source_cols]][..., None]
+            if colors.ndim == 3:
+                color = colors[source_rows, source_cols][:, None, None, :]
+            else:
+                color = colors
+            target = values[inside]
+            values[inside] = target + (color - target) * alpha
+        cells[cell_rows, cell_cols] = values
+
+        self.__copy_rows(work, out, cell_rows[0], cell_rows[-1] + 1)
+        return out
+
+    def __copy_rows(self, work: np.array, out: np.array, first_cell_row: int, last_cell_row: int):
+        # rounds the cell rows first_cell_row:last_cell_row of the work array into out, leaving out the padding cells
+        top, left = self.block_origin
+        work = work.reshape(np.shape(work)[0] * self.cell_height, np.shape(work)[2] * self.cell_width, 3)
+        work = work[top * self.cell_height:, left * self.cell_width:]
+        height, width = np.shape(out)[:2]
+        first_row = max(0, (first_cell_row - top) * self.cell_height)
+        last_row = min(height, np.shape(work)[0], (last_cell_row - top) * self.cell_height)
+        fit_width = min(width, np.shape(work)[1])
+        if first_row < last_row:
+            out[first_row:last_row, :fit_width] = work[first_row:last_row, :fit_width] + 0.5
@@ -0,0 +1,91 @@
+from functools import lru_cache
+import cv2 as cv
+import numpy as np
+from generators.GlyphAtlas import GlyphAtlas
+
+
+class GlyphMatcher:
+    """Class picking characters by their shape instead of only by the brightness of the cell.
+
+    Every glyph of a GlyphAtlas is scaled down once to a small grid of ink coverages (its feature vector). A cell of
+    the image is scaled down to the same grid and gets the glyph closest to it, so a dark line through a bright cell
+    picks a character with a line in the same place. The distance also weighs the difference of the mean brightness,
+    which keeps the overall tones close to the brightness-only mapping. All the cells of a frame are matched with one
+    matrix multiplication.
+
+    Attributes
+    ----------
+    feature_shape: tuple[2]
+        (rows, cols) of the grid every glyph and cell is scaled down to
+    features: np.array
+        ink coverage of every glyph with shape (len(gradient), rows * cols), scaled so the densest glyph has mean 1
+    tone_weight: float
+        weight of the mean brightness difference compared to the difference of the shapes
+
+    Methods
+    -------
+    get(font_path: str, font_size: int, gradient: str, cell_width: int, cell_height: int, char_offsets: tuple,
+        feature_shape=(4, 4))
+        returns cached matcher for the given font, size, gradient and cell layout
+    match(value: np.array, grid_shape: tuple)
+        returns the index grid of the glyphs best matching the cells of the image
+    """
+
+    tone_weight = 1.0
+
+    def __init__(self, atlas: GlyphAtlas, feature_shape=(4, 4)):
+        """GlyphMatcher constructor. Computes the feature vectors of all the glyphs in the atlas
+
+        :param atlas: rasterized glyphs to match against
+        :param feature_shape: (rows, cols) of the grid the glyphs and cells are compared on
+        """
+        self.feature_shape = tuple(feature_shape)
+        rows, cols = self.feature_shape
+        # only the part of the glyph inside its own cell is compared, the parts reaching into neighbours are not
+        glyphs = atlas.blocks[atlas.block_origin]
+        features = np.stack([cv.resize(glyph, (cols, rows), interpolation=cv.INTER_AREA) for glyph in glyphs])
+        features = features.reshape(len(glyphs), rows * cols).astype(np.float32)
+        densest = features.mean(axis=1).max()
+        if densest > 0:
+            features /= densest
+        self.features = features
+
+        # |p - g|^2 + w * n * (mean(p) - mean(g))^2 only depends on the glyph through -2 p . (g + w * mean(g)) and
+        # |g|^2 + w * n * mean(g)^2, so matching is one product of the cells with the weights plus a bias per glyph
+        means = features.mean(axis=1)
+        self.__weights = np.ascontiguousarray((features + self.tone_weight * means[:, None]).T)
+        self.__bias = (features ** 2).sum(axis=1) + self.tone_weight * rows * cols * means ** 2
+
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def get(font_path: str, font_size: int, gradient: str, cell_width: int, cell_height: int, char_offsets=(0,),
+            feature_shape=(4, 4)):
+        """Returns the matcher for given arguments. It is only created the first time, later calls reuse it
+
+        :param font_path: path or name of the font to load
+        :param font_size: size of the font
+        :param gradient: characters to match against
+        :param cell_width: width of one cell in pixels
+        :param cell_height: height of one cell in pixels
+        :param char_offsets: tuple of x positions inside the cell where the character is drawn
+        :param feature_shape: (rows, cols) of the grid the glyphs and cells are compared on
+        :return: GlyphMatcher
+        """
+        atlas = GlyphAtlas.get(font_path, font_size, gradient, cell_width, cell_height, char_offsets)
+        return GlyphMatcher(atlas, feature_shape)
+
+    def match(self, value: np.array, grid_shape: tuple) -> np.array:
+        """Finds the best matching glyph for every cell
+
+        :param value: 2D array with the brightness (0-255) of the whole image
+        :param grid_shape: (rows, cols) of the index grid, the image is split into this many cells
+        :return: np.array: 2D array with the index of the best matching gradient character of every cell
+        """
+        grid_rows, grid_cols = grid_shape
+        rows, cols = self.feature_shape
+        # area averaging gives every feature the mean brightness of its part of the cell
+        scaled = cv.resize(value, (grid_cols * cols, grid_rows * rows), interpolation=cv.INTER_AREA)
+        cells = scaled.reshape(grid_rows, rows, grid_cols, cols).transpose(0, 2, 1, 3)
+        cells = cells.reshape(grid_rows * grid_cols, rows * cols).astype(np.float32) / 255
+        distances = self.__bias - 2 * (cells @ self.__weights)
+        return np.argmin(distances, axis=1).reshape(grid_rows, grid_cols)
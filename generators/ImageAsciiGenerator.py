@@ -2,9 +2,13 @@ import numpy as np
 import cv2 as cv
 from PIL import Image, ImageFont, ImageDraw
 import math
+from functools import lru_cache
 from helper import Helper
-from io import StringIO
 from Effect import Effect
+from RenderBackend import RenderBackend
+from instrumentation import Instrumentation
+from generators.GlyphAtlas import GlyphAtlas
+from generators.GlyphMatcher import GlyphMatcher
 
 
 # some gradients to play with
@@ -36,22 +40,71 @@ class ImageAsciiGenerator:
         Represents the text color of the final text image
     ascii_gradient: str
         A text brightness gradient given as a string
+    invert_gradient: bool
+        Whether the gradient was reversed, so dark parts of the image get the dense characters
+    backend: RenderBackend
+        Decides how the text is drawn onto the final image
+    incremental: bool
+        Whether render only redraws the cells that changed since the previous call (atlas backend only)
+    render_stats: dict
+        Amount of changed and total cells of the last incremental render
+    frame_cache: FrameCache
+        Recently rendered images found by their character and color grids, None to always draw (atlas backend only)
+    instrumentation: Instrumentation
+        Collects the time spent in every stage of the conversion
+    match_shapes: bool
+        Whether the characters are picked by the shape of the cell (see GlyphMatcher) instead of only its brightness
+    cell_pixels: int
+        Size of one cell in pixels of the given images, the font size unless the images come already scaled down
+    strip: tuple
+        (first row, total rows) of the text grid when the images are horizontal strips of a bigger image, None
+        otherwise. Rainbow effects then continue across the strips and the plain layout draws every row of a strip whole
 
     Methods
     -------
+    from_file(filename: str, font_size=8, effect=None, match_shapes=False, **settings)
+        Returns a generator for the image file, loaded already scaled down to the text grid
+    load_cells(source, font_size=8, cell_pixels=1, color=False)
+        Loads an image file or its bytes scaled down to cell_pixels for every cell of the text grid
     convert()
         Converts the original image into the text image and returns it back as a PIL image
+    render(image: np.array)
+        Converts given image into the text image and returns it as RGB array, reusing buffers between calls
+    get_cells(image: np.array)
+        Returns the index grid and the color of every cell without drawing anything
+    render_cells(index_grid: np.array, cells=None)
+        Draws cells returned by get_cells earlier and returns the text image as RGB array
+    get_text_cells(image: np.array)
+        Returns the index grid with the text and background colors it would be drawn with, without drawing anything
+    get_strip_margin()
+        Returns how many rows of cells above and below a strip reach into it with their glyphs
     """
 
     height_width_ratio = 2
     result = None
     effect_lookup = None
+    index_grid = None
+    render_stats = None
+    strip = None
+    # share of changed cells above which the incremental render draws the whole image again
+    full_redraw_ratio = 0.5
+    # effects that only depend on the position in the image, mapped to the method generating them and its reverse flag
+    geometric_effects = {
+        Effect.RAINBOW_HORIZONTAL: ("generate_horizontal_rainbow_array", False),
+        Effect.RAINBOW_HORIZONTAL_REV: ("generate_horizontal_rainbow_array", True),
+        Effect.RAINBOW_VERTICAL: ("generate_vertical_rainbow_array", False),
+        Effect.RAINBOW_VERTICAL_REV: ("generate_vertical_rainbow_array", True),
+        Effect.RAINBOW_RADIAL: ("generate_radial_rainbow_array", False),
+        Effect.RAINBOW_RADIAL_REV: ("generate_radial_rainbow_array", True),
+    }
 
     def __init__(self, image: np.array, font_size=8, ascii_gradient=' .-;+=xX$█', use_contrast=False,
-                 background_color=(66, 5, 5), foreground_color=(164, 255, 45), invert_gradient=False, effect=None):
+                 background_color=(66, 5, 5), foreground_color=(164, 255, 45), invert_gradient=False, effect=None,
+                 backend=RenderBackend.ATLAS, font_path="lucon.ttf", incremental=False,
+                 frame_cache=None, instrumentation=None, match_shapes=False, cell_pixels=None):
         """ImageAsciiGenerator constructor.
 
-        :param image: original image to be converted
+        :param image: original image to be converted (in HSV, or a 2D array with only its brightness)
         :param font_size: size of the text to use in the final image
         :param ascii_gradient: brightness gradient of text which the pixels are mapped to
         :param use_contrast: Chooses whether to use higher method for higher contrast
@@ -59,15 +112,27 @@ class ImageAsciiGenerator:
         :param foreground_color: Color of the text in the final image
         :param invert_gradient: Whether to reverse the gradient
         :param effect: specific effect to put on the image (can overwrite the color parameters)
+        :param backend: how to draw the text onto the final image
+        :param font_path: path or name of the monospace font to use
+        :param incremental: makes render redraw only the cells that changed since the previous call
+        :param frame_cache: FrameCache giving back already rendered images for repeated grids. Do not share it between
+            generators with different fonts or gradients
+        :param instrumentation: Instrumentation recording the time of every stage, nothing is recorded when None
+        :param match_shapes: picks the character whose glyph looks most like the cell instead of only going by
+            brightness
+        :param cell_pixels: size of one cell in pixels of the given images. The font size when None, 1 for images
+            already scaled down to one pixel per cell
         """
         self.text_size = font_size
+        self.invert_gradient = invert_gradient
         if invert_gradient:
             self.ascii_gradient = ascii_gradient[::-1]
         else:
             self.ascii_gradient = ascii_gradient
         # monospace fonts: consolaz, cour, lucon
-        self.text_font = ImageFont.truetype("lucon.ttf", self.text_size)
-        self.width_divisor = self.text_size
+        self.text_font = ImageFont.truetype(font_path, self.text_size)
+        self.cell_pixels = cell_pixels if cell_pixels is not None else self.text_size
+        self.width_divisor = self.cell_pixels
         self.height_divisor = self.width_divisor
         self.image = image
         self.image_dimensions = np.shape(self.image)
@@ -75,104 +140,274 @@ class ImageAsciiGenerator:
         self.bg_color = background_color
         self.fg_color = foreground_color
         self.effect = effect
-        if len(ascii_gradient) < 2:
-            self.divider = 9999
+        self.backend = backend
+        self.incremental = incremental
+        self.frame_cache = frame_cache
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
+        self.match_shapes = match_shapes
+        # rounds the brightness to the closest character, CMDAsciiGenerator floors it instead
+        self.gradient_lookup = Helper.get_gradient_lookup(len(self.ascii_gradient), rounding=True)
+        # arrays used by the atlas backend, kept between calls of render
+        self.__work_buffer = None
+        self.__output_buffer = None
+        self.__previous_cells = None
+
+    @staticmethod
+    def from_file(filename: str, font_size=8, effect=None, match_shapes=False, **settings):
+        """Returns a generator for an image file. The image is decoded at a reduced size when the cells are big enough
+        (JPEG decoders average 8x8 blocks themselves), then cut to whole cells and scaled down to the text grid with
+        area averaging before anything else (see Helper.downscale_image). The colors are only converted when the
+        original color effect needs them, otherwise only the brightness of the small image is computed
+
+        :param filename: path to the image
+        :param font_size: size of the text to use in the final image
+        :param effect: specific effect to put on the image
+        :param match_shapes: picks the character whose glyph looks most like the cell
+        :param settings: any other arguments of the constructor, except image and cell_pixels
+        :return: ImageAsciiGenerator: generator ready to convert the image
+        """
+        # shape matching compares 4x4 parts of every cell, the feature shape of GlyphMatcher
+        cell_pixels = 4 if match_shapes else 1
+        image = ImageAsciiGenerator.load_cells(filename, font_size=font_size, cell_pixels=cell_pixels,
+                                               color=effect == Effect.ORIGINAL_COLOR)
+        return ImageAsciiGenerator(image, font_size=font_size, effect=effect, match_shapes=match_shapes,
+                                   cell_pixels=cell_pixels, **settings)
+
+    @staticmethod
+    def load_cells(source, font_size=8, cell_pixels=1, color=False) -> np.array:
+        """Loads an image scaled down to cell_pixels pixels for every cell, the way from_file does
+
+        :param source: path to the image, or the bytes of an image file
+        :param font_size: size of the text the image is converted to, the size of a cell in pixels of the image
+        :param cell_pixels: size of a cell in the returned image, 4 for shape matching and 1 otherwise
+        :param color: returns the image in HSV, False returns only its brightness
+        :return: np.array: the scaled down image, for a generator made with the same cell_pixels
+        """
+        try:
+            with Helper.open_image(source) as header:
+                jpeg = header.format == "JPEG"
+                width, height = header.size
+        except OSError:
+            # formats only OpenCV reads are decoded at full size
+            jpeg = False
+        # only JPEG decoders reduce the size themselves, OpenCV resizes other formats after decoding them whole
+        reduction = Helper.get_reduction(font_size, cell_pixels) if jpeg else 1
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            image = Helper.decode_image(source, hsv=False, reduction=reduction)
         else:
-            self.divider = 255 / (len(self.ascii_gradient)-1)
+            image = Helper.load_image(source, hsv=False, reduction=reduction)
+        decoded_height, decoded_width = np.shape(image)[:2]
+        if reduction == 1:
+            width, height = decoded_width, decoded_height
+        elif (decoded_width, decoded_height) != (math.ceil(width / reduction), math.ceil(height / reduction)):
+            # OpenCV turns JPEGs by their EXIF orientation, the header has the size before turning
+            width, height = height, width
+        # the grid comes from the full size, the reduced size is rounded up and would add a partial cell
+        cols, rows = max(1, width // font_size), max(1, height // font_size)
+        cell = font_size // reduction
+        # only whole cells are converted, the pixels past the last of them are left out
+        image = image[:rows * cell, :cols * cell]
+        return Helper.downscale_image(image, (cols * cell_pixels, rows * cell_pixels), color=color)
 
     def convert(self) -> Image:
         """Main function of the ImageAsciiGenerator Class
 
         :returns: Image: final image in PIL format
         """
-        resized = self.__adjust_image()
-        final_txt = self.__pixels_to_txt(resized)
-        self.get_color_array(resized)
-        if self.effect is not None:
-            self.result = self.__draw_text_on_img_effect(final_txt)
+        if self.backend == RenderBackend.ATLAS:
+            rendered = self.render(self.image)
+            with self.instrumentation.stage("to_image"):
+                self.result = Image.fromarray(rendered)
             return self.result
 
-        if self.use_contrast:
-            self.result = self.__draw_text_on_img_with_contrast(final_txt)
-            return self.result
-        else:
-            self.result = self.__draw_text_on_img(final_txt)
-            return self.result
+        self.__prepare_cells()
+        with self.instrumentation.stage("pixels_to_txt"):
+            final_txt = self.__pixels_to_txt()
+
+        with self.instrumentation.stage("draw"):
+            if self.effect is not None:
+                self.result = self.__draw_text_on_img_effect(final_txt)
+            elif self.use_contrast:
+                self.result = self.__draw_text_on_img_with_contrast(final_txt)
+            else:
+                self.result = self.__draw_text_on_img(final_txt)
+        return self.result
+
+    def render(self, image: np.array) -> np.array:
+        """Converts given image into the text image. The font, lookup tables, effect arrays and output buffer are
+        reused from the previous calls, so converting frames of the same size costs no setup
+
+        :param image: image to be converted (in HSV)
+        :returns: np.array: final image in RGB. The array is overwritten by the next call, copy it to keep it. With a
+            frame cache the read only array stored in the cache is returned instead, which never changes
+        """
+        self.image = image
+        self.image_dimensions = np.shape(image)
+        if self.backend != RenderBackend.ATLAS:
+            result = self.convert()
+            with self.instrumentation.stage("to_array"):
+                return np.array(result)
+
+        self.__prepare_cells()
+        with self.instrumentation.stage("draw"):
+            return self.__draw_text_with_atlas()
+
+    def get_cells(self, image: np.array) -> tuple:
+        """Finds the character and color of every cell of the image, without drawing the text. The cells can be drawn
+        later (with other colors, effect or font size) by render_cells
+
+        :param image: image to be converted (in HSV)
+        :returns: tuple: index grid of the gradient characters and HSV color of every cell (the resized image)
+        """
+        self.image = image
+        self.image_dimensions = np.shape(image)
+        resized = self.__prepare_cells()
+        return self.index_grid, resized
+
+    def render_cells(self, index_grid: np.array, cells=None) -> np.array:
+        """Draws cells found earlier by get_cells. Only the atlas backend can draw them, as the other one draws from
+        the image
+
+        :param index_grid: 2D array with index of the gradient character for each cell
+        :param cells: HSV color of every cell, only needed by the original color effect
+        :returns: np.array: final image in RGB, reused by the next call the same way as by render
+        """
+        if self.backend != RenderBackend.ATLAS:
+            raise ValueError("Only the atlas backend can draw cells")
+        if cells is None and self.effect == Effect.ORIGINAL_COLOR:
+            raise ValueError("The original color effect needs the colors of the cells")
+        self.index_grid = index_grid
+        # size of an image that would give this grid, the plain text layout takes its height from it
+        rows, cols = np.shape(index_grid)
+        self.image_dimensions = (rows * self.height_divisor, cols * self.width_divisor, 3)
+        with self.instrumentation.stage("color_array"):
+            self.get_color_array(cells if cells is not None else np.empty(np.shape(index_grid) + (3,), np.uint8))
+        with self.instrumentation.stage("draw"):
+            return self.__draw_text_with_atlas()
+
+    def get_text_cells(self, image: np.array) -> tuple:
+        """Finds the character of every cell and the colors it would be drawn with, for writing the text into other
+        formats than images (see MarkupRenderer)
+
+        :param image: image to be converted (in HSV)
+        :returns: tuple: index grid, text color (one RGB color, or an array with the RGB color of every cell) and RGB
+            background color
+        """
+        self.image = image
+        self.image_dimensions = np.shape(image)
+        self.__prepare_cells()
+        colors, background_color = self.__get_cell_colors()
+        return self.index_grid, colors, background_color
+
+    def get_strip_margin(self) -> tuple:
+        """Returns how many rows of cells around a strip of the text grid have glyphs reaching into it. A strip drawn
+        together with these rows looks the same as that part of the whole image
+
+        :returns: tuple: rows above and rows below the strip
+        """
+        atlas = GlyphAtlas.get(self.text_font.path, self.text_size, self.ascii_gradient, *self.__get_cell_layout())
+        # glyphs reach block_origin[0] cells up, and the rest of the block rows down
+        reach_up = atlas.block_origin[0]
+        return np.shape(atlas.blocks)[0] - 1 - reach_up, reach_up
+
+    def __prepare_cells(self) -> np.array:
+        # resizes the image and finds the character and color of every cell, returns the resized image
+        with self.instrumentation.stage("adjust_image"):
+            resized = self.__adjust_image()
+        # the effect is settled first, the layout of the glyphs matched against depends on it
+        with self.instrumentation.stage("color_array"):
+            self.get_color_array(resized)
+        with self.instrumentation.stage("index_grid"):
+            if self.match_shapes:
+                # compares the cells of the full image with the glyphs, so details smaller than a cell are kept
+                value = self.__get_value(self.image)
+                if self.invert_gradient:
+                    # the matcher takes ink for brightness, with the inverted gradient the ink stands for the dark
+                    value = 255 - value
+                self.index_grid = self.__get_matcher().match(value, np.shape(resized)[:2])
+            else:
+                # maps the brightness of every pixel to the index of a gradient character
+                self.index_grid = self.gradient_lookup[self.__get_value(resized)]
+        return resized
+
+    @staticmethod
+    def __get_value(image: np.array) -> np.array:
+        # brightness of the image, which is either HSV or only the brightness already
+        return image if np.ndim(image) == 2 else image[:, :, 2]
 
     def get_color_array(self, adjusted_img: np.array):
         img_shape = np.shape(adjusted_img)
-        if self.effect == Effect.RAINBOW_HORIZONTAL:
-            self.effect_lookup = self.generate_horizontal_rainbow_array(img_shape, False)
-        elif self.effect == Effect.RAINBOW_HORIZONTAL_REV:
-            self.effect_lookup = self.generate_horizontal_rainbow_array(img_shape, True)
-        elif self.effect == Effect.RAINBOW_VERTICAL:
-            self.effect_lookup = self.generate_vertical_rainbow_array(img_shape, False)
-        elif self.effect == Effect.RAINBOW_VERTICAL_REV:
-            self.effect_lookup = self.generate_vertical_rainbow_array(img_shape, True)
-        elif self.effect == Effect.RAINBOW_RADIAL:
-            self.effect_lookup = self.generate_radial_rainbow_array(img_shape, False)
-        elif self.effect == Effect.RAINBOW_RADIAL_REV:
-            self.effect_lookup = self.generate_radial_rainbow_array(img_shape, True)
+        if self.effect in self.geometric_effects:
+            # rainbow effects only depend on the size of the image, so they are computed once for every size
+            if self.strip is None:
+                self.effect_lookup = self.get_effect_array(self.effect, img_shape[:2])
+            else:
+                first_row, total_rows = self.strip
+                self.effect_lookup = self.get_effect_array(self.effect, (total_rows, img_shape[1]),
+                                                           (first_row, first_row + img_shape[0]))
         elif self.effect == Effect.ORIGINAL_COLOR:
+            if np.ndim(adjusted_img) != 3:
+                raise ValueError("The original color effect needs images with colors")
             self.effect_lookup = self.generate_original_color_array(img_shape, adjusted_img, False)
         else:
             self.effect = None
-    def generate_original_color_array(self, array_shape: tuple, adjusted_img: np.array, reverse: bool):
-        width = array_shape[1]
-        height = array_shape[0]
-        effect_array = np.zeros(array_shape, dtype=int)
-        for row in range(height):
-            for col in range(width):
-                if not reverse:
-                    pixel_color = adjusted_img[row, col]
-                    effect_array[row, col] = [int(pixel_color[0]), int(pixel_color[1]), int(pixel_color[2])]
-                else:
-                    pixel_color = adjusted_img[row, col]
-                    effect_array[row, col] = [255 - int(pixel_color[0]), 255 - int(pixel_color[1]), 255 - int(pixel_color[2])]
-        return effect_array
 
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def get_effect_array(effect: Effect, array_shape: tuple, row_range=None) -> np.array:
+        """Returns the hue array of a rainbow effect. Arrays are cached by effect and shape, so they are only computed
+        the first time, which matters for videos where every frame has the same shape
 
-    def generate_radial_rainbow_array(self, array_shape: tuple, reverse: bool):
-        width = array_shape[1]
-        height = array_shape[0]
-        effect_array = np.zeros((height, width))
-        for row in range(height):
-            for col in range(width):
-                center = (height // 2, width // 2)
-                max_distance = math.ceil(math.sqrt((center[0] ** 2) + (center[1] ** 2)))
-
-                distance = abs(center[0] - row) ** 2 + abs(center[1] - col) ** 2
-                distance = math.sqrt(distance)
-                center_closeness = (max_distance - distance) / max_distance
-                if not reverse:
-                    effect_array[row, col] = min(math.floor(center_closeness * 180), 180)
-                else:
-                    effect_array[row, col] = 180 - min(math.floor(center_closeness * 180), 180)
+        :param effect: one of the rainbow effects
+        :param array_shape: (height, width) of the array
+        :param row_range: (start, stop) of the rows to compute, for a strip of the image. All rows when None
+        :return: read only array of hues
+        """
+        method_name, reverse = ImageAsciiGenerator.geometric_effects[effect]
+        effect_array = getattr(ImageAsciiGenerator, method_name)(array_shape, reverse, row_range)
+        effect_array.setflags(write=False)
+        return effect_array
+
+    @staticmethod
+    def generate_original_color_array(array_shape: tuple, adjusted_img: np.array, reverse: bool):
+        effect_array = np.asarray(adjusted_img, dtype=int)
+        if reverse:
+            effect_array = 255 - effect_array
         return effect_array
 
-    def generate_horizontal_rainbow_array(self, array_shape: tuple, reverse: bool):
+    @staticmethod
+    def generate_radial_rainbow_array(array_shape: tuple, reverse: bool, row_range=None):
         width = array_shape[1]
         height = array_shape[0]
-        effect_array = np.zeros((height, width))
-        for row in range(height):
-            for col in range(width):
-                if not reverse:
-                    effect_array[row, col] = math.floor((180 / width) * col)
-                else:
-                    effect_array[row, col] = 180 - math.floor((180 / width) * col)
+        center = (height // 2, width // 2)
+        max_distance = math.ceil(math.sqrt((center[0] ** 2) + (center[1] ** 2)))
+
+        rows = np.arange(*(row_range or (0, height)))[:, None]
+        cols = np.arange(width)[None, :]
+        distance = np.sqrt(np.abs(center[0] - rows) ** 2 + np.abs(center[1] - cols) ** 2)
+        center_closeness = (max_distance - distance) / max_distance
+        effect_array = np.minimum(np.floor(center_closeness * 180), 180)
+        if reverse:
+            effect_array = 180 - effect_array
         return effect_array
 
-    def generate_vertical_rainbow_array(self, array_shape: tuple, reverse: bool):
+    @staticmethod
+    def generate_horizontal_rainbow_array(array_shape: tuple, reverse: bool, row_range=None):
+        width = array_shape[1]
+        start, stop = row_range or (0, array_shape[0])
+        effect_row = np.floor((180 / width) * np.arange(width))
+        if reverse:
+            effect_row = 180 - effect_row
+        return np.repeat(effect_row[None, :], stop - start, axis=0)
+
+    @staticmethod
+    def generate_vertical_rainbow_array(array_shape: tuple, reverse: bool, row_range=None):
         width = array_shape[1]
         height = array_shape[0]
-        effect_array = np.zeros((height, width))
-        for row in range(height):
-            for col in range(width):
-                if not reverse:
-                    effect_array[row, col] = math.floor((180 / height) * row)
-                else:
-                    effect_array[row, col] = 180 - math.floor((180 / height) * row)
-        return effect_array
+        effect_col = np.floor((180 / height) * np.arange(*(row_range or (0, height))))
+        if reverse:
+            effect_col = 180 - effect_col
+        return np.repeat(effect_col[:, None], width, axis=1)
 
     def show_result(self):
         self.result.show()
@@ -182,21 +417,8 @@ class ImageAsciiGenerator:
                 img_name = input("What do you want to name the image? ")
                 self.result.save(f'{directory}/{img_name}.png')
 
-    def __get_gradient_index(self, brightness: float):
-        # limits the range of values to just x values, where x represents the length of the gradient
-        return round(brightness / self.divider)
-
-    def __pixels_to_txt(self, resized_img) -> str:
-        # uses StringIO to save up on memory
-        text_image = StringIO("")
-        for i in range(len(resized_img)):
-            row = resized_img[i]
-            for j in range(len(row)):
-                current_char = self.ascii_gradient[self.__get_gradient_index(row[j][2])]
-                text_image.write(current_char)
-                text_image.write(current_char)
-            text_image.write("\n")
-        return text_image.getvalue()
+    def __pixels_to_txt(self) -> str:
+        return Helper.index_grid_to_text(self.index_grid, self.ascii_gradient, repeat=2)
 
     def __adjust_image(self):
         # scales the image down to save up on processing and to take into account the font size
@@ -213,42 +435,155 @@ class ImageAsciiGenerator:
         im = Image.new(mode="RGB", size=(new_width, new_height),
                        color=self.bg_color)
         draw = ImageDraw.Draw(im)
+        char_colors = dict(zip(self.ascii_gradient, map(tuple, self.__get_contrast_colors().tolist())))
 
-        # get the difference between foreground and background to only change the color until it becomes background
-        # improves the contrast of the image
-        back_for_diff = (
-            self.fg_color[0] - self.bg_color[0], self.fg_color[1] - self.bg_color[1],
-            self.fg_color[2] - self.bg_color[2])
         # the last line is just an empty string due to the \n character being at the end
         for i in range(len(text_lines) - 1):
             for j, char in enumerate(text_lines[i]):
-                gradient_length = len(self.ascii_gradient) - 1
-                current_char_position = self.ascii_gradient.index(char)
-                divisor = math.floor((current_char_position / gradient_length) * 10) / 10
-
-                char_color = (math.floor(self.fg_color[0] - (back_for_diff[0] * (1 - divisor))),
-                              math.floor(self.fg_color[1] - (back_for_diff[1] * (1 - divisor))),
-                              math.floor(self.fg_color[2] - (back_for_diff[2] * (1 - divisor))))
+                char_color = char_colors[char]
                 x = j * (self.text_size / self.height_width_ratio)
                 y = i * self.text_size
                 draw.text((x, y), char, font=self.text_font, spacing=0, fill=char_color, align="left")
         return im
 
-    def __draw_text_on_img(self, text: str):
-        text_lines = text.split("\n")
-        row_length = len(text_lines[0])
-        new_height = self.image_dimensions[0]
+    def __get_contrast_colors(self) -> np.array:
+        # get the difference between foreground and background to only change the color until it becomes background
+        # improves the contrast of the image
+        fg_color = np.array(self.fg_color)
+        back_for_diff = fg_color - np.array(self.bg_color)
+        gradient_length = len(self.ascii_gradient) - 1
+        # repeated characters in the gradient all get the color of the first one
+        char_positions = np.array([self.ascii_gradient.index(char) for char in self.ascii_gradient])
+        divisor = np.floor((char_positions / gradient_length) * 10) / 10
+
+        # table of colors for every character of the gradient
+        return np.floor(fg_color - (back_for_diff * (1 - divisor[:, None]))).astype(int)
+
+    def __get_effect_colors(self) -> np.array:
+        # RGB color for every cell of the resized image
+        if self.effect != Effect.ORIGINAL_COLOR:
+            return Helper.get_hue_lookup()[self.effect_lookup.astype(np.intp)]
+        hsv = self.effect_lookup / np.array([1, 255, 255])
+        return Helper.hsv_to_rgb_array(hsv)
+
+    def __get_multiline_size(self, row_length: int) -> tuple:
+        # height the image would have with cells as big as the font
+        new_height = math.floor(self.image_dimensions[0] * self.text_size / self.height_divisor)
         if self.text_size > 5:
             width_to_height_ratio = 0.6125
         else:
             width_to_height_ratio = 0.6
         # new_width = math.floor(self.image_dimensions[1] * width_to_height_ratio)
         new_width = math.floor(row_length * self.text_size * width_to_height_ratio)
-        im = Image.new(mode="RGB", size=(new_width, new_height), color=self.bg_color)
+        return new_width, new_height
+
+    def __draw_text_on_img(self, text: str):
+        text_lines = text.split("\n")
+        row_length = len(text_lines[0])
+        im = Image.new(mode="RGB", size=self.__get_multiline_size(row_length), color=self.bg_color)
         draw = ImageDraw.Draw(im)
         draw.multiline_text((0, 0), text, font=self.text_font, spacing=1, fill=self.fg_color, align="left")
         return im
 
+    def __draw_text_with_atlas(self) -> np.array:
+        atlas, colors, background_color, canvas_size = self.__get_atlas_cells()
+        if self.frame_cache is None:
+            return self.__compose_with_atlas(atlas, colors, background_color, canvas_size)
+
+        # font and gradient do not change between calls, so the grids and sizes are enough to tell the images apart
+        key = self.frame_cache.get_key(self.index_grid, colors, background_color, canvas_size)
+        cached = self.frame_cache.get(key)
+        if cached is not None:
+            # the buffers were not drawn in, so the next incremental render has to draw everything
+            self.__previous_cells = None
+            self.render_stats = None
+            return cached
+        return self.frame_cache.put(key, self.__compose_with_atlas(atlas, colors, background_color, canvas_size))
+
+    def __compose_with_atlas(self, atlas: GlyphAtlas, colors, background_color: tuple, canvas_size: tuple) -> np.array:
+        grid_shape = np.shape(self.index_grid)
+        reallocated = self.__prepare_buffers(atlas, grid_shape, canvas_size)
+        if self.incremental:
+            return self.__update_with_atlas(atlas, colors, background_color, canvas_size, reallocated)
+        return atlas.compose(self.index_grid, colors, background_color, canvas_size,
+                             out=self.__output_buffer, work=self.__work_buffer)
+
+    def __get_cell_layout(self) -> tuple:
+        # returns (cell width, cell height, character offsets) the text is drawn with, the arguments of GlyphAtlas.get
+        # every character is written twice in a row, so one cell holds both of them
+        if self.effect is None and not self.use_contrast:
+            # same layout as the multiline text drawn by PIL in __draw_text_on_img
+            char_width = self.text_font.getlength(self.ascii_gradient[0])
+            draw = ImageDraw.Draw(Image.new(mode="L", size=(1, 1)))
+            line_height = draw.textbbox((0, 0), "A", font=self.text_font)[3] + 1
+            return round(2 * char_width), line_height, (0, char_width)
+        # same layout as __draw_text_on_img_with_contrast and __draw_text_on_img_effect
+        return self.text_size, self.text_size, (0, self.text_size / self.height_width_ratio)
+
+    def __get_matcher(self) -> GlyphMatcher:
+        return GlyphMatcher.get(self.text_font.path, self.text_size, self.ascii_gradient, *self.__get_cell_layout())
+
+    def __get_atlas_cells(self) -> tuple:
+        # returns the atlas, text colors, background color and image size used to draw the index grid
+        rows, cols = np.shape(self.index_grid)
+        row_length = 2 * cols
+        atlas = GlyphAtlas.get(self.text_font.path, self.text_size, self.ascii_gradient, *self.__get_cell_layout())
+        colors, background_color = self.__get_cell_colors()
+        if self.effect is None and not self.use_contrast:
+            width, height = self.__get_multiline_size(row_length)
+            if self.strip is not None:
+                # rows are taller than the font, a strip fits all of them and the bottom of the image is cut off later
+                height = rows * atlas.cell_height
+            return atlas, colors, background_color, (width, height)
+
+        char_width = self.text_size / self.height_width_ratio
+        canvas_size = (math.floor(row_length * char_width), rows * self.text_size)
+        return atlas, colors, background_color, canvas_size
+
+    def __get_cell_colors(self) -> tuple:
+        # text colors (one for everything or one for every cell) and background color the index grid is drawn with
+        if self.effect is None and not self.use_contrast:
+            return self.fg_color, self.bg_color
+        if self.effect is None:
+            return self.__get_contrast_colors()[self.index_grid], self.bg_color
+        return self.__get_effect_colors(), (0, 0, 0)
+
+    def __update_with_atlas(self, atlas: GlyphAtlas, colors, background_color: tuple, canvas_size: tuple,
+                            reallocated: bool) -> np.array:
+        # compares the cells with the previous call and only redraws the ones that changed
+        layout = (atlas, tuple(background_color), canvas_size)
+        previous = self.__previous_cells
+        if reallocated or previous is None or previous[0] != layout or np.ndim(colors) != np.ndim(previous[2]) or \
+                (np.ndim(colors) == 1 and not np.array_equal(colors, previous[2])):
+            changed = np.ones(np.shape(self.index_grid), dtype=bool)
+        else:
+            changed = self.index_grid != previous[1]
+            if np.ndim(colors) == 3:
+                changed |= np.any(colors != previous[2], axis=-1)
+        self.__previous_cells = (layout, self.index_grid, colors)
+        changed_cells = int(np.count_nonzero(changed))
+        self.render_stats = {"changed_cells": changed_cells, "total_cells": changed.size}
+
+        # when most of the cells changed, drawing everything again is faster than looking for what to redraw
+        if changed_cells > self.full_redraw_ratio * changed.size:
+            return atlas.compose(self.index_grid, colors, background_color, canvas_size,
+                                 out=self.__output_buffer, work=self.__work_buffer)
+        return atlas.update(self.index_grid, colors, background_color, changed, out=self.__output_buffer,
+                            work=self.__work_buffer)
+
+    def __prepare_buffers(self, atlas: GlyphAtlas, grid_shape: tuple, canvas_size: tuple) -> bool:
+        # buffers are only allocated again when the size of the image changes, returns whether that happened
+        reallocated = False
+        work_shape = atlas.get_work_shape(grid_shape)
+        if self.__work_buffer is None or np.shape(self.__work_buffer) != work_shape:
+            self.__work_buffer = np.empty(work_shape, dtype=np.float32)
+            reallocated = True
+        output_shape = (canvas_size[1], canvas_size[0], 3)
+        if self.__output_buffer is None or np.shape(self.__output_buffer) != output_shape:
+            self.__output_buffer = np.empty(output_shape, dtype=np.uint8)
+            reallocated = True
+        return reallocated
+
     def __draw_text_on_img_effect(self, text):
         text_lines = text.split("\n")
         # due to text ending in new character line, need to use len(text_lines) - 1 to avoid the last empty line
@@ -259,15 +594,12 @@ class ImageAsciiGenerator:
         draw = ImageDraw.Draw(im)
         total_cols = len(text_lines[0])
         total_rows = len(text_lines)
+        colors = self.__get_effect_colors().tolist()
         # the last line is just an empty string due to the \n character being at the end
         for i in range(len(text_lines) - 1):
             for j, char in enumerate(text_lines[i]):
                 # hue = self.__get_effect_hue(row=i, col=j, total_rows=total_rows, total_cols=total_cols)
-                hue = self.effect_lookup[i, j//2]
-                if self.effect != Effect.ORIGINAL_COLOR:
-                    char_color = Helper.hsv_to_rgb((hue, 1, 1))
-                else:
-                    char_color = Helper.hsv_to_rgb((hue[0], hue[1] / 255, hue[2] / 255))
+                char_color = tuple(colors[i][j // 2])
                 x = j * (self.text_size / self.height_width_ratio)
                 y = i * self.text_size
                 draw.text((x, y), char, font=self.text_font, spacing=0, fill=char_color, align="left")
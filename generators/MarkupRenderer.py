@@ -0,0 +1,161 @@
+import html
+import os
+import numpy as np
+
+
+class MarkupRenderer:
+    """Class writing the text of a converted image as an HTML or SVG document instead of drawing it into pixels.
+
+    The document holds the characters as text, so it stays sharp at any zoom and is usually much smaller than the PNG
+    of the same text. Next to each other cells with the same color are merged into a single span (run-length encoding),
+    and blank cells join the run around them because their color is never seen. Every color gets one CSS class, so a
+    run costs a short class name instead of a whole color. HTML runs are i elements with the italics turned off, the
+    shortest element that works anywhere in the text.
+
+    Attributes
+    ----------
+    gradient: str
+        characters the indexes of the grids point to
+    font_size: int
+        size of the text in pixels, a cell is font_size tall
+    repeat: int
+        how many times each character is written, 2 like in the images so the cells come out about square
+
+    Methods
+    -------
+    get_runs(index_grid: np.array, colors)
+        returns the runs of same colored text of every row and the colors they use
+    render_html(index_grid: np.array, colors, background_color: tuple, title="")
+        returns the text as an HTML document
+    render_svg(index_grid: np.array, colors, background_color: tuple)
+        returns the text as an SVG document
+    save(path: str, index_grid: np.array, colors, background_color: tuple)
+        writes the document of the format given by the extension of path
+    """
+
+    formats = (".html", ".svg")
+    font_family = "'Lucida Console', 'DejaVu Sans Mono', monospace"
+    # width of a character of a monospace font compared to its size, used for the size of the SVG
+    char_width_ratio = 0.6
+    # position of the baseline in a cell, compared to its height
+    baseline_ratio = 0.8
+
+    def __init__(self, gradient: str, font_size=8, repeat=2):
+        """MarkupRenderer constructor
+
+        :param gradient: characters the indexes of the grids point to
+        :param font_size: size of the text in pixels
+        :param repeat: how many times each character is written in a row
+        """
+        self.gradient = gradient
+        self.font_size = font_size
+        self.repeat = repeat
+        self.__cell_text = np.array([html.escape(char * repeat, quote=False) for char in gradient], dtype=object)
+        self.__blank = np.array([char.isspace() for char in gradient])
+
+    def get_runs(self, index_grid: np.array, colors) -> tuple:
+        """Splits every row into runs of text with the same color
+
+        :param index_grid: 2D array with the index of the gradient character of every cell
+        :param colors: RGB color of all the text, or array of shape (rows, cols, 3) with the color of every cell
+        :return: tuple: list of rows, each a list of (palette index, escaped text) with -1 for text without a color of
+            its own, and the palette as a list of RGB tuples
+        """
+        index_grid = np.asarray(index_grid)
+        rows, cols = np.shape(index_grid)
+        cell_text = self.__cell_text[index_grid]
+        if np.ndim(colors) != 3:
+            # one color for everything, it is set on the whole document
+            return [[(-1, "".join(cell_text[row]))] for row in range(rows)], []
+
+        rgb = np.asarray(colors, dtype=np.int64)
+        codes = (rgb[:, :, 0] << 16) | (rgb[:, :, 1] << 8) | rgb[:, :, 2]
+        # blank cells take the color of the cell before them, blanks at the start of a row stay without a color
+        codes[self.__blank[index_grid]] = -1
+        positions = np.maximum.accumulate(np.where(codes >= 0, np.arange(cols), 0), axis=1)
+        codes = np.take_along_axis(codes, positions, axis=1)
+
+        palette_codes, palette_indexes = np.unique(codes[codes >= 0], return_inverse=True)
+        indexes = np.full(codes.shape, -1, dtype=np.int64)
+        indexes[codes >= 0] = palette_indexes
+        runs = []
+        for row in range(rows):
+            starts = np.concatenate([[0], np.flatnonzero(indexes[row, 1:] != indexes[row, :-1]) + 1, [cols]])
+            row_text = cell_text[row]
+            row_indexes = indexes[row]
+            runs.append([(int(row_indexes[start]), "".join(row_text[start:end]))
+                         for start, end in zip(starts[:-1].tolist(), starts[1:].tolist())])
+        palette = [((code >> 16) & 255, (code >> 8) & 255, code & 255) for code in palette_codes.tolist()]
+        return runs, palette
+
+    def render_html(self, index_grid: np.array, colors, background_color: tuple, title="") -> str:
+        """Returns the text as an HTML page, with the rows in a pre element
+
+        :param index_grid: 2D array with the index of the gradient character of every cell
+        :param colors: RGB color of all the text, or array of shape (rows, cols, 3) with the color of every cell
+        :param background_color: RGB color of the background
+        :param title: title of the page
+        :return: str: the HTML document
+        """
+        runs, palette = self.get_runs(index_grid, colors)
+        text_color = self.__get_hex(colors) if np.ndim(colors) != 3 else "inherit"
+        style = [f'body{{margin:0;background:{self.__get_hex(background_color)}}}',
+                 f'pre{{margin:0;font:{self.font_size}px/{self.font_size}px {self.font_family};color:{text_color}}}',
+                 'i{font-style:normal}']
+        style += [f'.c{i:x}{{color:{self.__get_hex(color)}}}' for i, color in enumerate(palette)]
+        lines = ["".join(text if index < 0 else f'<i class=c{index:x}>{text}</i>' for index, text in row)
+                 for row in runs]
+        return (f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+                f'<style>{"".join(style)}</style></head><body><pre>' + "\n".join(lines) + "</pre></body></html>\n")
+
+    def render_svg(self, index_grid: np.array, colors, background_color: tuple) -> str:
+        """Returns the text as an SVG image, with one text element for every row
+
+        :param index_grid: 2D array with the index of the gradient character of every cell
+        :param colors: RGB color of all the text, or array of shape (rows, cols, 3) with the color of every cell
+        :param background_color: RGB color of the background
+        :return: str: the SVG document
+        """
+        runs, palette = self.get_runs(index_grid, colors)
+        rows, cols = np.shape(index_grid)
+        width = round(cols * self.repeat * self.char_width_ratio * self.font_size)
+        height = rows * self.font_size
+        text_color = self.__get_hex(colors) if np.ndim(colors) != 3 else "none"
+        style = [f'text{{font:{self.font_size}px {self.font_family};fill:{text_color};white-space:pre}}']
+        style += [f'.c{i:x}{{fill:{self.__get_hex(color)}}}' for i, color in enumerate(palette)]
+        parts = [f'<svg xmlns="http://www.w3.org/2000/svg" xml:space="preserve" width="{width}" height="{height}" '
+                 f'viewBox="0 0 {width} {height}"><style>{"".join(style)}</style>'
+                 f'<rect width="100%" height="100%" fill="{self.__get_hex(background_color)}"/>']
+        for row, row_runs in enumerate(runs):
+            baseline = round((row + self.baseline_ratio) * self.font_size, 2)
+            text = "".join(text if index < 0 else f'<tspan class="c{index:x}">{text}</tspan>'
+                           for index, text in row_runs)
+            parts.append(f'<text y="{baseline:g}">{text}</text>')
+        parts.append("</svg>\n")
+        return "\n".join(parts)
+
+    def save(self, path: str, index_grid: np.array, colors, background_color: tuple) -> int:
+        """Writes the text into a document, HTML or SVG depending on the extension of path
+
+        :param path: path of the document, ending with .html or .svg
+        :param index_grid: 2D array with the index of the gradient character of every cell
+        :param colors: RGB color of all the text, or array of shape (rows, cols, 3) with the color of every cell
+        :param background_color: RGB color of the background
+        :return: int: bytes written
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".html":
+            document = self.render_html(index_grid, colors, background_color,
+                                        title=os.path.splitext(os.path.basename(path))[0])
+        elif extension == ".svg":
+            document = self.render_svg(index_grid, colors, background_color)
+        else:
+            raise ValueError(f'Unknown document format "{extension}", use one of {list(self.formats)}')
+        data = document.encode("utf-8")
+        with open(path, "wb") as file:
+            file.write(data)
+        return len(data)
+
+    @staticmethod
+    def __get_hex(color) -> str:
+        return "#{:02x}{:02x}{:02x}".format(*(int(value) for value in color))
@@ -0,0 +1,150 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from generators.AsciiRenderer import AsciiRenderer
+from instrumentation import Instrumentation
+
+
+class ParallelFrameRenderer:
+    """Class for converting frames into text images on several processes at once.
+
+    Every worker process keeps its own AsciiRenderer. Frames are handed to the workers and back through two rings of
+    shared memory slots, so only the slot number goes through pickling. Frames are given back in the same order they
+    came in.
+
+    Attributes
+    ----------
+    workers: int
+        amount of worker processes
+    renderer_settings: dict
+        keyword arguments for the AsciiRenderer of every worker
+    slots: int
+        amount of frames that can be worked on at once
+    stats: dict
+        changed and total cells (incremental mode) and frame cache hits and misses summed over all workers
+    instrumentation: Instrumentation
+        receives the stage timings of all the workers, None records nothing
+
+    Methods
+    -------
+    render_frames(frames)
+        converts the frames and yields the results in order
+    """
+
+    def __init__(self, workers: int, renderer_settings: dict, slots=None, instrumentation=None):
+        """ParallelFrameRenderer constructor
+
+        :param workers: amount of worker processes
+        :param renderer_settings: keyword arguments for the AsciiRenderer of every worker
+        :param slots: amount of frames that can be worked on at once, twice the amount of workers by default
+        :param instrumentation: Instrumentation receiving the stage timings measured in the workers
+        """
+        self.workers = workers
+        self.renderer_settings = renderer_settings
+        self.slots = slots if slots is not None else 2 * workers
+        self.stats = None
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
+        self.__cache_counts = None
+
+    def render_frames(self, frames):
+        """Converts the frames on the worker processes. Yields the converted frames in the same order as given
+
+        :param frames: iterable of (frame in HSV, foreground color or None) tuples. All frames need the same shape
+        :return: generator of RGB frames. Frames are copied out of the shared memory, as it is released at the end
+        """
+        frames = iter(frames)
+        first = next(frames, None)
+        if first is None:
+            return
+        # the first frame is converted here to find out the size of the converted frames
+        frame, fg_color = first
+        frame_shape = np.shape(frame)
+        self.stats = {"changed_cells": 0, "total_cells": 0, "cache_hits": 0, "cache_misses": 0}
+        self.__cache_counts = {}
+        renderer = AsciiRenderer(instrumentation=self.instrumentation, **self.renderer_settings)
+        result = renderer.render(frame, foreground_color=fg_color)
+        self.__add_stats(_get_render_stats(renderer))
+        result_shape = np.shape(result)
+        yield result.copy()
+
+        input_memory = SharedMemory(create=True, size=self.slots * int(np.prod(frame_shape)))
+        output_memory = SharedMemory(create=True, size=self.slots * int(np.prod(result_shape)))
+        try:
+            inputs = np.ndarray((self.slots,) + frame_shape, dtype=np.uint8, buffer=input_memory.buf)
+            outputs = np.ndarray((self.slots,) + result_shape, dtype=np.uint8, buffer=output_memory.buf)
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(self.renderer_settings, input_memory.name, output_memory.name,
+                                               frame_shape, result_shape, self.slots,
+                                               self.instrumentation.enabled)) as executor:
+                # futures are kept in the order the frames came in, so waiting on the oldest keeps the order
+                pending = deque()
+                free_slots = list(range(self.slots))
+                for frame, fg_color in frames:
+                    if np.shape(frame) != frame_shape:
+                        raise ValueError(f'All frames need the shape {frame_shape}, got {np.shape(frame)}')
+                    if not free_slots:
+                        slot = self.__finish(pending.popleft())
+                        yield outputs[slot].copy()
+                        free_slots.append(slot)
+                    slot = free_slots.pop()
+                    inputs[slot] = frame
+                    pending.append(executor.submit(_render_slot, slot, fg_color))
+                while pending:
+                    yield outputs[self.__finish(pending.popleft())].copy()
+        finally:
+            input_memory.close()
+            input_memory.unlink()
+            output_memory.close()
+            output_memory.unlink()
+
+    def __finish(self, future) -> int:
+        # waits for the frame and adds up its statistics, returns the slot holding the result
+        slot, stats, stages = future.result()
+        self.__add_stats(stats)
+        for name, durations in stages.items():
+            self.instrumentation.stages.setdefault(name, []).extend(durations)
+        return slot
+
+    def __add_stats(self, stats: tuple):
+        process, cache_counts, last_stats = stats
+        if last_stats is not None:
+            self.stats["changed_cells"] += last_stats["changed_cells"]
+            self.stats["total_cells"] += last_stats["total_cells"]
+        if cache_counts is not None:
+            # the cache counts of a process only grow, so the newest ones replace the older ones
+            self.__cache_counts[process] = cache_counts
+            self.stats["cache_hits"] = sum(hits for hits, _ in self.__cache_counts.values())
+            self.stats["cache_misses"] = sum(misses for _, misses in self.__cache_counts.values())
+
+
+# state of a worker process, filled in by _init_worker
+_worker = {}
+
+
+def _init_worker(renderer_settings: dict, input_name: str, output_name: str, frame_shape: tuple, result_shape: tuple,
+                 slots: int, instrument: bool):
+    input_memory = SharedMemory(name=input_name)
+    output_memory = SharedMemory(name=output_name)
+    _worker["memory"] = (input_memory, output_memory)
+    _worker["inputs"] = np.ndarray((slots,) + frame_shape, dtype=np.uint8, buffer=input_memory.buf)
+    _worker["outputs"] = np.ndarray((slots,) + result_shape, dtype=np.uint8, buffer=output_memory.buf)
+    _worker["instrumentation"] = Instrumentation(enabled=instrument)
+    _worker["renderer"] = AsciiRenderer(instrumentation=_worker["instrumentation"], **renderer_settings)
+
+
+def _render_slot(slot: int, fg_color) -> tuple:
+    result = _worker["renderer"].render(_worker["inputs"][slot], foreground_color=fg_color)
+    _worker["outputs"][slot] = result
+    # stage timings of this frame are sent back and forgotten, so every timing reaches the main process once
+    stages = _worker["instrumentation"].stages
+    _worker["instrumentation"].stages = {}
+    return slot, _get_render_stats(_worker["renderer"]), stages
+
+
+def _get_render_stats(renderer: AsciiRenderer) -> tuple:
+    # (process id, cumulative cache hits and misses or None, statistics of the last frame)
+    cache = renderer.frame_cache
+    cache_counts = (cache.hits, cache.misses) if cache is not None else None
+    return os.getpid(), cache_counts, renderer.last_stats
@@ -0,0 +1,107 @@
+import os
+import struct
+import zlib
+import numpy as np
+
+
+class PngStripWriter:
+    """Class writing an RGB PNG image a strip of rows at a time, so the whole image never has to be in memory.
+
+    The rows are compressed as they come and written out in IDAT chunks right away. The height of the image is only
+    known at the end, so the header is written with a height of 0 and filled in by close(). Every row uses the Up
+    filter (the difference to the row above), which costs a single subtraction for the whole strip and suits text
+    images, where most rows repeat the one above them.
+
+    Attributes
+    ----------
+    path: str
+        path of the image
+    width: int
+        width of the image in pixels
+    height: int
+        amount of rows written so far
+    bytes_written: int
+        size of the file written so far
+
+    Methods
+    -------
+    write(strip: np.array)
+        adds rows to the bottom of the image
+    close()
+        finishes the image and closes the file
+    discard()
+        closes the file without finishing it and deletes it
+    """
+
+    signature = b"\x89PNG\r\n\x1a\n"
+    # filter type of every row, 2 is Up
+    row_filter = 2
+
+    def __init__(self, path: str, width: int, compression_level=6):
+        """PngStripWriter constructor. Creates the file and writes the header
+
+        :param path: path of the image to write
+        :param width: width of the image in pixels
+        :param compression_level: zlib level, 1 is the fastest and 9 the smallest
+        """
+        self.path = path
+        self.width = width
+        self.height = 0
+        self.bytes_written = 0
+        self.__compressor = zlib.compressobj(compression_level)
+        self.__previous_row = np.zeros((1, width, 3), dtype=np.uint8)
+        self.__file = open(path, "wb")
+        self.__file.write(self.signature)
+        self.bytes_written += len(self.signature)
+        self.__header_position = self.__file.tell()
+        self.__write_chunk(b"IHDR", self.__get_header(0))
+
+    def write(self, strip: np.array):
+        """Adds rows to the bottom of the image
+
+        :param strip: uint8 array of shape (rows, width, 3) with RGB pixels
+        """
+        strip = np.asarray(strip, dtype=np.uint8)
+        if np.ndim(strip) != 3 or strip.shape[1:] != (self.width, 3):
+            raise ValueError(f'Strips have to be of shape (rows, {self.width}, 3), got {np.shape(strip)}')
+        if len(strip) == 0:
+            return
+        # uint8 subtraction wraps around, which is how PNG decoders add the rows back up
+        above = np.concatenate([self.__previous_row, strip[:-1]])
+        rows = np.empty((len(strip), 1 + 3 * self.width), dtype=np.uint8)
+        rows[:, 0] = self.row_filter
+        rows[:, 1:] = (strip - above).reshape(len(strip), -1)
+        self.__previous_row = strip[-1:].copy()
+        self.height += len(strip)
+        compressed = self.__compressor.compress(rows.tobytes())
+        if compressed:
+            self.__write_chunk(b"IDAT", compressed)
+
+    def close(self):
+        """Writes the rest of the compressed rows and the height of the image, then closes the file"""
+        if self.__file.closed:
+            return
+        try:
+            self.__write_chunk(b"IDAT", self.__compressor.flush())
+            self.__write_chunk(b"IEND", b"")
+            self.__file.seek(self.__header_position)
+            self.__write_chunk(b"IHDR", self.__get_header(self.height), count=False)
+        finally:
+            self.__file.close()
+
+    def discard(self):
+        """Closes the file without finishing the image and deletes it, so no truncated image is left behind"""
+        if not self.__file.closed:
+            self.__file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __get_header(self, height: int) -> bytes:
+        # 8 bits per channel, color type 2 (RGB), default compression and filtering, no interlacing
+        return struct.pack(">IIBBBBB", self.width, height, 8, 2, 0, 0, 0)
+
+    def __write_chunk(self, chunk_type: bytes, data: bytes, count=True):
+        chunk = struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+        self.__file.write(chunk)
+        if count:
+            self.bytes_written += len(chunk)
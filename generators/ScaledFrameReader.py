@@ -0,0 +1,78 @@
+import subprocess
+import numpy as np
+from moviepy.config import FFMPEG_BINARY
+
+
+class ScaledFrameReader:
+    """Class reading the frames of a video one after another, already scaled down by the decoder.
+
+    ffmpeg decodes the video as a stream and scales every frame with area averaging before it is converted to RGB and
+    piped out, so the colorspace conversion and everything after it works on the small frames only. Optionally only
+    the brightness (luma) plane is read, which skips the color conversion and is a third of the data.
+
+    Attributes
+    ----------
+    path: str
+        path to the video file
+    size: tuple[2]
+        (width, height) of the frames read
+    start: float
+        second of the video the first frame is read from
+    duration: float
+        seconds of the video to read, None reads until the end
+    gray: bool
+        reads only the luma plane, frames are then 2D arrays
+
+    Methods
+    -------
+    read()
+        returns the next frame, None at the end of the video
+    close()
+        stops the decoder
+    """
+
+    def __init__(self, path: str, size: tuple, start=0, duration=None, gray=False):
+        """ScaledFrameReader constructor. Starts the decoder
+
+        :param path: path to the video file
+        :param size: (width, height) to scale the frames to
+        :param start: second of the video to start reading at
+        :param duration: seconds of the video to read, None reads until the end
+        :param gray: reads only the luma plane instead of RGB frames
+        """
+        self.path = path
+        self.size = (max(1, int(size[0])), max(1, int(size[1])))
+        self.start = start
+        self.duration = duration
+        self.gray = gray
+        width, height = self.size
+        self.__frame_shape = (height, width) if gray else (height, width, 3)
+        self.__frame_bytes = int(np.prod(self.__frame_shape))
+        command = [FFMPEG_BINARY, "-loglevel", "error", "-ss", str(start), "-i", path]
+        if duration is not None:
+            command += ["-t", str(duration)]
+        command += ["-vf", f'scale={width}:{height}:flags=area', "-f", "rawvideo",
+                    "-pix_fmt", "gray" if gray else "rgb24", "-"]
+        self.__process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                          stderr=subprocess.PIPE, bufsize=10 * self.__frame_bytes)
+
+    def read(self):
+        """Returns the next frame
+
+        :return: np.array: RGB frame of shape (height, width, 3), or (height, width) with gray, None at the end
+        """
+        data = self.__process.stdout.read(self.__frame_bytes)
+        if len(data) < self.__frame_bytes:
+            if self.__process.poll() not in (None, 0):
+                error = self.__process.stderr.read().decode(errors="replace")
+                raise Exception(f'Could not decode {self.path}: {error}')
+            return None
+        return np.frombuffer(data, dtype=np.uint8).reshape(self.__frame_shape)
+
+    def close(self):
+        """Stops the decoder"""
+        if self.__process.poll() is None:
+            self.__process.kill()
+        self.__process.wait()
+        self.__process.stdout.close()
+        self.__process.stderr.close()
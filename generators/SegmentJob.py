@@ -0,0 +1,304 @@
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import time
+from moviepy import VideoFileClip
+from moviepy.config import FFMPEG_BINARY
+from generators.AudioMuxer import AudioMuxer
+from generators.VideoAsciiGenerator import VideoAsciiGenerator
+from Effect import Effect
+from RenderBackend import RenderBackend
+
+
+class SegmentJob:
+    """Class splitting the conversion of a video into time segments, which any amount of workers can convert at once.
+
+    plan() cuts the source into segments on frame boundaries and writes a manifest into a job directory. Any process
+    that can reach the directory (another terminal, or another machine when the directory is on a shared drive) runs
+    work(). It claims segments that nobody else has claimed yet and converts them into silent videos. When every segment
+    is done, join() puts the segment videos together without encoding them again and copies in the audio of the source.
+
+    A segment is claimed by creating its lock file, which only one process can do. A segment is done when its video
+    exists; it is written under a temporary name and renamed when complete, so a half written segment never counts.
+    A worker that dies leaves its lock behind; work(stale_after=...) takes over locks older than that many seconds.
+
+    The finished segments double as checkpoints of a single long conversion: resume() opens the job of an interrupted
+    conversion again, so only the segments that were not finished are converted after a crash.
+
+    Job directory layout: manifest.json, locks/segment_00000.lock, segments/segment_00000.mp4
+
+    Attributes
+    ----------
+    job_dir: str
+        directory with the manifest, locks and segment videos
+    manifest: dict
+        source, fps, start, end, settings and segments of the job
+    segments: list[dict]
+        index, start, end, first frame and video file of every segment
+
+    Methods
+    -------
+    plan(video: str, job_dir: str, segment_seconds=10, settings=None, start=None, end=None)
+        writes the manifest of a new job and returns the job
+    resume(video: str, job_dir: str, segment_seconds=10, settings=None, start=None, end=None)
+        returns the job of the same conversion in job_dir, plans it when there is none
+    claim(stale_after=None)
+        claims a segment that is not done and not claimed by anyone, returns None when there is none
+    convert_segment(segment: dict, workers=1, instrumentation=None)
+        converts a claimed segment
+    work(workers=1, stale_after=None, max_segments=None, instrumentation=None)
+        converts segments until none is left
+    get_status()
+        returns which segments are done, claimed and pending
+    join(output_path: str)
+        joins the segment videos and the audio of the source into output_path
+    """
+
+    manifest_name = "manifest.json"
+    version = 1
+    # keyword arguments of VideoAsciiGenerator a job can be planned with
+    setting_keys = ("font_size", "gradient", "use_contrast", "background_color", "foreground_color", "effect",
+                    "invert_gradient", "backend", "incremental", "cache_size", "match_shapes", "prescale", "luma")
+
+    def __init__(self, job_dir: str):
+        """SegmentJob constructor. Reads the manifest of a planned job
+
+        :param job_dir: directory the job was planned into
+        """
+        self.job_dir = job_dir
+        with open(os.path.join(job_dir, self.manifest_name), encoding="utf-8") as file:
+            self.manifest = json.load(file)
+        if self.manifest.get("version") != self.version:
+            raise ValueError(f'{job_dir} has a job of unsupported version {self.manifest.get("version")}')
+        self.segments = self.manifest["segments"]
+
+    @staticmethod
+    def plan(video: str, job_dir: str, segment_seconds=10, settings=None, start=None, end=None):
+        """Splits the video into segments and writes the manifest of the job
+
+        :param video: path to the video to convert, every worker has to reach it under this path
+        :param job_dir: directory for the job, created when missing. Must not hold another job
+        :param segment_seconds: length of a segment, rounded to whole frames
+        :param settings: keyword arguments for VideoAsciiGenerator (see setting_keys). effect is the number of the
+            effect, backend the name of the backend and colors are lists, so they fit into JSON
+        :param start: second of the video to start converting at, None starts at the beginning
+        :param end: second of the video to end converting at, None converts until the end
+        :return: SegmentJob: the planned job
+        """
+        settings = dict(settings) if settings is not None else {}
+        unknown = set(settings) - set(SegmentJob.setting_keys)
+        if unknown:
+            raise ValueError(f'Unknown settings for a segment job: {sorted(unknown)}')
+        if os.path.exists(os.path.join(job_dir, SegmentJob.manifest_name)):
+            raise ValueError(f'{job_dir} already holds a job')
+
+        clip = VideoFileClip(video)
+        fps, duration = clip.fps, clip.duration
+        clip.close()
+        start = start or 0
+        end = duration if end is None else min(end, duration)
+        if end <= start:
+            raise ValueError(f'Nothing to convert between {start} and {end} seconds')
+
+        # segments start and end on frame boundaries, so no frame is converted twice or skipped between two of them
+        total_frames = int(fps * (end - start) + 1e-6)
+        segment_frames = max(1, round(segment_seconds * fps))
+        segments = []
+        for first_frame in range(0, total_frames, segment_frames):
+            segments.append({"index": len(segments), "start": start + first_frame / fps,
+                             "end": min(end, start + (first_frame + segment_frames) / fps),
+                             "first_frame": first_frame, "file": f'segment_{len(segments):05d}.mp4'})
+
+        manifest = {"version": SegmentJob.version, "source": os.path.abspath(video), "fps": fps, "start": start,
+                    "end": end, "settings": settings, "segments": segments}
+        os.makedirs(os.path.join(job_dir, "locks"), exist_ok=True)
+        os.makedirs(os.path.join(job_dir, "segments"), exist_ok=True)
+        # written under another name first, so workers never read half of it
+        temporary = os.path.join(job_dir, f'{SegmentJob.manifest_name}.tmp')
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(temporary, os.path.join(job_dir, SegmentJob.manifest_name))
+        return SegmentJob(job_dir)
+
+    @staticmethod
+    def resume(video: str, job_dir: str, segment_seconds=10, settings=None, start=None, end=None):
+        """Returns the job in job_dir when it converts the same video with the same settings, plans a new job when
+        job_dir holds none. The arguments are the same as for plan()
+
+        :return: SegmentJob: the job, with the segments finished before kept
+        """
+        if not os.path.exists(os.path.join(job_dir, SegmentJob.manifest_name)):
+            return SegmentJob.plan(video, job_dir, segment_seconds=segment_seconds, settings=settings, start=start,
+                                   end=end)
+        job = SegmentJob(job_dir)
+        # compared the way they were stored, JSON turns the tuples into lists
+        settings = json.loads(json.dumps(settings if settings is not None else {}))
+        if end is not None:
+            # plan() stores ends past the video as the duration of the video
+            clip = VideoFileClip(video)
+            end = min(end, clip.duration)
+            clip.close()
+        if (job.manifest["source"] != os.path.abspath(video) or job.manifest["settings"] != settings
+                or job.manifest["start"] != (start or 0) or (end is not None and job.manifest["end"] != end)):
+            raise ValueError(f'{job_dir} holds the progress of another video or other settings')
+        return job
+
+    def claim(self, stale_after=None):
+        """Claims the first segment that is not done and not claimed by another worker
+
+        :param stale_after: seconds after which a lock of an unfinished segment is taken over, None never takes over
+        :return: dict: the claimed segment, None when there is nothing left to claim
+        """
+        for segment in self.segments:
+            if self.__is_done(segment):
+                continue
+            lock = self.__get_lock_path(segment)
+            if stale_after is not None and self.__is_stale(lock, stale_after):
+                stale = f'{lock}.{socket.gethostname()}.{os.getpid()}.stale'
+                try:
+                    # renaming succeeds for a single worker only, so two workers never take over the same lock
+                    os.rename(lock, stale)
+                except OSError:
+                    continue
+                os.remove(stale)
+            try:
+                handle = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            with os.fdopen(handle, "w", encoding="utf-8") as file:
+                json.dump({"host": socket.gethostname(), "pid": os.getpid(), "time": time.time()}, file)
+            return segment
+        return None
+
+    def convert_segment(self, segment: dict, workers=1, instrumentation=None):
+        """Converts a segment into a silent video. The segment should be claimed first
+
+        :param segment: one of the segments of the job
+        :param workers: amount of processes converting the frames of the segment
+        :param instrumentation: Instrumentation recording the time of every stage, nothing is recorded when None
+        """
+        path = os.path.join(self.job_dir, "segments", segment["file"])
+        # named after the worker, other machines have to be able to read the file (mkstemp would hide it from them)
+        temporary = os.path.join(os.path.dirname(path), f'.{socket.gethostname()}_{os.getpid()}_{segment["file"]}')
+        try:
+            generator = VideoAsciiGenerator(self.manifest["source"], video_start=segment["start"],
+                                            video_end=segment["end"], frame_offset=segment["first_frame"],
+                                            streaming=True, workers=workers, instrumentation=instrumentation,
+                                            **self.__get_generator_settings())
+            generator.convert(temporary, audio=False)
+            os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def work(self, workers=1, stale_after=None, max_segments=None, instrumentation=None) -> list:
+        """Claims and converts segments until all of them are done or claimed
+
+        A segment that fails to convert is unclaimed again, so another worker can try it.
+
+        :param workers: amount of processes converting the frames of a segment
+        :param stale_after: seconds after which a lock of an unfinished segment is taken over, None never takes over.
+            Has to be longer than converting a segment takes
+        :param max_segments: stops after converting this many segments, None converts until nothing is left
+        :param instrumentation: Instrumentation shared by the conversions of all the segments, start it around work
+            to get the statistics of all of them together
+        :return: list[int]: indexes of the segments converted by this call
+        """
+        converted = []
+        while max_segments is None or len(converted) < max_segments:
+            segment = self.claim(stale_after)
+            if segment is None:
+                break
+            print(f'-----CONVERTING SEGMENT {segment["index"] + 1}/{len(self.segments)} '
+                  f'({segment["start"]:.2f} - {segment["end"]:.2f} s)-----')
+            try:
+                self.convert_segment(segment, workers=workers, instrumentation=instrumentation)
+            finally:
+                self.__release(segment)
+            converted.append(segment["index"])
+        return converted
+
+    def get_status(self) -> dict:
+        """Returns the state of every segment
+
+        :return: dict: indexes of the "done", "claimed" and "pending" segments
+        """
+        status = {"done": [], "claimed": [], "pending": []}
+        for segment in self.segments:
+            if self.__is_done(segment):
+                status["done"].append(segment["index"])
+            elif os.path.exists(self.__get_lock_path(segment)):
+                status["claimed"].append(segment["index"])
+            else:
+                status["pending"].append(segment["index"])
+        return status
+
+    def join(self, output_path: str):
+        """Joins the segment videos in order and copies in the audio of the source, nothing is encoded again
+
+        :param output_path: path of the video to write
+        """
+        missing = [segment["index"] for segment in self.segments if not self.__is_done(segment)]
+        if missing:
+            raise ValueError(f'Segments {missing} are not converted yet')
+        list_path = os.path.join(self.job_dir, "segments.txt")
+        with open(list_path, "w", encoding="utf-8") as file:
+            for segment in self.segments:
+                segment_path = os.path.abspath(os.path.join(self.job_dir, "segments", segment["file"]))
+                file.write(f"file '{segment_path}'\n")
+        handle, silent_file = tempfile.mkstemp(suffix=os.path.splitext(output_path)[1],
+                                               dir=os.path.dirname(os.path.abspath(output_path)))
+        os.close(handle)
+        try:
+            command = [FFMPEG_BINARY, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+                       "-c", "copy", silent_file]
+            process = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True)
+            if process.returncode != 0:
+                raise RuntimeError(f'ffmpeg could not join the segments: {process.stderr.decode(errors="replace")}')
+            muxer = AudioMuxer(self.manifest["source"], self.manifest["start"], self.manifest["end"])
+            if muxer.mux(silent_file, output_path) == "transcode":
+                print("The audio codec of the source does not fit into the video, the audio was encoded again")
+        finally:
+            os.remove(list_path)
+            if os.path.exists(silent_file):
+                os.remove(silent_file)
+
+    def __get_generator_settings(self) -> dict:
+        settings = dict(self.manifest["settings"])
+        if settings.get("effect") is not None:
+            settings["effect"] = Effect(settings["effect"])
+        if "backend" in settings:
+            settings["backend"] = RenderBackend[settings["backend"].upper()]
+        for key in ("background_color", "foreground_color"):
+            if key in settings:
+                settings[key] = tuple(settings[key])
+        return settings
+
+    def __get_lock_path(self, segment: dict) -> str:
+        return os.path.join(self.job_dir, "locks", f'{os.path.splitext(segment["file"])[0]}.lock')
+
+    def __release(self, segment: dict):
+        # removes the lock only while it is still ours, a worker may have taken it over as stale in the meantime
+        lock = self.__get_lock_path(segment)
+        try:
+            with open(lock, encoding="utf-8") as file:
+                owner = json.load(file)
+        except (OSError, ValueError):
+            return
+        if owner.get("host") == socket.gethostname() and owner.get("pid") == os.getpid():
+            try:
+                os.remove(lock)
+            except FileNotFoundError:
+                pass
+
+    def __is_done(self, segment: dict) -> bool:
+        return os.path.exists(os.path.join(self.job_dir, "segments", segment["file"]))
+
+    @staticmethod
+    def __is_stale(lock: str, stale_after: float) -> bool:
+        try:
+            return time.time() - os.path.getmtime(lock) > stale_after
+        except OSError:
+            return False
@@ -0,0 +1,111 @@
+import queue
+import threading
+import numpy as np
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from instrumentation import Instrumentation
+
+
+class StreamingVideoWriter:
+    """Class for encoding frames into a video file as soon as they are rendered.
+
+    Frames are passed through a bounded queue to a thread feeding them to ffmpeg, so rendering of the next frame runs
+    while the previous one is being encoded. When the queue is full, write_frame waits for the encoder to catch up,
+    which keeps the memory used by the frames at queue_size frames no matter how long the video is. The video is written
+    without sound, AudioMuxer puts the audio in afterwards.
+
+    Attributes
+    ----------
+    filename: str
+        path of the video file to be written
+    fps: float
+        frames per second of the written video
+    queue_size: int
+        maximum amount of frames waiting for the encoder
+    instrumentation: Instrumentation
+        records the time spent encoding every frame
+
+    Methods
+    -------
+    write_frame(frame: np.array)
+        queues the frame for encoding
+    close()
+        encodes the remaining frames and finishes the video file
+    """
+
+    # how long write_frame waits at once before checking that the encoder is still running
+    check_interval = 0.5
+
+    def __init__(self, filename: str, fps: float, codec="libx264", queue_size=8, instrumentation=None):
+        """StreamingVideoWriter constructor. The encoder is started with the first frame, as that gives the size
+
+        :param filename: path of the video file to be written
+        :param fps: frames per second of the written video
+        :param codec: video codec used by ffmpeg
+        :param queue_size: maximum amount of frames waiting for the encoder
+        :param instrumentation: Instrumentation recording the encoding time of every frame as the "encode" stage
+        """
+        self.filename = filename
+        self.fps = fps
+        self.codec = codec
+        self.queue_size = queue_size
+        self.frames_written = 0
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__thread = None
+        self.__writer = None
+        self.__error = None
+
+    def write_frame(self, frame: np.array):
+        """Queues the frame for encoding. Blocks while the queue is full
+
+        :param frame: RGB frame. It is copied, so the caller can reuse the array right away
+        """
+        if self.__thread is None:
+            self.__start(frame)
+        frame = np.array(frame, dtype=np.uint8, copy=True)
+        while True:
+            self.__raise_error()
+            try:
+                self.__queue.put(frame, timeout=self.check_interval)
+                return
+            except queue.Full:
+                pass
+
+    def close(self):
+        """Waits for all the queued frames to be encoded and closes the video file. Raises the error of the encoder if
+        it failed
+        """
+        if self.__thread is not None:
+            while self.__thread.is_alive():
+                try:
+                    self.__queue.put(None, timeout=self.check_interval)
+                    break
+                except queue.Full:
+                    pass
+            self.__thread.join()
+            self.__thread = None
+        self.__raise_error()
+
+    def __start(self, frame: np.array):
+        height, width = np.shape(frame)[:2]
+        self.__writer = FFMPEG_VideoWriter(self.filename, (width, height), self.fps, codec=self.codec)
+        self.__thread = threading.Thread(target=self.__encode, daemon=True)
+        self.__thread.start()
+
+    def __encode(self):
+        try:
+            while True:
+                frame = self.__queue.get()
+                if frame is None:
+                    break
+                with self.instrumentation.stage("encode"):
+                    self.__writer.write_frame(frame)
+                self.frames_written += 1
+        except Exception as e:
+            self.__error = e
+        finally:
+            self.__writer.close()
+
+    def __raise_error(self):
+        if self.__error is not None:
+            raise self.__error
@@ -0,0 +1,193 @@
+import shutil
+import sys
+import time
+import cv2 as cv
+import numpy as np
+from helper import Helper
+from generators.AnsiFrameEncoder import AnsiFrameEncoder
+from generators.AsciicastWriter import AsciicastWriter
+from generators.FrameSource import FrameSource
+
+
+class TerminalPlayer:
+    """Class playing a video or live feed as colored text right in the terminal.
+
+    Every cell gets the 24-bit color of its part of the frame and only the cells that changed since the previous frame
+    are written (see AnsiFrameEncoder), so a mostly still picture costs a few bytes per frame instead of a repaint of
+    the whole screen. Frames are shown at the given frame rate, frames that come too late are skipped. The same text
+    can be recorded into an asciicast file instead of being shown, which any asciicast player replays later.
+
+    Attributes
+    ----------
+    source: FrameSource
+        where the frames come from
+    width: int
+        amount of text columns, the width of the terminal by default
+    max_height: int
+        maximum amount of text rows, the height of the terminal (minus one line) by default
+    ascii_gradient: str
+        text representing brightness gradient that pixels are mapped to
+    color: bool
+        colors every character with the color of the frame, otherwise all the text has fg_color
+    fg_color: tuple[3]
+        RGB color of the text when color is False, None keeps the color of the terminal
+    fps: float
+        frame rate of the playback, None shows the frames as they come (webcam)
+    color_step: int
+        colors are rounded down to multiples of this, fewer changed colors mean fewer bytes
+    output
+        binary stream the terminal is written to
+
+    Methods
+    -------
+    play(max_frames=None)
+        plays the frames and returns statistics about the playback
+    record(path: str, max_frames=None, title=None)
+        writes the frames into an asciicast recording and returns statistics about it
+    """
+
+    # terminal cells are about twice as tall as wide
+    cell_aspect = 2
+
+    def __init__(self, source: FrameSource, width=None, max_height=None, ascii_gradient=" .-;+=xX$█", color=True,
+                 foreground_color=None, invert_gradient=False, fps=None, color_step=4, output=None):
+        """TerminalPlayer constructor
+
+        :param source: where the frames come from
+        :param width: amount of text columns, the width of the terminal when None
+        :param max_height: maximum amount of text rows, the height of the terminal when None
+        :param ascii_gradient: brightness gradient which the pixels are mapped to
+        :param color: colors every character with the color of its part of the frame
+        :param foreground_color: RGB color of all the text when color is False
+        :param invert_gradient: reverses the gradient
+        :param fps: frame rate of the playback, None shows the frames as soon as they come
+        :param color_step: colors are rounded down to multiples of this (1 keeps them exact)
+        :param output: binary stream to write to, the standard output when None
+        """
+        terminal_size = shutil.get_terminal_size()
+        self.source = source
+        self.width = width if width is not None else terminal_size.columns
+        self.max_height = max_height if max_height is not None else terminal_size.lines - 1
+        self.ascii_gradient = ascii_gradient[::-1] if invert_gradient else ascii_gradient
+        self.color = color
+        self.fg_color = foreground_color
+        self.fps = fps
+        self.color_step = color_step
+        self.output = output if output is not None else sys.stdout.buffer
+        # floors the brightness the same way CMDAsciiGenerator does
+        self.gradient_lookup = Helper.get_gradient_lookup(len(self.ascii_gradient), rounding=False)
+
+    def play(self, max_frames=None) -> dict:
+        """Plays the frames until the source ends or max_frames frames were shown. Ctrl+C stops the playback
+
+        :param max_frames: amount of frames after which to stop, None plays everything
+        :return: dict: shown and skipped frames, bytes written in total, bytes of the first (whole) frame, mean bytes of
+            the following frames, seconds taken and achieved frame rate
+        """
+        encoder = AnsiFrameEncoder(self.ascii_gradient, color_step=self.color_step, foreground_color=self.fg_color)
+        frame_time = 1 / self.fps if self.fps else 0
+        shown = skipped = bytes_written = first_frame_bytes = 0
+        grid_size = None
+        start_time = time.perf_counter()
+        next_time = start_time
+        self.output.write(b"\x1b[?25l")  # hides the cursor
+        try:
+            while max_frames is None or shown < max_frames:
+                frame = self.source.read()
+                if frame is None:
+                    break
+                if frame_time:
+                    if time.perf_counter() > next_time + frame_time:
+                        # more than a frame behind, skip this one to catch up
+                        skipped += 1
+                        next_time += frame_time
+                        continue
+                if grid_size is None:
+                    grid_size = self.__get_grid_size(np.shape(frame))
+                index_grid, colors = self.__frame_to_cells(frame, grid_size)
+                data = encoder.encode(index_grid, colors).encode("utf-8")
+                self.output.write(data)
+                self.output.flush()
+                bytes_written += len(data)
+                if shown == 0:
+                    first_frame_bytes = len(data)
+                shown += 1
+                if frame_time:
+                    next_time += frame_time
+                    delay = next_time - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # resets the color, puts the cursor under the picture and shows it again
+            rows = grid_size[1] if grid_size is not None else 0
+            self.output.write(f'\x1b[0m\x1b[{rows + 1};1H\x1b[?25h'.encode("utf-8"))
+            self.output.flush()
+        elapsed = time.perf_counter() - start_time
+        return {
+            "shown": shown,
+            "skipped": skipped,
+            "bytes_written": bytes_written,
+            "first_frame_bytes": first_frame_bytes,
+            "mean_update_bytes": (bytes_written - first_frame_bytes) / (shown - 1) if shown > 1 else 0,
+            "seconds": elapsed,
+            "fps": shown / elapsed if elapsed > 0 else 0,
+        }
+
+    def record(self, path: str, max_frames=None, title=None) -> dict:
+        """Records the frames into an asciicast v2 file until the source ends or max_frames frames were recorded.
+        With a frame rate the frames are timed by it and converted as fast as possible, nothing is skipped. Without one
+        (webcam) they are timed by when they came. Ctrl+C stops the recording
+
+        :param path: path of the recording to write
+        :param max_frames: amount of frames after which to stop, None records everything
+        :param title: title of the recording shown by the players
+        :return: dict: recorded frames, bytes written, seconds taken and achieved frame rate
+        """
+        writer = None
+        recorded = 0
+        start_time = time.perf_counter()
+        try:
+            while max_frames is None or recorded < max_frames:
+                frame = self.source.read()
+                if frame is None:
+                    break
+                seconds = recorded / self.fps if self.fps else time.perf_counter() - start_time
+                if writer is None:
+                    cols, rows = self.__get_grid_size(np.shape(frame))
+                    writer = AsciicastWriter(path, cols, rows, self.ascii_gradient, title=title,
+                                             color_step=self.color_step, foreground_color=self.fg_color)
+                index_grid, colors = self.__frame_to_cells(frame, (writer.width, writer.height))
+                writer.write_frame(seconds, index_grid, colors)
+                recorded += 1
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if writer is not None:
+                writer.close()
+        elapsed = time.perf_counter() - start_time
+        return {
+            "recorded": recorded,
+            "bytes_written": writer.bytes_written if writer is not None else 0,
+            "seconds": elapsed,
+            "fps": recorded / elapsed if elapsed > 0 else 0,
+        }
+
+    def __get_grid_size(self, frame_shape: tuple) -> tuple:
+        # (columns, rows) fitting into the terminal while keeping the proportions of the frame
+        height, width = frame_shape[:2]
+        cols = self.width
+        rows = max(1, round(cols * height / width / self.cell_aspect))
+        if rows > self.max_height:
+            rows = self.max_height
+            cols = max(1, min(self.width, round(rows * self.cell_aspect * width / height)))
+        return cols, rows
+
+    def __frame_to_cells(self, frame: np.array, grid_size: tuple) -> tuple:
+        # area averaging keeps small details from flickering in and out between frames
+        resized = cv.resize(frame, grid_size, interpolation=cv.INTER_AREA)
+        # value of HSV is the largest of the BGR channels, so the conversion to HSV is not needed
+        index_grid = self.gradient_lookup[resized.max(axis=2)]
+        colors = resized[:, :, ::-1] if self.color else None
+        return index_grid, colors
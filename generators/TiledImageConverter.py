@@ -0,0 +1,166 @@
+import math
+import time
+import numpy as np
+from PIL import Image, ImageOps
+from helper import Helper
+from Effect import Effect
+from RenderBackend import RenderBackend
+from generators.ImageAsciiGenerator import ImageAsciiGenerator
+from generators.PngStripWriter import PngStripWriter
+
+
+class TiledImageConverter:
+    """Class converting images too big for the memory (gigapixel scans, panoramas) into text images strip by strip.
+
+    The text image is as big as the source, so the usual conversion holds the source, the text image and the float
+    buffer the text is drawn in, several times the size of the image. Here the text grid is cut into horizontal strips
+    of whole rows of cells. Every strip is scaled down, converted and drawn on its own, then appended to the PNG by
+    PngStripWriter, so only one strip of the text image and one drawing buffer exist at a time. Rainbow effects are
+    computed for the position of the strip in the whole image, and every strip is drawn with the rows of its
+    neighbours the glyphs reach into, so the result has no seams. The strips are cut from the source the same way
+    ImageAsciiGenerator.load_cells cuts the whole image, so the result is the same as ImageAsciiGenerator.from_file.
+
+    JPEG sources are decoded at a reduced size (1/2, 1/4 or 1/8, see Helper.get_reduction), the decoder averages
+    the blocks itself and the decoded image is up to 64 times smaller. Other formats cannot be decoded in parts and are
+    decoded whole once. Only the atlas backend draws strips. When a strip fails, the unfinished PNG is deleted.
+
+    Attributes
+    ----------
+    path: str
+        path to the image to convert
+    font_size: int
+        size of the text, one cell is font_size pixels of the source
+    effect: Effect
+        effect to be used on the image
+    match_shapes: bool
+        picks the characters by the shape of the cell instead of only its brightness
+    strip_rows: int
+        rows of cells in a strip, chosen to keep the drawing buffer under strip_memory when None
+    show_progress: bool
+        prints a progress bar of the strips
+    settings: dict
+        other keyword arguments for ImageAsciiGenerator
+
+    Methods
+    -------
+    convert(output_path: str)
+        converts the image and writes it into a PNG file
+    """
+
+    # bytes the drawing buffer of one strip may take when the amount of rows is not given
+    strip_memory = 64 * 2 ** 20
+    # biggest image opened, in place of the limit of PIL (Image.MAX_IMAGE_PIXELS) which is far below gigapixel images
+    max_pixels = 2 ** 34
+    # EXIF tag of the orientation and the orientations swapping the width and height
+    orientation_tag = 0x0112
+    transposing_orientations = (5, 6, 7, 8)
+
+    def __init__(self, path: str, font_size=8, effect=None, match_shapes=False, strip_rows=None, show_progress=True,
+                 **settings):
+        """TiledImageConverter constructor
+
+        :param path: path to the image to convert
+        :param font_size: size of the text to use in the final image
+        :param effect: specific effect to put on the image
+        :param match_shapes: picks the character whose glyph looks most like the cell
+        :param strip_rows: rows of cells converted at once, chosen from strip_memory when None
+        :param show_progress: prints a progress bar of the strips
+        :param settings: any other arguments of the ImageAsciiGenerator constructor, except image and cell_pixels
+        """
+        if settings.get("backend", RenderBackend.ATLAS) != RenderBackend.ATLAS:
+            raise ValueError("Only the atlas backend can draw an image in strips")
+        self.path = path
+        self.font_size = font_size
+        self.effect = effect
+        self.match_shapes = match_shapes
+        self.strip_rows = strip_rows
+        self.show_progress = show_progress
+        self.settings = settings
+
+    def convert(self, output_path: str) -> dict:
+        """Converts the image strip by strip and writes it into a PNG file
+
+        :param output_path: path of the PNG to write
+        :return: dict: amount of strips, width and height of the written image, bytes written and seconds taken
+        """
+        start_time = time.time()
+        source, width, height, cell = self.__open()
+        # shape matching compares 4x4 parts of every cell, the feature shape of GlyphMatcher
+        cell_pixels = 4 if self.match_shapes else 1
+        cols, total_rows = width // self.font_size, height // self.font_size
+        if cols == 0 or total_rows == 0:
+            raise ValueError(f'{self.path} is smaller than a single cell of size {self.font_size}')
+        generator = ImageAsciiGenerator(None, font_size=self.font_size, effect=self.effect,
+                                        match_shapes=self.match_shapes, cell_pixels=cell_pixels, **self.settings)
+        rows_above, rows_below = generator.get_strip_margin()
+        strip_rows = self.strip_rows or max(1, self.strip_memory // (12 * cols * self.font_size ** 2))
+        # the text image is always font_size pixels tall for every row, even where the rows are drawn taller
+        total_height = total_rows * self.font_size
+        strips = math.ceil(total_rows / strip_rows)
+
+        writer = None
+        converted = 0
+        try:
+            for first_row in range(0, total_rows, strip_rows):
+                last_row = min(total_rows, first_row + strip_rows)
+                # the rows around the strip are drawn as well, for the parts of their glyphs reaching into it
+                top_row, bottom_row = max(0, first_row - rows_above), min(total_rows, last_row + rows_below)
+                cells = self.__read_cells(source, cell, cols, (top_row, bottom_row), cell_pixels)
+                generator.strip = (top_row, total_rows)
+                rendered = generator.render(cells)
+                row_height = len(rendered) // (bottom_row - top_row)
+                rendered = rendered[(first_row - top_row) * row_height:(last_row - top_row) * row_height]
+                if writer is None:
+                    writer = PngStripWriter(output_path, np.shape(rendered)[1])
+                writer.write(rendered[:total_height - writer.height])
+                converted += 1
+                if self.show_progress:
+                    Helper.print_progress_bar(iteration=converted, total=strips, prefix="Converting strips")
+                if writer.height >= total_height:
+                    # the rows drawn taller than the font do not fit, the whole image cuts them off the same way
+                    break
+            writer.close()
+        except BaseException:
+            if writer is not None:
+                writer.discard()
+            raise
+        finally:
+            source.close()
+        return {"strips": converted, "width": writer.width, "height": writer.height,
+                "bytes_written": writer.bytes_written, "seconds": time.time() - start_time}
+
+    def __open(self) -> tuple:
+        # opens the source without decoding it, returns the image, the full size of the source and the size of a cell in
+        # pixels of the decoded image
+        source = Helper.open_image(self.path)
+        width, height = source.size
+        if self.max_pixels is not None and width * height > self.max_pixels:
+            source.close()
+            raise Image.DecompressionBombError(f'{self.path} has {width * height} pixels, more than max_pixels '
+                                               f'({self.max_pixels})')
+        cell_pixels = 4 if self.match_shapes else 1
+        reduction = Helper.get_reduction(self.font_size, cell_pixels)
+        if reduction > 1:
+            # only JPEG supports it, the others ignore it and are decoded at full size. PIL picks the largest scale the
+            # requested size fits into and returns the box of the whole image at that scale
+            drafted = source.draft("RGB", (max(1, width // reduction), max(1, height // reduction)))
+            reduction = round(width / drafted[1][2]) if drafted is not None else 1
+        orientation = source.getexif().get(self.orientation_tag, 1)
+        if orientation != 1:
+            # OpenCV turns images by their EXIF orientation when converting them whole, so they are turned here as well
+            turned = ImageOps.exif_transpose(source)
+            source.close()
+            source = turned
+            if orientation in self.transposing_orientations:
+                width, height = height, width
+        return source, width, height, self.font_size // reduction
+
+    def __read_cells(self, source: Image, cell: int, cols: int, row_range: tuple, cell_pixels: int) -> np.array:
+        # decodes the part of the source under the rows of cells and scales it down to cell_pixels for every cell. The
+        # cells are whole pixels and cut the same way as by ImageAsciiGenerator.load_cells, so the strips put together
+        # are scaled down the same as the whole image
+        box = (0, row_range[0] * cell, cols * cell, row_range[1] * cell)
+        rgb = np.asarray(source.crop(box).convert("RGB"))
+        cells_size = (cols * cell_pixels, (row_range[1] - row_range[0]) * cell_pixels)
+        return Helper.downscale_image(np.ascontiguousarray(rgb[:, :, ::-1]), cells_size,
+                                      color=self.effect == Effect.ORIGINAL_COLOR)
@@ -1,10 +1,19 @@
+import os
+import tempfile
 import cv2 as cv
 from helper import Helper
-from moviepy import AudioFileClip, VideoFileClip, ImageSequenceClip, VideoClip
+from moviepy import VideoFileClip, ImageSequenceClip, VideoClip
+from generators.AsciiRenderer import AsciiRenderer
+from generators.AudioMuxer import AudioMuxer
+from generators.CellGridContainer import CellGridWriter
 from generators.ImageAsciiGenerator import ImageAsciiGenerator
-import numpy as np
+from generators.ScaledFrameReader import ScaledFrameReader
+from generators.StreamingVideoWriter import StreamingVideoWriter
+from generators.ParallelFrameRenderer import ParallelFrameRenderer
 import time
 from Effect import Effect
+from RenderBackend import RenderBackend
+from instrumentation import Instrumentation
 
 
 class VideoAsciiGenerator:
@@ -30,15 +39,44 @@ class VideoAsciiGenerator:
         represents the end time until which to convert the given video
     effect: Effect
         represents the effect to be used on the video
+    backend: RenderBackend
+        decides how the text is drawn onto the frames
+    streaming: bool
+        encodes every frame right after it is converted, so memory use does not grow with the length of the video
+    workers: int
+        amount of processes converting the frames, 1 converts them in the main process
+    incremental: bool
+        only redraws the parts of a frame that changed since the previous frame
+    cache_size: int
+        amount of rendered frames kept to be reused when the same text frame repeats, 0 turns the cache off
+    instrumentation: Instrumentation
+        collects the time spent in every stage, printed at the end of the conversion when enabled
+    match_shapes: bool
+        picks the characters by the shape of the cells instead of only their brightness
+    prescale: bool
+        reads the frames in order with the decoder scaling them down to the text grid, instead of decoding every frame
+        at full size and scaling it afterwards
+    luma: bool
+        with prescale, reads only the brightness (luma) of the frames. Not possible with the original color effect
+    frame_offset: int
+        number of the first converted frame within a longer conversion split into parts, keeps effects changing over
+        time continuous between the parts
 
     Methods
     -------
-    convert()
+    convert(filename=None, audio=True)
         converts the video into text based on the arguments given in constructor
+    save_cells(filename: str, keyframe_interval=30)
+        converts the video into a cell file, which CellGridRenderer draws in any style without the source
     """
 
+    # maximum amount of converted frames waiting for the encoder in streaming mode
+    stream_queue_size = 8
+
     def __init__(self, video, font_size=8, gradient=' .-;+=xX$█', use_contrast=False, background_color=(66, 5, 5),
-                 foreground_color=(164, 255, 45), video_start=None, video_end=None, effect=None, invert_gradient=False):
+                 foreground_color=(164, 255, 45), video_start=None, video_end=None, effect=None, invert_gradient=False,
+                 backend=RenderBackend.ATLAS, streaming=False, workers=1, incremental=False,
+                 cache_size=0, instrumentation=None, match_shapes=False, prescale=False, luma=False, frame_offset=0):
         """VideoAsciiGenerator constructor
 
         :param video: file path to the video to be converted
@@ -51,7 +89,20 @@ class VideoAsciiGenerator:
         :param video_end: represents the end time until which to convert the given video
         :param effect: represents the effect to be used on the video
         :param invert_gradient: reverses the gradient text
+        :param backend: decides how the text is drawn onto the frames
+        :param streaming: encodes the frames as they are converted instead of keeping all of them in memory
+        :param workers: amount of processes converting the frames
+        :param incremental: redraws only the cells of a frame that changed since the previous frame
+        :param cache_size: amount of rendered frames kept for reuse (per process), 0 turns the cache off
+        :param instrumentation: Instrumentation recording the time of every stage, nothing is recorded when None
+        :param match_shapes: picks the characters by the shape of the cells instead of only their brightness
+        :param prescale: reads the frames sequentially, scaled down to the text grid by the decoder
+        :param luma: reads only the brightness of the frames when prescaling, the characters then follow the luma
+            instead of the HSV value
+        :param frame_offset: number of the first frame when this is a part of a longer conversion (see SegmentJob)
         """
+        if luma and effect == Effect.ORIGINAL_COLOR:
+            raise ValueError("The original color effect needs the colors, it cannot be used with luma")
         self.video = video
         self.font_size = font_size
         self.gradient = gradient[::-1] if invert_gradient else gradient
@@ -61,22 +112,99 @@ class VideoAsciiGenerator:
         self.video_start = video_start
         self.video_end = video_end
         self.effect = effect
+        self.backend = backend
+        self.streaming = streaming
+        self.workers = workers
+        self.incremental = incremental
+        self.cache_size = cache_size
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
+        self.match_shapes = match_shapes
+        self.prescale = prescale
+        self.luma = luma and prescale
+        self.frame_offset = frame_offset
+        # changed and total cells and frame cache hits and misses of the last conversion
+        self.__render_stats = None
 
-    def convert(self):
+    def convert(self, filename=None, audio=True):
         """Main function of VideoAsciiGenerator Class
 
         Creates a video based on the original where brightness is represented with text characters instead of colors.
+        In streaming mode the frames are encoded as they are converted instead of being kept in memory until the end.
+        The frames are saved without sound first, the audio of the source is then copied in without encoding it again.
+
+        :param filename: path of the video to write, the user is asked for it when None
+        :param audio: copies the audio of the source into the video, otherwise the video has no sound
+        """
+        # output path is asked for first, so the conversion runs without waiting for the user in the middle
+        if filename is None:
+            filename = self.__get_output_path()
+        silent_file = self.__get_silent_path(filename) if audio else filename
+        try:
+            if self.streaming:
+                self.__convert_streaming(silent_file)
+            else:
+                text_frames, fps = self.__get_frames()
+                video = self.__frames_to_video(text_frames, fps)
+                self.__save_video(video, silent_file)
+            if audio:
+                self.__add_audio(silent_file, filename)
+        finally:
+            if audio and os.path.exists(silent_file):
+                os.remove(silent_file)
+        self.instrumentation.stop()
+        if self.instrumentation.enabled:
+            self.instrumentation.print_summary()
+
+    def save_cells(self, filename: str, keyframe_interval=30):
+        """Converts the video into a cell file holding the character and color of every cell of every frame. Nothing
+        is drawn or encoded, CellGridRenderer draws the video from the file later with any colors, effect or font size.
+        The font size given to this generator sets the size of the cells, as in convert
+
+        :param filename: path of the cell file to write
+        :param keyframe_interval: every how many frames a whole frame is stored, the ones in between store changes
         """
-        text_frames, fps = self.__get_frames()
-        video = self.__frames_to_video(text_frames, fps)
-        audio = self.__extract_audio()
-        final = self.__combine_video_audio(video, audio)
-        self.__save_video(final)
+        video, num_frames = self.__open_video()
+        generator = ImageAsciiGenerator(image=None, font_size=self.font_size, ascii_gradient=self.gradient,
+                                        use_contrast=self.use_contrast, effect=self.effect,
+                                        instrumentation=self.instrumentation, match_shapes=self.match_shapes,
+                                        cell_pixels=self.__get_cell_pixels())
+        # the source is stored so the audio can be taken from it when drawing the video
+        metadata = {"gradient": self.gradient, "font_size": self.font_size, "source": os.path.abspath(self.video),
+                    "start": self.video_start, "end": self.video_end}
+        writer = CellGridWriter(filename, video.fps, keyframe_interval=keyframe_interval, metadata=metadata)
+        start_time = time.time()
+        self.instrumentation.start()
+        try:
+            for i, (frame, _) in enumerate(self.__decode_frames(video, num_frames)):
+                index_grid, cells = generator.get_cells(frame)
+                with self.instrumentation.stage("write_cells"):
+                    writer.write(index_grid, cells)
+                self.instrumentation.frame_done()
+                Helper.print_progress_bar(iteration=i + 1, total=num_frames, prefix="Converting frames into cells",
+                                          instrumentation=self.instrumentation)
+        finally:
+            writer.close()
+            video.close()
+        self.instrumentation.stop()
+        print(f'\n-----{writer.frames_written} FRAMES SAVED IN {time.time() - start_time} SECONDS-----')
+        print(f'Cell file size: {os.path.getsize(filename)} bytes')
+        if self.instrumentation.enabled:
+            self.instrumentation.print_summary()
+
+    def __add_audio(self, silent_file: str, filename: str):
+        # copies the audio of the converted part of the source into the video
+        with self.instrumentation.stage("audio"):
+            result = AudioMuxer(self.video, self.video_start, self.video_end).mux(silent_file, filename)
+        if result == "transcode":
+            print("The audio codec of the source does not fit into the video, the audio was encoded again")
 
-    def __extract_audio(self):
-        audio_clip = AudioFileClip(self.video)
-        aud_start, aud_end = self.__get_clip_timestamps(audio_clip)
-        return audio_clip.subclipped(aud_start, aud_end)
+    @staticmethod
+    def __get_silent_path(filename: str) -> str:
+        # temporary file next to the output for the video without sound
+        handle, path = tempfile.mkstemp(suffix=os.path.splitext(filename)[1],
+                                        dir=os.path.dirname(os.path.abspath(filename)))
+        os.close(handle)
+        return path
 
     def __get_clip_timestamps(self, clip):
         if self.video_start is None:
@@ -92,13 +220,14 @@ class VideoAsciiGenerator:
             vid_end = self.video_end
         return vid_start, vid_end
 
-    def __get_frames(self):
+    def __open_video(self):
         video = VideoFileClip(self.video)
         vid_start, vid_end = self.__get_clip_timestamps(video)
         video = video.subclipped(vid_start, vid_end)
         fps = video.fps
         duration = video.duration
-        num_frames = int(fps * duration)
+        # parts of a longer conversion end on frame boundaries, which the float math can put a tiny bit under
+        num_frames = int(fps * duration + 1e-6)
         print("-------VIDEO INFORMATION-------")
         print(f'Video duration: {duration}')
         print(f'Video start: {vid_start}')
@@ -106,45 +235,156 @@ class VideoAsciiGenerator:
         print(f'FPS: {fps}')
         print(f'Total frames: {num_frames}')
         print("--------------------------------")
-        frame_timestamp = duration / num_frames
-        if self.effect == Effect.VIDEO_RAINBOW_GRADUAL:
-            bg_color = (0, 0, 0)
+        return video, num_frames
+
+    def __render_frames(self, video: VideoFileClip, num_frames: int):
+        # yields the converted frames one by one. The yielded array can be reused for the next frame
+        frames = self.__decode_frames(video, num_frames)
+        if self.workers > 1:
+            parallel = ParallelFrameRenderer(self.workers, self.__get_renderer_settings(),
+                                             instrumentation=self.instrumentation)
+            converted = parallel.render_frames(frames)
         else:
-            bg_color = self.bg_color
+            parallel = None
+            converted = self.__render_serial(frames)
+        self.instrumentation.start()
+        for i, frame in enumerate(converted):
+            self.instrumentation.frame_done()
+            Helper.print_progress_bar(iteration=i + 1, total=num_frames, prefix="Loading and converting images",
+                                      instrumentation=self.instrumentation)
+            yield frame
+        if parallel is not None:
+            self.__render_stats = parallel.stats
+
+    def __render_serial(self, frames):
+        renderer = AsciiRenderer(instrumentation=self.instrumentation, **self.__get_renderer_settings())
+        stats = {"changed_cells": 0, "total_cells": 0, "cache_hits": 0, "cache_misses": 0}
+        self.__render_stats = stats
+        for frame, fg_color in frames:
+            result = renderer.render(frame, foreground_color=fg_color)
+            if renderer.last_stats is not None:
+                stats["changed_cells"] += renderer.last_stats["changed_cells"]
+                stats["total_cells"] += renderer.last_stats["total_cells"]
+            if renderer.frame_cache is not None:
+                stats["cache_hits"] = renderer.frame_cache.hits
+                stats["cache_misses"] = renderer.frame_cache.misses
+            yield result
+
+    def __print_render_stats(self):
+        stats = self.__render_stats
+        if stats is None:
+            return
+        if self.incremental and stats["total_cells"] > 0:
+            changed, total = stats["changed_cells"], stats["total_cells"]
+            print(f'Redrawn cells: {changed}/{total} ({100 * changed / total:.1f}%)')
+        if self.cache_size > 0 and self.backend == RenderBackend.ATLAS:
+            print(f'Frame cache: {stats["cache_hits"]} hits, {stats["cache_misses"]} misses')
+
+    def __decode_frames(self, video: VideoFileClip, num_frames: int):
+        # yields every frame in HSV together with its text color (None when the configured one should be used)
+        if self.prescale:
+            yield from self.__decode_scaled_frames(video, num_frames)
+            return
+        frame_timestamp = video.duration / num_frames
+        for i in range(num_frames):
+            with self.instrumentation.stage("decode"):
+                frame = video.frame_function(i * frame_timestamp)
+            with self.instrumentation.stage("to_hsv"):
+                frame = cv.cvtColor(frame, cv.COLOR_BGR2HSV)
+            yield frame, self.__get_frame_color(i)
+
+    def __decode_scaled_frames(self, video: VideoFileClip, num_frames: int):
+        # same as __decode_frames, but the frames are read in order and come out of the decoder already scaled down,
+        # with cell_pixels pixels for every cell. With luma the frames are only the 2D brightness
+        # the clip keeps its own full size decoder running, which is not needed here
+        video.reader.close()
+        cell_pixels = self.__get_cell_pixels()
+        width, height = video.size
+        size = (width // self.font_size * cell_pixels, height // self.font_size * cell_pixels)
+        reader = ScaledFrameReader(self.video, size, start=self.video_start or 0, duration=video.duration,
+                                   gray=self.luma)
+        try:
+            for i in range(num_frames):
+                with self.instrumentation.stage("decode"):
+                    frame = reader.read()
+                if frame is None:
+                    break
+                if not self.luma:
+                    with self.instrumentation.stage("to_hsv"):
+                        frame = cv.cvtColor(frame, cv.COLOR_BGR2HSV)
+                yield frame, self.__get_frame_color(i)
+        finally:
+            reader.close()
+
+    def __get_frame_color(self, frame_number: int):
+        # text color of the frame, None when the configured one should be used
+        if self.effect != Effect.VIDEO_RAINBOW_GRADUAL:
+            return None
+        hue = (2 * (self.frame_offset + frame_number)) % 181  # for some reason, hue has range 0 - 180
+        return tuple(Helper.get_hue_lookup()[hue].tolist())
+
+    def __get_cell_pixels(self):
+        # pixels of every cell in the decoded frames, None keeps the frames at full size (a cell is font_size big)
+        if not self.prescale:
+            return None
+        # shape matching compares 4x4 parts of every cell, the feature shape of GlyphMatcher
+        return 4 if self.match_shapes else 1
+
+    def __get_frames(self):
+        video, num_frames = self.__open_video()
         start_time = time.time()
+        # renderer reuses its output buffer, so the frames have to be copied. Read only frames come from the frame
+        # cache and never change, so repeated frames share one array
         text_frames = []
-        for i in range(num_frames):
-            Helper.print_progress_bar(iteration=i + 1, total=num_frames, prefix="Loading and converting images")
-            frame = video.frame_function(i * frame_timestamp)
-            if self.effect == Effect.VIDEO_RAINBOW_GRADUAL:
-                hue = (2 * i) % 181  # for some reason, hue has range 0 - 180
-                fg_color = Helper.hsv_to_rgb((hue, 1, 1))
-                effect = None
-            else:
-                fg_color = self.fg_color
-                effect = self.effect
-            og_img = cv.cvtColor(frame, cv.COLOR_BGR2HSV)
-            iag = ImageAsciiGenerator(image=og_img, font_size=self.font_size, ascii_gradient=self.gradient,
-                                      use_contrast=self.use_contrast, background_color=bg_color,
-                                      foreground_color=fg_color, effect=effect)
-            converted = iag.convert()
-            text_frames.append(np.array(converted))
+        for frame in self.__render_frames(video, num_frames):
+            with self.instrumentation.stage("copy"):
+                text_frames.append(frame if not frame.flags.writeable else frame.copy())
         end_time = time.time()
         print(f'\n-----FRAMES EXTRACTED IN {end_time - start_time} SECONDS-----')
-        return text_frames, fps
+        self.__print_render_stats()
+        return text_frames, video.fps
+
+    def __convert_streaming(self, filename: str):
+        video, num_frames = self.__open_video()
+        start_time = time.time()
+        writer = StreamingVideoWriter(filename, video.fps, queue_size=self.stream_queue_size,
+                                      instrumentation=self.instrumentation)
+        try:
+            for frame in self.__render_frames(video, num_frames):
+                # time spent waiting for the encoder to take the frame, the encoding itself is the encode stage
+                with self.instrumentation.stage("queue_wait"):
+                    writer.write_frame(frame)
+        finally:
+            writer.close()
+            video.close()
+        end_time = time.time()
+        print(f'\n-----FRAMES CONVERTED AND SAVED IN {end_time - start_time} SECONDS-----')
+        self.__print_render_stats()
+
+    def __get_renderer_settings(self) -> dict:
+        # one renderer is used for all the frames (one for each worker), so the font and tables are only prepared once
+        if self.effect == Effect.VIDEO_RAINBOW_GRADUAL:
+            return dict(font_size=self.font_size, gradient=self.gradient, use_contrast=self.use_contrast,
+                        background_color=(0, 0, 0), foreground_color=self.fg_color, effect=None, backend=self.backend,
+                        incremental=self.incremental, cache_size=self.cache_size, match_shapes=self.match_shapes,
+                        cell_pixels=self.__get_cell_pixels())
+        return dict(font_size=self.font_size, gradient=self.gradient, use_contrast=self.use_contrast,
+                    background_color=self.bg_color, foreground_color=self.fg_color, effect=self.effect,
+                    backend=self.backend, incremental=self.incremental, cache_size=self.cache_size,
+                    match_shapes=self.match_shapes, cell_pixels=self.__get_cell_pixels())
 
     def __frames_to_video(self, frames, fps):
         video = ImageSequenceClip(sequence=frames, fps=fps)
         return video
 
-    def __combine_video_audio(self, video: VideoFileClip, audio: AudioFileClip):
-        final_clip = video.with_audio(audio)
-        return final_clip
-
-    def __save_video(self, final_clip: VideoClip):
+    def __get_output_path(self) -> str:
         directory = Helper.get_directory()
         video_name = input("What do you want to name the video?\n")
-        final_clip.write_videofile(f'{directory}/{video_name}.mp4')
+        return f'{directory}/{video_name}.mp4'
+
+    def __save_video(self, final_clip: VideoClip, filename: str):
+        with self.instrumentation.stage("encode"):
+            final_clip.write_videofile(filename)
         final_clip.close()
 
 
@@ -1,7 +1,11 @@
 import cv2 as cv
-from tkinter import Tk
-from tkinter.filedialog import askopenfilename, askdirectory
+import numpy as np
+from functools import lru_cache
+from PIL import Image
+import io
+import struct
 import sys
+import time
 
 
 class Helper:
@@ -9,36 +13,142 @@ class Helper:
 
     Methods
     -------
-    load_image(filename: str)
+    load_image(filename: str, hsv=True, reduction=1)
         loads an image based on the filepath as a numpy array converted to HSV mode
+    decode_image(data: bytes, hsv=True, reduction=1)
+        same as load_image for an image file already read into memory
+    open_image(source)
+        opens an image with PIL without decoding it and without its limit on the amount of pixels
+    get_reduction(font_size: int, cell_pixels=1)
+        returns the largest reduction a JPEG can be decoded at for the given cells
+    downscale_image(image: np.array, size: tuple, color=True)
+        scales a BGR image down with area averaging, then converts only the small image to HSV or brightness
     get_file
         opens file dialog and allows user to select a file
     hsv_to_rgb(hsv_color: tuple[3])
         converts given hsv color to its rgb equivalent. HSV is defined with max values of (180, 1, 1)
-    print_progress_bar(iteration: int, total: int, prefix='', suffix='', fill='█')
-        prints progress bar into console with percentage completion
+    hsv_to_rgb_array(hsv_array: np.array)
+        converts whole array of hsv colors to rgb at once, giving the same results as hsv_to_rgb
+    get_hue_lookup()
+        returns table of rgb colors for every hue (0-180) with full saturation and value
+    get_gradient_lookup(gradient_length: int, rounding=True)
+        creates a table mapping every brightness value to the index of a gradient character
+    index_grid_to_text(index_grid: np.array, gradient: str, repeat=1)
+        turns a grid of gradient indexes into text
+    print_progress_bar(iteration: int, total: int, prefix='', suffix='', fill='█', instrumentation=None)
+        prints progress bar into console with percentage completion, and throughput and ETA when timings are given
     print_loading_bar(iteration, prefix='Loading')
         prints loading bar into console. Useful for times when user is uncertain how long a function takes
     """
 
+    # flags of cv.imread for every reduction of the size of the loaded image
+    reduced_read_flags = {1: cv.IMREAD_COLOR, 2: cv.IMREAD_REDUCED_COLOR_2, 4: cv.IMREAD_REDUCED_COLOR_4,
+                          8: cv.IMREAD_REDUCED_COLOR_8}
+
     @staticmethod
-    def load_image(filename: str) -> list[list]:
+    def load_image(filename: str, hsv=True, reduction=1) -> list[list]:
         """Loads and converts an image into HSV color mode
 
         :param filename: str: filepath to the file to load
+        :param hsv: bool: converts the image to HSV, False keeps it BGR (for downscale_image)
+        :param reduction: int: 1, 2, 4 or 8, loads the image that many times smaller (rounded up). JPEG images are
+            decoded at the smaller size straight away, which takes a fraction of the time of decoding all the pixels
         :return: numpy array representation of the loaded image
         """
-        img = cv.imread(filename, cv.IMREAD_COLOR)
-        img = cv.cvtColor(img, cv.COLOR_BGR2HSV)
+        img = cv.imread(filename, Helper.reduced_read_flags[reduction])
+        if img is None:
+            raise ValueError(f'Could not read image {filename}')
+        if hsv:
+            img = cv.cvtColor(img, cv.COLOR_BGR2HSV)
+
+        return img
+
+    @staticmethod
+    def decode_image(data: bytes, hsv=True, reduction=1) -> np.array:
+        """Decodes an image file read into memory (an upload for example), the same way load_image reads it from disk
 
+        :param data: bytes: content of the image file
+        :param hsv: bool: converts the image to HSV, False keeps it BGR (for downscale_image)
+        :param reduction: int: 1, 2, 4 or 8, decodes the image that many times smaller (rounded up)
+        :return: numpy array representation of the decoded image
+        """
+        img = cv.imdecode(np.frombuffer(data, dtype=np.uint8), Helper.reduced_read_flags[reduction])
+        if img is None:
+            raise ValueError("Could not decode the image")
+        if hsv:
+            img = cv.cvtColor(img, cv.COLOR_BGR2HSV)
         return img
 
+    @staticmethod
+    def open_image(source) -> Image:
+        """Opens an image with PIL without decoding it, so its size and format can be read from the header. Image.open
+        refuses images over the limit of the whole process (Image.MAX_IMAGE_PIXELS), which gigapixel images are, and
+        changing that limit would affect other threads opening images. The format plugins are asked directly instead,
+        the same way Image.open does it, and the caller checks the size itself
+
+        :param source: path to the image, or the bytes of an image file
+        :return: PIL Image, decoded only when its pixels are used
+        """
+        Image.init()
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+            prefix = source.read(16)
+        else:
+            with open(source, "rb") as file:
+                prefix = file.read(16)
+        for factory, accept in Image.OPEN.values():
+            # accept gives a string when the format is recognised but not supported
+            accepted = accept is None or accept(prefix)
+            if accepted and not isinstance(accepted, str):
+                if isinstance(source, io.BytesIO):
+                    source.seek(0)
+                try:
+                    return factory(source)
+                except (SyntaxError, IndexError, TypeError, struct.error):
+                    continue
+        raise Image.UnidentifiedImageError("cannot identify the image file")
+
+    @staticmethod
+    def get_reduction(font_size: int, cell_pixels=1) -> int:
+        """Returns the largest reduction (see reduced_read_flags) a JPEG can be decoded at for cells of font_size
+        pixels. It divides the font size, so every cell is still whole pixels, and leaves at least cell_pixels pixels
+        for every cell
+
+        :param font_size: int: size of a cell in pixels of the image
+        :param cell_pixels: int: size of a cell in the scaled down image, 4 for shape matching and 1 otherwise
+        :return: 1, 2, 4 or 8
+        """
+        return max((factor for factor in Helper.reduced_read_flags
+                    if factor * cell_pixels <= font_size and font_size % factor == 0), default=1)
+
+    @staticmethod
+    def downscale_image(image: np.array, size: tuple, color=True) -> np.array:
+        """Scales a BGR image down with area averaging and converts only the small image. Every pixel of the result is
+        the average of all the pixels it covers, where the default (bilinear) resize skips most of them and flickers
+        on fine detail. Without color only the brightness is computed, the HSV conversion is skipped entirely
+
+        :param image: np.array: BGR image
+        :param size: tuple: (width, height) to scale the image to
+        :param color: bool: returns the image in HSV, False returns only its brightness (V of HSV) as a 2D array
+        :return: the scaled down image
+        """
+        size = (max(1, int(size[0])), max(1, int(size[1])))
+        small = cv.resize(image, size, interpolation=cv.INTER_AREA)
+        if color:
+            return cv.cvtColor(small, cv.COLOR_BGR2HSV)
+        # value of HSV is the largest of the BGR channels
+        blue, green, red = cv.split(small)
+        return cv.max(cv.max(blue, green), red)
+
     @staticmethod
     def get_file():
         """Prompts the user with file dialog and returns the selected file
 
         :return: file path to the selected file
         """
+        # imported here, so the modes without file dialogs also run where tkinter is not installed
+        from tkinter import Tk
+        from tkinter.filedialog import askopenfilename
         Tk().withdraw()  # we don't want a full GUI, so keep the root window from appearing
         filename = askopenfilename()
         if len(filename) < 1:
@@ -52,6 +162,8 @@ class Helper:
 
         :return: file path to the selected directory
         """
+        from tkinter import Tk
+        from tkinter.filedialog import askdirectory
         Tk().withdraw()
         directory = askdirectory()
         if len(directory) < 1:
@@ -88,7 +200,79 @@ class Helper:
             return c, m, x
 
     @staticmethod
-    def print_progress_bar(iteration: int, total: int, prefix='', suffix='', fill='█'):
+    def hsv_to_rgb_array(hsv_array: np.array) -> np.array:
+        """Converts array of HSV colors to their RGB equivalent. Gives the same results as calling hsv_to_rgb on each
+        color, without the python call for every color
+
+        :param hsv_array: np.array: array of HSV colors with max values (180, 1, 1) in the last dimension
+        :return: array of the same shape with RGB colors in (255, 255, 255) format
+        """
+        hsv_array = np.asarray(hsv_array, dtype=np.float64)
+        c = hsv_array[..., 1] * hsv_array[..., 2]
+        h = hsv_array[..., 0] / 30
+        x = c * (1 - np.abs((h % 2) - 1))
+        m = hsv_array[..., 2] - c
+
+        # int() of positive numbers is the same as flooring them
+        components = np.stack([np.floor((c + m) * 255), np.floor((x + m) * 255), np.floor(m * 255)], axis=-1)
+        components = components.astype(int)
+        # order of (c, x, m) for every sixth of the hue circle, anything outside of 0-5 falls into the last one
+        orders = np.array([[0, 1, 2], [1, 0, 2], [2, 0, 1], [2, 1, 0], [1, 2, 0], [0, 2, 1]])
+        sector = np.where((h >= 0) & (h < 5), np.floor(h), 5).astype(int)
+        return np.take_along_axis(components, orders[sector], axis=-1)
+
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def get_hue_lookup() -> np.array:
+        """Creates a table of RGB colors for every hue with full saturation and value. Used by the rainbow effects
+
+        :return: read only numpy array of shape (181, 3), index is the hue (0-180)
+        """
+        lookup = np.array([Helper.hsv_to_rgb((hue, 1, 1)) for hue in range(181)], dtype=int)
+        lookup.setflags(write=False)
+        return lookup
+
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def get_gradient_lookup(gradient_length: int, rounding=True) -> np.array:
+        """Creates a lookup table mapping every brightness value (0-255) to the index of a gradient character
+
+        :param gradient_length: int: amount of characters in the gradient
+        :param rounding: bool: True rounds the brightness to the closest character (ImageAsciiGenerator),
+            False floors it (CMDAsciiGenerator)
+        :return: read only numpy array with 256 indexes
+        """
+        if gradient_length < 2:
+            lookup = np.zeros(256, dtype=np.intp)
+        else:
+            divider = 255 / (gradient_length - 1)
+            if rounding:
+                lookup = np.array([round(brightness / divider) for brightness in range(256)], dtype=np.intp)
+            else:
+                lookup = np.array([int(brightness // divider) for brightness in range(256)], dtype=np.intp)
+        lookup.setflags(write=False)
+        return lookup
+
+    @staticmethod
+    def index_grid_to_text(index_grid: np.array, gradient: str, repeat=1) -> str:
+        """Turns a grid of gradient indexes into text, each row of the grid ending with a new line character
+
+        :param index_grid: np.array: 2D array of indexes into the gradient
+        :param gradient: str: gradient the indexes point to
+        :param repeat: int: how many times each character is written in a row
+        :return: text representation of the grid
+        """
+        chars = np.array(list(gradient))[index_grid]
+        if repeat > 1:
+            chars = np.repeat(chars, repeat, axis=1)
+        if chars.size == 0:
+            return "\n" * len(chars)
+        # view every row of single characters as one string, which avoids joining the characters one by one
+        rows = np.ascontiguousarray(chars).view(f'<U{np.shape(chars)[1]}')[:, 0]
+        return "\n".join(rows.tolist()) + "\n"
+
+    @staticmethod
+    def print_progress_bar(iteration: int, total: int, prefix='', suffix='', fill='█', instrumentation=None):
         """Prints a progress bar into the console with a percentage progress
 
         :param iteration: int: Current progress
@@ -96,11 +280,16 @@ class Helper:
         :param prefix: str: Text to be written in front of the progress bar
         :param suffix: str: Text to be written at the end of the progress bar
         :param fill: str: Character to be used for filling in the progress bar
+        :param instrumentation: Instrumentation: Timings of the frames, adds throughput and ETA after the percentage
         """
         length = 50
         percentage = ("{0:.2f}").format(100 * (iteration / float(total)))
         filled = int(length * (iteration / total))
         bar = f'|{fill * filled}{"-" * (length - filled)}|'
+        if instrumentation is not None and instrumentation.enabled:
+            eta = instrumentation.get_eta(total)
+            eta_text = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta is not None else "--:--:--"
+            suffix = f'{instrumentation.get_throughput():.1f} fps ETA {eta_text} {suffix}'
         text = f'{prefix}{bar} {percentage}% {suffix}'
 
         sys.stdout.write(f'\r{text}')
@@ -0,0 +1,221 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+from contextlib import contextmanager, nullcontext
+import numpy as np
+
+
+class Instrumentation:
+    """Class collecting how long every stage of a conversion takes.
+
+    Generators wrap their stages (resizing, color computation, drawing, encoding, ...) in stage(name). Every call is
+    recorded, so besides the totals the distribution over the frames can be looked at. Frames are marked with
+    frame_done, which gives the per-frame times, throughput and ETA. A disabled instance costs next to nothing, so the
+    generators always have one. start and stop can be nested, when one instance is shared by several conversions (the
+    segments of a farm run) only the outermost pair starts and stops the clock and the profiler.
+
+    Attributes
+    ----------
+    enabled: bool
+        whether anything is recorded
+    profile: bool
+        whether cProfile runs between start and stop
+    stages: dict
+        name of the stage mapped to the list of its durations in seconds
+    frame_times: list[float]
+        seconds between consecutive frame_done calls
+
+    Methods
+    -------
+    stage(name: str)
+        context manager timing one run of the stage
+    start()
+        starts the clock (and the profiler)
+    frame_done()
+        marks the end of a frame
+    stop()
+        stops the clock (and the profiler)
+    get_throughput()
+        returns frames per second so far
+    get_eta(total: int)
+        returns estimated seconds until total frames are done
+    get_summary()
+        returns all the statistics as a dict
+    print_summary()
+        prints a table of the stages
+    export_json(path: str)
+        writes get_summary into a JSON file
+    export_profile(path: str)
+        writes the cProfile statistics for snakeviz, pstats and similar tools
+    """
+
+    # upper edges of the per-frame histogram buckets in milliseconds
+    histogram_edges = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, enabled=True, profile=False):
+        """Instrumentation constructor
+
+        :param enabled: records the timings when True, does nothing otherwise
+        :param profile: runs cProfile between start and stop
+        """
+        self.enabled = enabled
+        self.profile = profile and enabled
+        self.stages = {}
+        self.frame_times = []
+        self.__start_time = None
+        self.__end_time = None
+        self.__last_frame = None
+        self.__profiler = None
+        self.__depth = 0
+
+    def stage(self, name: str):
+        """Times the code inside the with block as one run of the stage. Safe to use from several threads
+
+        :param name: name of the stage
+        :return: context manager
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self.__time_stage(name)
+
+    @contextmanager
+    def __time_stage(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.setdefault(name, []).append(time.perf_counter() - start_time)
+
+    def start(self):
+        """Starts the clock used for throughput and per-frame times, and the profiler when enabled. Does nothing when
+        already started, apart from counting the call for stop
+        """
+        if not self.enabled:
+            return
+        self.__depth += 1
+        if self.__depth > 1:
+            return
+        self.__start_time = time.perf_counter()
+        self.__end_time = None
+        self.__last_frame = self.__start_time
+        if self.profile:
+            self.__profiler = cProfile.Profile()
+            self.__profiler.enable()
+
+    def frame_done(self):
+        """Marks the end of a frame, the time since the previous frame is its frame time"""
+        if not self.enabled:
+            return
+        if self.__last_frame is None:
+            self.start()
+        now = time.perf_counter()
+        self.frame_times.append(now - self.__last_frame)
+        self.__last_frame = now
+
+    def stop(self):
+        """Stops the clock and the profiler, once stop was called for every start"""
+        if not self.enabled or self.__depth == 0:
+            return
+        self.__depth -= 1
+        if self.__depth > 0:
+            return
+        self.__end_time = time.perf_counter()
+        if self.__profiler is not None:
+            self.__profiler.disable()
+
+    def get_elapsed(self) -> float:
+        """Returns seconds since start (until stop, if it was called)
+
+        :return: float: elapsed seconds, 0 when not started
+        """
+        if self.__start_time is None:
+            return 0
+        end_time = self.__end_time if self.__end_time is not None else time.perf_counter()
+        return end_time - self.__start_time
+
+    def get_throughput(self) -> float:
+        """Returns the amount of frames done per second so far
+
+        :return: float: frames per second, 0 before the first frame
+        """
+        elapsed = self.get_elapsed()
+        return len(self.frame_times) / elapsed if elapsed > 0 else 0
+
+    def get_eta(self, total: int):
+        """Returns the estimated time until all the frames are done, based on the throughput so far
+
+        :param total: total amount of frames
+        :return: float: seconds left, None before the first frame
+        """
+        throughput = self.get_throughput()
+        if throughput <= 0:
+            return None
+        return max(0, total - len(self.frame_times)) / throughput
+
+    def get_summary(self) -> dict:
+        """Returns the statistics of all the stages and frames
+
+        :return: dict: elapsed seconds, frame statistics with histogram and for every stage the amount of calls, total
+            seconds, share of the elapsed time and mean, median, 95th percentile and maximum in milliseconds
+        """
+        elapsed = self.get_elapsed()
+        stages = {}
+        for name, durations in list(self.stages.items()):
+            stages[name] = self.__describe(durations)
+            stages[name]["share"] = stages[name]["total_s"] / elapsed if elapsed > 0 else 0
+        frames = self.__describe(self.frame_times)
+        frames["fps"] = self.get_throughput()
+        counts, _ = np.histogram(np.array(self.frame_times) * 1000, bins=(0,) + self.histogram_edges + (np.inf,))
+        labels = [f'<{edge}ms' for edge in self.histogram_edges] + [f'>={self.histogram_edges[-1]}ms']
+        frames["histogram"] = dict(zip(labels, counts.tolist()))
+        return {"elapsed_s": elapsed, "frames": frames, "stages": stages}
+
+    def print_summary(self):
+        """Prints a table with the time spent in every stage, slowest first"""
+        summary = self.get_summary()
+        print("-----STAGE TIMINGS-----")
+        print(f'{"stage":<16}{"calls":>8}{"total s":>10}{"share":>8}{"mean ms":>10}{"p95 ms":>10}{"max ms":>10}')
+        for name, stage in sorted(summary["stages"].items(), key=lambda item: -item[1]["total_s"]):
+            print(f'{name:<16}{stage["count"]:>8}{stage["total_s"]:>10.3f}{100 * stage["share"]:>7.1f}%'
+                  f'{stage["mean_ms"]:>10.2f}{stage["p95_ms"]:>10.2f}{stage["max_ms"]:>10.2f}')
+        frames = summary["frames"]
+        if frames["count"] > 0:
+            print(f'Frames: {frames["count"]}, {frames["fps"]:.2f} fps, mean {frames["mean_ms"]:.2f} ms, '
+                  f'p95 {frames["p95_ms"]:.2f} ms')
+            print("Frame times: " + ", ".join(f'{label}: {count}' for label, count in frames["histogram"].items()
+                                              if count > 0))
+        if sum(stage["share"] for stage in summary["stages"].values()) > 1:
+            print("Stages of worker processes and threads overlap, so the shares add up to more than 100%")
+        print("-----------------------")
+        if self.__profiler is not None:
+            stream = io.StringIO()
+            pstats.Stats(self.__profiler, stream=stream).sort_stats("cumulative").print_stats(15)
+            print(stream.getvalue())
+
+    def export_json(self, path: str):
+        """Writes the statistics of get_summary into a JSON file
+
+        :param path: path of the file to write
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.get_summary(), file, indent=2)
+
+    def export_profile(self, path: str):
+        """Writes the cProfile statistics into a file readable by pstats
+
+        :param path: path of the file to write
+        """
+        if self.__profiler is None:
+            raise ValueError("Profiling was not enabled")
+        self.__profiler.dump_stats(path)
+
+    @staticmethod
+    def __describe(durations: list) -> dict:
+        if len(durations) == 0:
+            return {"count": 0, "total_s": 0, "mean_ms": 0, "median_ms": 0, "p95_ms": 0, "max_ms": 0}
+        milliseconds = np.array(durations) * 1000
+        return {"count": len(durations), "total_s": float(milliseconds.sum() / 1000),
+                "mean_ms": float(milliseconds.mean()), "median_ms": float(np.median(milliseconds)),
+                "p95_ms": float(np.percentile(milliseconds, 95)), "max_ms": float(milliseconds.max())}
@@ -1,11 +1,23 @@
 import argparse
+import json
+import time
 from helper import Helper
 from generators.CMDAsciiGenerator import CMDAsciiGenerator
 from generators.ImageAsciiGenerator import ImageAsciiGenerator
 from generators.VideoAsciiGenerator import VideoAsciiGenerator
 from generators.CamToAscii import CamToAscii
+from generators.BatchConverter import BatchConverter
+from generators.TerminalPlayer import TerminalPlayer
+from generators.CellGridRenderer import CellGridRenderer
+from generators.SegmentJob import SegmentJob
+from generators.MarkupRenderer import MarkupRenderer
+from generators.TiledImageConverter import TiledImageConverter
+from generators.ConversionServer import ConversionServer
+from generators.FrameSource import CameraSource, VideoFileSource
 from enum import Enum
 from Effect import Effect
+from RenderBackend import RenderBackend
+from instrumentation import Instrumentation
 
 
 class AppMode(Enum):
@@ -13,30 +25,40 @@ class AppMode(Enum):
     IMAGE = 1
     VIDEO = 2
     CAM = 3
+    BATCH = 4
+    TERMINAL = 5
+    CELLS = 6
+    FARM = 7
+    SERVE = 8
 
 
 def run_app(mode: int):
     if mode == AppMode.CMD.value:
         filename = Helper.get_file()
-        img = Helper.load_image(filename)
+        img = Helper.load_image(filename, hsv=False)
         terminal_width = get_argument("Terminal width (220): ", 220, int)
         ascii_gradient = get_argument("Gradient ( .-;+=xX$█): ", " .-;+=xX$█", str)
         invert_gradient = get_argument("Invert gradient (y/n)? (False): ", False, bool)
+        show_timings, timings_path, profile_path = ask_instrumentation()
 
         print("-----GENERATOR INFORMATION-----")
         print(f'File: {filename}')
         print(f'Terminal width: {terminal_width}')
         print(f'Ascii gradient: "{ascii_gradient}"')
         print(f'Invert gradient: {invert_gradient}')
+        print_instrumentation_settings(show_timings, timings_path, profile_path)
         print("--------------------------------")
 
+        instrumentation = get_instrumentation(show_timings, timings_path, profile_path)
         generator = CMDAsciiGenerator(img, terminal_width=terminal_width, ascii_gradient=ascii_gradient,
-                                      invert_gradient=invert_gradient)
+                                      invert_gradient=invert_gradient, instrumentation=instrumentation)
+        instrumentation.start()
         generator.convert()
+        instrumentation.stop()
         generator.show_result()
+        finish_instrumentation(instrumentation, show_timings, timings_path, profile_path)
     elif mode == AppMode.IMAGE.value:
         filename = Helper.get_file()
-        img = Helper.load_image(filename)
         font_size = get_argument("Font size | 8: ", 8, int)
         ascii_gradient = get_argument("Gradient | ' .-;+=xX$█': ", " .-;+=xX$█", str)
         use_contrast = get_argument("Get higher contrast (y/n)? | False: ", False, bool)
@@ -44,6 +66,11 @@ def run_app(mode: int):
         str_fg_color = get_argument("Foreground color | (46, 126, 255): ", None, str)
         invert_gradient = get_argument("Invert gradient (y/n)? | False: ", False, bool)
         effect = get_argument("Effect (leave empty for no effect)? ", None, int)
+        match_shapes = get_argument("Pick characters by the shape of the image (y/n)? | False: ", False, bool)
+        output_format = get_argument("Save as (png/html/svg) | png: ", "png", str).strip().lower()
+        tiled = output_format == "png" and get_argument("Convert in strips, for images too big for the memory (y/n)? "
+                                                        "| False: ", False, bool)
+        show_timings, timings_path, profile_path = ask_instrumentation()
 
         # some editing of values before putting it in the generator
         bg_color = extract_color(str_bg_color, (2, 0, 23))
@@ -62,13 +89,45 @@ def run_app(mode: int):
         print(f'Foreground color: {fg_color}')
         print(f'Invert gradient: {invert_gradient}')
         print(f'Effect: {effect.value if effect is not None else None}')
+        print(f'Match shapes: {match_shapes}')
+        print(f'Format: {output_format}{" (in strips)" if tiled else ""}')
+        print_instrumentation_settings(show_timings, timings_path, profile_path)
         print("--------------------------------")
 
-        generator = ImageAsciiGenerator(img, font_size=font_size, foreground_color=fg_color, background_color=bg_color,
-                                        ascii_gradient=ascii_gradient, invert_gradient=invert_gradient,
-                                        use_contrast=use_contrast, effect=effect)
-        generator.convert()
-        generator.show_result()
+        instrumentation = get_instrumentation(show_timings, timings_path, profile_path)
+        settings = dict(font_size=font_size, foreground_color=fg_color, background_color=bg_color,
+                        ascii_gradient=ascii_gradient, invert_gradient=invert_gradient, use_contrast=use_contrast,
+                        effect=effect, match_shapes=match_shapes, instrumentation=instrumentation)
+        if tiled:
+            # the image is written into the file strip by strip, it is never whole in memory to be shown
+            directory = Helper.get_directory()
+            image_name = input("What do you want to name the image?\n")
+            instrumentation.start()
+            stats = TiledImageConverter(filename, **settings).convert(f'{directory}/{image_name}.png')
+            instrumentation.stop()
+            print(f'\nImage of {stats["width"]}x{stats["height"]} written in {stats["strips"]} strips in '
+                  f'{stats["seconds"]:.1f} seconds')
+        elif output_format in ("html", "svg"):
+            # the text is written as a document, nothing is drawn
+            directory = Helper.get_directory()
+            doc_name = input("What do you want to name the document?\n")
+            start_time = time.perf_counter()
+            instrumentation.start()
+            generator = ImageAsciiGenerator.from_file(filename, **settings)
+            renderer = MarkupRenderer(generator.ascii_gradient, font_size=font_size)
+            size = renderer.save(f'{directory}/{doc_name}.{output_format}',
+                                 *generator.get_text_cells(generator.image))
+            instrumentation.stop()
+            print(f'Document of {size} bytes written in {(time.perf_counter() - start_time) * 1000:.0f} ms')
+        else:
+            instrumentation.start()
+            # the image is loaded already scaled down to the text, colors are only converted when the effect needs
+            # them
+            generator = ImageAsciiGenerator.from_file(filename, **settings)
+            generator.convert()
+            instrumentation.stop()
+            generator.show_result()
+        finish_instrumentation(instrumentation, show_timings, timings_path, profile_path)
     elif mode == AppMode.VIDEO.value:
         filename = Helper.get_file()
         font_size = get_argument("Font size | 8: ", 8, int)
@@ -80,6 +139,17 @@ def run_app(mode: int):
         vid_start = get_argument("Timestamp of video start | 0:00: ", None, float)
         vid_end = get_argument("Timestamp of video end | end of the video: ", None, float)
         effect = get_argument("Effect (leave empty for no effect)? ", None, int)
+        streaming = get_argument("Save frames while converting to lower memory usage (y/n)? | False: ", False, bool)
+        workers = get_argument("Amount of processes converting the frames | 1: ", 1, int)
+        incremental = get_argument("Only redraw changed parts of frames (y/n)? | False: ", False, bool)
+        cache_size = get_argument("Amount of converted frames kept for reuse (0 keeps none) | 0: ", 0, int)
+        show_timings, timings_path, profile_path = ask_instrumentation()
+        match_shapes = get_argument("Pick characters by the shape of the video (y/n)? | False: ", False, bool)
+        prescale = get_argument("Decode frames already scaled down (faster on big videos) (y/n)? | False: ", False,
+                                bool)
+        luma = prescale and get_argument("Only decode the brightness (y/n)? | False: ", False, bool)
+        checkpoint_dir = get_argument("Directory to keep the progress in, to continue after a crash | none: ", None,
+                                      str)
 
         # some editing of values before putting it in the generator
         bg_color = extract_color(str_bg_color, (2, 0, 23))
@@ -100,14 +170,47 @@ def run_app(mode: int):
         print(f'Video start cut: {vid_start}')
         print(f'Video end cut: {vid_end}')
         print(f'Effect: {effect.value if effect is not None else None}')
+        print(f'Streaming: {streaming}')
+        print(f'Workers: {workers}')
+        print(f'Incremental: {incremental}')
+        print(f'Frame cache size: {cache_size}')
+        print_instrumentation_settings(show_timings, timings_path, profile_path)
+        print(f'Match shapes: {match_shapes}')
+        print(f'Prescale: {prescale}')
+        print(f'Luma only: {luma}')
+        print(f'Checkpoints: {checkpoint_dir}')
         print("--------------------------------")
 
         print("THE VIDEO WILL NOT BE PREVIEWED AND WILL BE SAVED INSTEAD")
-        generator = VideoAsciiGenerator(filename, font_size=font_size, gradient=ascii_gradient,
-                                        use_contrast=use_contrast, background_color=bg_color, foreground_color=fg_color,
-                                        invert_gradient=invert_gradient, video_end=vid_end, video_start=vid_start,
-                                        effect=effect)
-        generator.convert()
+        instrumentation = get_instrumentation(show_timings, timings_path, profile_path)
+        if checkpoint_dir is not None:
+            # converted in segments, the finished ones are kept and skipped when the same conversion is started again
+            settings = dict(font_size=font_size, gradient=ascii_gradient, use_contrast=use_contrast,
+                            background_color=bg_color, foreground_color=fg_color, invert_gradient=invert_gradient,
+                            effect=effect.value if effect is not None else None, incremental=incremental,
+                            cache_size=cache_size, match_shapes=match_shapes, prescale=prescale, luma=luma)
+            job = SegmentJob.resume(filename, checkpoint_dir, settings=settings, start=vid_start, end=vid_end)
+            done = len(job.get_status()["done"])
+            if done > 0:
+                print(f'Continuing, {done}/{len(job.segments)} segments were converted before')
+            directory = Helper.get_directory()
+            video_name = input("What do you want to name the video?\n")
+            # a single process works on the directory, so locks left by a crashed run are taken over right away
+            instrumentation.start()
+            job.work(workers=max(1, workers), stale_after=0, instrumentation=instrumentation)
+            job.join(f'{directory}/{video_name}.mp4')
+            instrumentation.stop()
+        else:
+            generator = VideoAsciiGenerator(filename, font_size=font_size, gradient=ascii_gradient,
+                                            use_contrast=use_contrast, background_color=bg_color,
+                                            foreground_color=fg_color, invert_gradient=invert_gradient,
+                                            video_end=vid_end, video_start=vid_start, effect=effect,
+                                            streaming=streaming, workers=max(1, workers), incremental=incremental,
+                                            cache_size=cache_size, instrumentation=instrumentation,
+                                            match_shapes=match_shapes, prescale=prescale, luma=luma)
+            generator.convert()
+        # the generator prints the timings itself
+        finish_instrumentation(instrumentation, False, timings_path, profile_path)
 
     elif mode == AppMode.CAM.value:
         font_size = get_argument("Font size | 8: ", 8, int)
@@ -116,6 +219,8 @@ def run_app(mode: int):
         str_fg_color = get_argument("Foreground color | (46, 126, 255): ", None, str)
         invert_gradient = get_argument("Invert gradient (y/n)? | False: ", False, bool)
         show_webcam = get_argument("Show webcam (y/n)? | False ", False, bool)
+        incremental = get_argument("Only redraw changed parts of images (y/n)? | False: ", False, bool)
+        pipelined = get_argument("Capture, convert and show images at the same time (y/n)? | False: ", False, bool)
 
         # some editing of values before putting it in the generator
         bg_color = extract_color(str_bg_color, (2, 0, 23))
@@ -128,16 +233,314 @@ def run_app(mode: int):
         print(f'Foreground color: {fg_color}')
         print(f'Invert gradient: {invert_gradient}')
         print(f'Show webcam: {show_webcam}')
+        print(f'Incremental: {incremental}')
+        print(f'Pipelined: {pipelined}')
         print("--------------------------------")
 
         print("PRESS 'Q' TO STOP THE CAMERA")
         generator = CamToAscii(gradient=ascii_gradient, foreground_color=fg_color, background_color=bg_color,
-                               font_size=font_size, show_webcam=show_webcam, invert_gradient=invert_gradient)
+                               font_size=font_size, show_webcam=show_webcam, invert_gradient=invert_gradient,
+                               incremental=incremental, pipelined=pipelined)
         generator.convert()
+    elif mode == AppMode.TERMINAL.value:
+        use_webcam = get_argument("Play the webcam instead of a video (y/n)? | False: ", False, bool)
+        filename = None if use_webcam else Helper.get_file()
+        terminal_width = get_argument("Terminal width | width of the terminal: ", None, int)
+        ascii_gradient = get_argument("Gradient | ' .-;+=xX$█': ", " .-;+=xX$█", str)
+        invert_gradient = get_argument("Invert gradient (y/n)? | False: ", False, bool)
+        color = get_argument("Color the text like the video (y/n)? | True: ", True, bool)
+        record = get_argument("Record into an asciicast file instead of playing (y/n)? | False: ", False, bool)
+
+        print("-----GENERATOR INFORMATION-----")
+        print(f'File: {filename if filename is not None else "webcam"}')
+        print(f'Terminal width: {terminal_width}')
+        print(f'Ascii gradient: "{ascii_gradient}"')
+        print(f'Invert gradient: {invert_gradient}')
+        print(f'Color: {color}')
+        print(f'Record: {record}')
+        print("--------------------------------")
+
+        if record:
+            directory = Helper.get_directory()
+            cast_name = input("What do you want to name the recording?\n")
+            input("PRESS CTRL+C TO STOP THE RECORDING, ENTER TO START")
+        else:
+            input("PRESS CTRL+C TO STOP THE PLAYBACK, ENTER TO START")
+        # the player keeps the pace of the video itself, so it can skip frames when the terminal is too slow
+        source = CameraSource(0) if use_webcam else VideoFileSource(filename, realtime=False)
+        fps = None if use_webcam else source.fps
+        player = TerminalPlayer(source, width=terminal_width, ascii_gradient=ascii_gradient, color=color,
+                                foreground_color=None if color else (46, 126, 255),
+                                invert_gradient=invert_gradient, fps=fps)
+        try:
+            if record:
+                stats = player.record(f'{directory}/{cast_name}.cast', title=cast_name)
+            else:
+                stats = player.play()
+        finally:
+            source.close()
+        if record:
+            print(f'Frames recorded: {stats["recorded"]} in {stats["seconds"]:.2f} seconds, {stats["fps"]:.1f} fps')
+            print(f'Recording size: {stats["bytes_written"]} bytes')
+        else:
+            print(f'Frames shown: {stats["shown"]}, skipped: {stats["skipped"]}, {stats["fps"]:.1f} fps')
+            print(f'Bytes written: {stats["bytes_written"]} (first frame {stats["first_frame_bytes"]}, '
+                  f'then {stats["mean_update_bytes"]:.0f} per frame)')
+    elif mode == AppMode.CELLS.value:
+        record = get_argument("Convert a video into a cell file (y) or draw a cell file into a video (n)? | n: ", False,
+                              bool)
+        filename = Helper.get_file()
+        if record:
+            font_size = get_argument("Cell size | 8: ", 8, int)
+            ascii_gradient = get_argument("Gradient | ' .-;+=xX$█': ", " .-;+=xX$█", str)
+            invert_gradient = get_argument("Invert gradient (y/n)? | False: ", False, bool)
+            vid_start = get_argument("Timestamp of video start | 0:00: ", None, float)
+            vid_end = get_argument("Timestamp of video end | end of the video: ", None, float)
+            match_shapes = get_argument("Pick characters by the shape of the video (y/n)? | False: ", False, bool)
+            show_timings, timings_path, profile_path = ask_instrumentation()
+
+            print("-----GENERATOR INFORMATION-----")
+            print(f'File: {filename}')
+            print(f'Cell size: {font_size}')
+            print(f'Ascii gradient: "{ascii_gradient}"')
+            print(f'Invert gradient: {invert_gradient}')
+            print(f'Video start cut: {vid_start}')
+            print(f'Video end cut: {vid_end}')
+            print(f'Match shapes: {match_shapes}')
+            print_instrumentation_settings(show_timings, timings_path, profile_path)
+            print("--------------------------------")
+
+            directory = Helper.get_directory()
+            name = input("What do you want to name the cell file?\n")
+            instrumentation = get_instrumentation(show_timings, timings_path, profile_path)
+            generator = VideoAsciiGenerator(filename, font_size=font_size, gradient=ascii_gradient,
+                                            invert_gradient=invert_gradient, video_start=vid_start, video_end=vid_end,
+                                            match_shapes=match_shapes, instrumentation=instrumentation)
+            generator.save_cells(f'{directory}/{name}.cells')
+            # the generator prints the timings itself
+            finish_instrumentation(instrumentation, False, timings_path, profile_path)
+        else:
+            font_size = get_argument("Font size | 8: ", 8, int)
+            ascii_gradient = get_argument("Gradient (same length as when converted) | from the file: ", None, str)
+            use_contrast = get_argument("Get higher contrast (y/n)? | False: ", False, bool)
+            str_bg_color = get_argument("Background color | (2, 0, 23): ", None, str)
+            str_fg_color = get_argument("Foreground color | (46, 126, 255): ", None, str)
+            invert_gradient = get_argument("Invert gradient (y/n)? | False: ", False, bool)
+            effect = get_argument("Effect (leave empty for no effect)? ", None, int)
+            show_timings, timings_path, profile_path = ask_instrumentation()
+
+            bg_color = extract_color(str_bg_color, (2, 0, 23))
+            fg_color = extract_color(str_fg_color, (46, 126, 255))
+            try:
+                effect = Effect(effect)
+            except ValueError:
+                effect = None
+
+            print("-----GENERATOR INFORMATION-----")
+            print(f'File: {filename}')
+            print(f'Font size: {font_size}')
+            print(f'Ascii gradient: {repr(ascii_gradient) if ascii_gradient is not None else "from the file"}')
+            print(f'Use contrast: {use_contrast}')
+            print(f'Background color: {bg_color}')
+            print(f'Foreground color: {fg_color}')
+            print(f'Invert gradient: {invert_gradient}')
+            print(f'Effect: {effect.value if effect is not None else None}')
+            print_instrumentation_settings(show_timings, timings_path, profile_path)
+            print("--------------------------------")
+
+            directory = Helper.get_directory()
+            video_name = input("What do you want to name the video?\n")
+            instrumentation = get_instrumentation(show_timings, timings_path, profile_path)
+            renderer = CellGridRenderer(filename, font_size=font_size, gradient=ascii_gradient,
+                                        use_contrast=use_contrast, background_color=bg_color, foreground_color=fg_color,
+                                        effect=effect, invert_gradient=invert_gradient, instrumentation=instrumentation)
+            renderer.convert(f'{directory}/{video_name}.mp4')
+            # the renderer prints the timings itself
+            finish_instrumentation(instrumentation, False, timings_path, profile_path)
     else:
         raise Exception("How did we get here!?")
 
 
+# default values of the batch mode, also the keys allowed in its config file
+batch_defaults = {"input": None, "output": None, "kind": "image", "workers": 1, "font_size": 8,
+                  "gradient": " .-;+=xX$█", "use_contrast": False, "background_color": "2, 0, 23",
+                  "foreground_color": "46, 126, 255", "invert_gradient": False, "effect": None, "backend": "atlas",
+                  "terminal_width": 220, "match_shapes": False, "timings_json": None, "profile": None}
+
+
+def get_batch_settings(args: argparse.Namespace) -> dict:
+    # settings are taken from the defaults, then the config file and then the flags given on the command line
+    settings = dict(batch_defaults)
+    if args.config is not None:
+        with open(args.config, encoding="utf-8") as file:
+            config = json.load(file)
+        unknown = set(config) - set(batch_defaults)
+        if unknown:
+            raise ValueError(f'Unknown keys in {args.config}: {sorted(unknown)}')
+        settings.update(config)
+    settings.update({key: value for key, value in vars(args).items() if key in batch_defaults and value is not None})
+    return settings
+
+
+def run_batch(args: argparse.Namespace):
+    settings = get_batch_settings(args)
+    if settings["input"] is None or settings["output"] is None:
+        raise ValueError("Batch mode needs --input and --output (or the same keys in the config file)")
+
+    files = BatchConverter.find_files(settings["input"])
+    if settings["kind"] == "cmd":
+        generator_settings = dict(terminal_width=settings["terminal_width"], ascii_gradient=settings["gradient"],
+                                  invert_gradient=settings["invert_gradient"])
+    else:
+        try:
+            effect = Effect(settings["effect"])
+        except ValueError:
+            effect = None
+        bg_color = extract_color(color_to_text(settings["background_color"]), (2, 0, 23))
+        fg_color = extract_color(color_to_text(settings["foreground_color"]), (46, 126, 255))
+        generator_settings = dict(font_size=settings["font_size"], ascii_gradient=settings["gradient"],
+                                  use_contrast=settings["use_contrast"], background_color=bg_color,
+                                  foreground_color=fg_color,
+                                  invert_gradient=settings["invert_gradient"], effect=effect,
+                                  backend=RenderBackend[settings["backend"].upper()],
+                                  match_shapes=settings["match_shapes"])
+
+    print("-----BATCH INFORMATION-----")
+    print(f'Input: {settings["input"]} ({len(files)} images)')
+    print(f'Output: {settings["output"]}')
+    print(f'Kind: {settings["kind"]}')
+    print(f'Workers: {settings["workers"]}')
+    for key, value in generator_settings.items():
+        print(f'{key}: {value}')
+    print_instrumentation_settings(False, settings["timings_json"], settings["profile"])
+    print("---------------------------")
+
+    instrumentation = get_instrumentation(False, settings["timings_json"], settings["profile"])
+    converter = BatchConverter(files, settings["output"], kind=settings["kind"], settings=generator_settings,
+                               workers=settings["workers"], instrumentation=instrumentation)
+    summary = converter.convert()
+
+    print("\n-----BATCH SUMMARY-----")
+    print(f'Converted: {summary["converted"]}/{len(files)} images in {summary["seconds"]:.2f} seconds')
+    print(f'Throughput: {summary["images_per_second"]:.2f} images/sec')
+    print(f'Bytes written: {summary["bytes_written"]}')
+    for path, error in summary["failed"]:
+        print(f'Failed: {path} ({error})')
+    print("-----------------------")
+    finish_instrumentation(instrumentation, instrumentation.enabled, settings["timings_json"], settings["profile"])
+
+
+def run_farm(args: argparse.Namespace):
+    # the steps of a segment job, every one of them can run on another machine pointed at the same job directory
+    if args.job is None:
+        raise ValueError("Farm mode needs --job, the directory of the job shared by all the workers")
+    settings = get_batch_settings(args)
+    step = args.step or "work"
+    if step == "plan":
+        if settings["input"] is None:
+            raise ValueError("Planning a job needs --input, the video to convert")
+        try:
+            effect = Effect(settings["effect"]).value
+        except ValueError:
+            effect = None
+        job_settings = dict(font_size=settings["font_size"], gradient=settings["gradient"],
+                            use_contrast=settings["use_contrast"],
+                            background_color=extract_color(color_to_text(settings["background_color"]), (2, 0, 23)),
+                            foreground_color=extract_color(color_to_text(settings["foreground_color"]), (46, 126, 255)),
+                            invert_gradient=settings["invert_gradient"], effect=effect, backend=settings["backend"],
+                            match_shapes=settings["match_shapes"])
+        job = SegmentJob.plan(settings["input"], args.job, segment_seconds=args.segment_seconds or 10,
+                              settings=job_settings)
+        print(f'Planned {len(job.segments)} segments of {job.manifest["source"]} in {args.job}')
+    elif step == "work":
+        job = SegmentJob(args.job)
+        instrumentation = get_instrumentation(False, settings["timings_json"], settings["profile"])
+        # one clock and profile around all the segments, the conversion of every segment prints the timings so far
+        instrumentation.start()
+        converted = job.work(workers=settings["workers"], stale_after=args.stale_after,
+                             instrumentation=instrumentation)
+        instrumentation.stop()
+        print(f'\nConverted segments: {converted}')
+        finish_instrumentation(instrumentation, False, settings["timings_json"], settings["profile"])
+    elif step == "status":
+        status = SegmentJob(args.job).get_status()
+        for state, indexes in status.items():
+            print(f'{state}: {len(indexes)} {indexes}')
+    elif step == "join":
+        if settings["output"] is None:
+            raise ValueError("Joining a job needs --output, the path of the video to write")
+        SegmentJob(args.job).join(settings["output"])
+        print(f'Joined video saved to {settings["output"]}')
+
+
+def run_serve(args: argparse.Namespace):
+    # the style options of the batch mode become the defaults of the requests
+    settings = get_batch_settings(args)
+    defaults = {key: settings[key] for key in ("kind",) + tuple(ConversionServer.setting_arguments)}
+    server = ConversionServer(host=args.host or "127.0.0.1", port=args.port if args.port is not None else 8000,
+                              workers=settings["workers"], defaults=defaults,
+                              batch_size=args.batch_size or 8,
+                              batch_wait=(args.batch_wait or 0) / 1000)
+
+    print("-----SERVICE INFORMATION-----")
+    print(f'Workers: {server.workers}')
+    print(f'Batch size: {server.batch_size}')
+    print(f'Batch wait: {server.batch_wait * 1000:g} ms')
+    for key, value in defaults.items():
+        print(f'{key}: {value}')
+    print("-----------------------------")
+    server.start()
+    host, port = server.address
+    print(f'Listening on http://{host}:{port} (POST /convert, GET /health), Ctrl+C to stop')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\nStopping the service")
+    finally:
+        server.stop()
+
+
+def ask_instrumentation() -> tuple:
+    # questions of the interactive modes about the timings, returns whether to show them and the files to write
+    show_timings = get_argument("Show time spent in every stage (y/n)? | False: ", False, bool)
+    timings_path = get_argument("JSON file to write the timings into | none: ", None, str)
+    profile_path = get_argument("File to write a cProfile of the conversion into (for pstats or snakeviz) | none: ",
+                                None, str)
+    return show_timings, timings_path, profile_path
+
+
+def print_instrumentation_settings(show_timings: bool, timings_path: str, profile_path: str):
+    print(f'Show timings: {show_timings}')
+    print(f'Timings file: {timings_path}')
+    print(f'Profile file: {profile_path}')
+
+
+def get_instrumentation(show_timings: bool, timings_path: str, profile_path: str) -> Instrumentation:
+    # timings are recorded when they are shown or written anywhere, cProfile only runs when its file is asked for
+    return Instrumentation(enabled=show_timings or timings_path is not None or profile_path is not None,
+                           profile=profile_path is not None)
+
+
+def finish_instrumentation(instrumentation: Instrumentation, show_timings: bool, timings_path: str, profile_path: str):
+    # prints the timings (unless the generator did already) and writes the files asked for
+    if show_timings:
+        instrumentation.print_summary()
+    if timings_path is not None:
+        instrumentation.export_json(timings_path)
+        print(f'Timings written to {timings_path}')
+    if profile_path is not None:
+        instrumentation.export_profile(profile_path)
+        print(f'Profile written to {profile_path}')
+
+
+def color_to_text(color) -> str:
+    # config files can give colors as [r, g, b] lists as well as "r, g, b" text
+    if isinstance(color, (list, tuple)):
+        return ", ".join(str(value) for value in color)
+    return color
+
+
 def extract_color(text: str, default: tuple) -> tuple:
     try:
         split = text.split(",", 2)
@@ -185,37 +588,94 @@ def get_argument(question: str, default_val, var_type):
             return default_val
 
 
-parser = argparse.ArgumentParser()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
 
-parser.add_argument("mode",
-                    help="str or int | Chooses which mode you want to use")
-args = parser.parse_args()
+    parser.add_argument("mode",
+                        help="str or int | Chooses which mode you want to use")
+    batch = parser.add_argument_group("batch mode", "options of the batch mode, which asks no questions")
+    batch.add_argument("--config", help="JSON file with any of the options below, flags override it")
+    batch.add_argument("--input", help="directory or glob pattern (quoted) of the images to convert")
+    batch.add_argument("--output", help="directory to write the converted images into")
+    batch.add_argument("--kind", choices=["image", "tiled", "html", "svg", "cmd"],
+                       help="image (PNG), tiled (PNG converted in strips, for huge images), html, svg or cmd (text) "
+                            "output | image")
+    batch.add_argument("--workers", type=int, help="amount of processes converting the images | 1")
+    batch.add_argument("--font-size", dest="font_size", type=int, help="font size | 8")
+    batch.add_argument("--gradient", help="brightness gradient | ' .-;+=xX$█'")
+    batch.add_argument("--contrast", dest="use_contrast", action="store_const", const=True,
+                       help="get higher contrast")
+    batch.add_argument("--background", dest="background_color", help="background color | '2, 0, 23'")
+    batch.add_argument("--foreground", dest="foreground_color", help="foreground color | '46, 126, 255'")
+    batch.add_argument("--invert", dest="invert_gradient", action="store_const", const=True,
+                       help="invert the gradient")
+    batch.add_argument("--effect", type=int, help="number of the effect | no effect")
+    batch.add_argument("--backend", choices=["atlas", "draw"], help="how the text is drawn | atlas")
+    batch.add_argument("--shapes", dest="match_shapes", action="store_const", const=True,
+                       help="pick the characters by the shape of the image")
+    batch.add_argument("--terminal-width", dest="terminal_width", type=int, help="width of cmd output | 220")
+    batch.add_argument("--timings-json", dest="timings_json", metavar="PATH",
+                       help="JSON file to write the time of every image and stage into, also in farm mode | none")
+    batch.add_argument("--profile", metavar="PATH",
+                       help="file to write a cProfile of the main process into (converting happens there with "
+                            "--workers 1), also in farm mode | none")
+    farm = parser.add_argument_group("farm mode", "converts a video in segments shared by many workers, uses --input "
+                                                  "(video), --output (joined video), --workers and the style options "
+                                                  "of the batch mode")
+    farm.add_argument("--step", choices=["plan", "work", "status", "join"], help="step of the job to run | work")
+    farm.add_argument("--job", help="directory of the job, shared by all the workers")
+    farm.add_argument("--segment-seconds", dest="segment_seconds", type=float, help="length of a segment | 10")
+    farm.add_argument("--stale-after", dest="stale_after", type=float,
+                      help="seconds after which a claimed unfinished segment is taken over | never")
+    serve = parser.add_argument_group("serve mode", "converts images sent over HTTP, uses --workers and the options of "
+                                                    "the batch mode as the defaults of the requests")
+    serve.add_argument("--host", help="address to listen on | 127.0.0.1")
+    serve.add_argument("--port", type=int, help="port to listen on | 8000")
+    serve.add_argument("--batch-size", dest="batch_size", type=int,
+                       help="most requests a worker converts in one go | 8")
+    serve.add_argument("--batch-wait", dest="batch_wait", type=float,
+                       help="milliseconds a free worker waits for more requests to batch | 0")
+    args = parser.parse_args()
 
-modes = {"cmd": AppMode.CMD.value, "image": AppMode.IMAGE.value, "video": AppMode.VIDEO.value, "cam": AppMode.CAM.value}
+    modes = {"cmd": AppMode.CMD.value, "image": AppMode.IMAGE.value, "video": AppMode.VIDEO.value,
+             "cam": AppMode.CAM.value, "batch": AppMode.BATCH.value, "terminal": AppMode.TERMINAL.value,
+             "cells": AppMode.CELLS.value, "farm": AppMode.FARM.value,
+             "serve": AppMode.SERVE.value}
 
-if not args.mode.isnumeric():
-    try:
-        num = modes[args.mode.lower()]
-        passed = True
-    except KeyError:
-        passed = False
-else:
-    num = int(args.mode)
-    if num < 0 or num > 3:
-        passed = False
+    if not args.mode.isnumeric():
+        try:
+            num = modes[args.mode.lower()]
+            passed = True
+        except KeyError:
+            passed = False
+    else:
+        num = int(args.mode)
+        if num < 0 or num > 8:
+            passed = False
+        else:
+            passed = True
+
+    if passed and num == AppMode.BATCH.value:
+        run_batch(args)
+    elif passed and num == AppMode.FARM.value:
+        run_farm(args)
+    elif passed and num == AppMode.SERVE.value:
+        run_serve(args)
+    elif passed:
+        run_app(num)
     else:
-        passed = True
-
-if passed:
-    run_app(num)
-else:
-    red_text = "\x1b[31m"
-    reset = "\x1b[0m"
-    print(f'{red_text}Warning: Incorrect argument usage{reset}')
-    print("usage: main.py [-h] mode")
-    print("\n-----MODES-----")
-    print("CMD: 0")
-    print("Image: 1")
-    print("Video: 2")
-    print("Cam: 3")
-    print("----------------")
+        red_text = "\x1b[31m"
+        reset = "\x1b[0m"
+        print(f'{red_text}Warning: Incorrect argument usage{reset}')
+        print("usage: main.py [-h] mode")
+        print("\n-----MODES-----")
+        print("CMD: 0")
+        print("Image: 1")
+        print("Video: 2")
+        print("Cam: 3")
+        print("Batch: 4")
+        print("Terminal: 5")
+        print("Cells: 6")
+        print("Farm: 7")
+        print("Serve: 8")
+        print("----------------")